@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# Times the gadget search for every test-binaries/ls-* binary.
+#
+# usage: python benchmark.py [rounds] [instruction count]
+import glob
+import sys
+import time
+
+from ropper.loaders.loader import Loader
+from ropper.rop import Ropper
+from ropper.gadget import GadgetType
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+instruction_count = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+
+print('%-20s %-10s %8s %10s %10s' % ('file', 'arch', 'gadgets', 'best [s]', 'gadgets/s'))
+for fileName in sorted(glob.glob('test-binaries/ls-*')):
+    binary = Loader.open(fileName)
+    best = None
+    for _ in range(rounds):
+        ropper = Ropper()
+        start = time.time()
+        gadgets = ropper.searchGadgets(binary, instruction_count, GadgetType.ALL)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    print('%-20s %-10s %8d %10.3f %10d' % (fileName.split('/')[-1], binary.arch, len(gadgets), best, len(gadgets) / best))
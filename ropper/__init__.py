@@ -36,9 +36,9 @@ from ropper.loaders import pe
 from ropper.loaders import mach_o
 from ropper.loaders import raw
 from ropper.loaders.loader import Loader, Type
-from ropper.gadget import Gadget, GadgetType
+from ropper.gadget import Gadget, GadgetType, GadgetOrder
 from ropper.service import RopperService, filterBadBytes
-from ropper.service import deleteDuplicates, cfgFilterGadgets
+from ropper.service import deleteDuplicates, findDuplicates, cfgFilterGadgets
 from ropper.arch import ARM,ARM64, ARMTHUMB,  x86, x86_64, PPC, PPC64, MIPS, MIPS64, MIPSBE, MIPS64BE, ARMBE
 import traceback
 app_options = None
@@ -30,7 +30,7 @@ from ropper.common.abstract import *
 from ropper.common.enum import Enum
 from ropper.common.error import NotSupportedError
 from ropper.search import Searcher, Searcherx86, SearcherARM, SearcherMIPS
-from re import compile
+from re import compile, error
 from capstone import *
 from . import gadget
 try:
@@ -57,6 +57,94 @@ def byte_regexp(bitmask, bitvalues):
 class Endianess(Enum):
     _enum_ = 'LITTLE BIG'
 
+
+def prefix_bytes(pattern):
+    """
+    returns a frozenset of the first bytes (as bytes of length one) a match of pattern can start with
+    or None if this cannot be told from the first item of the pattern
+    """
+    if pattern[:1] == b'[':
+        index = 2
+        while index < len(pattern) and pattern[index:index + 1] != b']':
+            index += 2 if pattern[index:index + 1] == b'\\' else 1
+        index += 1
+    elif pattern[:1] == b'\\':
+        index = 2
+    elif pattern[:1] and pattern[:1] not in b'().^$|?*+{':
+        index = 1
+    else:
+        return None
+
+    if b'|' in pattern or pattern[index:index + 1] in (b'?', b'*', b'{'):
+        return None
+
+    try:
+        item = compile(pattern[:index])
+    except error:
+        return None
+    return frozenset([bytes(bytearray([value])) for value in range(256) if item.match(bytes(bytearray([value])))])
+
+
+class EndingScanner(object):
+    """
+    Searches all endings of a gadget type with one compiled pattern.
+    The code is walked once using absolute offsets.
+    """
+
+    def __init__(self, endings, align):
+        self.__endings = endings
+        self.__align = align
+        self.__patterns = [compile(pattern) for pattern, size in endings]
+        self.__matchers = []
+        for pattern, (source, size) in zip(self.__patterns, endings):
+            prefixes = prefix_bytes(source)
+            if prefixes is None:
+                prefixes = frozenset([bytes(bytearray([value])) for value in range(256)])
+            self.__matchers.append((pattern.match, prefixes, size))
+        self.__combined = None
+        if endings:
+            self.__combined = compile(b'|'.join([b'(?:' + pattern + b')' for pattern, size in endings]))
+
+    @property
+    def endings(self):
+        return self.__endings
+
+    def matcher(self, ending_index):
+        """
+        returns (match, prefixes, size) of an ending
+        match is the match method of the compiled pattern, prefixes the frozenset of bytes the pattern can start with.
+        Checking code[index:index + 1] in prefixes first is much cheaper than calling match for every instruction.
+        """
+        return self.__matchers[ending_index]
+
+    def scan(self, code, start=0, end=None):
+        """
+        yields (index, ending_index, bound) for every aligned index in code[start:end] an ending matches at
+        bound is the lowest index a gadget using this ending can start at. It is the index behind the
+        previous match of the same ending.
+        """
+        if self.__combined is None:
+            return
+        if end is None:
+            end = len(code)
+        align = self.__align
+        search = self.__combined.search
+        patterns = list(enumerate(self.__patterns))
+        bounds = [start] * len(patterns)
+
+        match = search(code, start)
+        while match:
+            index = match.start()
+            if index >= end:
+                break
+            for ending_index, pattern in patterns:
+                if pattern.match(code, index):
+                    if index % align == 0:
+                        yield index, ending_index, bounds[ending_index]
+                    bounds[ending_index] = index + align
+            match = search(code, index + 1)
+
+
 class Architecture(AbstractSingleton):
 
     def __init__(self, arch, mode, addressLength, align, endianess=Endianess.LITTLE, branch_delay_slot=False):
@@ -70,9 +158,12 @@ class Architecture(AbstractSingleton):
 
         self._addressLength = addressLength
         self._align = align
+        self._maxInstructionLength = 4
 
         self._endings = {}
+        self._endingScanners = {}
         self._badInstructions = []
+        self._badInstructionSet = None
         self._categories = {}
         self._maxInvalid = 1
 
@@ -86,6 +177,7 @@ class Architecture(AbstractSingleton):
 
         self._initEndianess(endianess)
         self._hasBranchDelaySlot = branch_delay_slot
+        self._hasITBlocks = False
 
         self._endings[gadget.GadgetType.ALL] = self._endings[
             gadget.GadgetType.ROP] + self._endings[gadget.GadgetType.JOP] + self._endings[gadget.GadgetType.SYS]
@@ -130,6 +222,10 @@ class Architecture(AbstractSingleton):
     def mode(self):
         return self._mode
 
+    @property
+    def maxInstructionLength(self):
+        return self._maxInstructionLength
+
     @property
     def addressLength(self):
         return self._addressLength
@@ -138,10 +234,26 @@ class Architecture(AbstractSingleton):
     def endings(self):
         return self._endings
 
+    def endingScanner(self, gtype):
+        scanner = self._endingScanners.get(gtype)
+        if scanner is None:
+            scanner = EndingScanner(self.endings[gtype], self.align)
+            self._endingScanners[gtype] = scanner
+        return scanner
+
     @property
     def badInstructions(self):
         return self._badInstructions
 
+    @property
+    def badInstructionSet(self):
+        """
+        frozenset of the bad instructions for fast membership tests
+        """
+        if self._badInstructionSet is None or len(self._badInstructionSet) != len(set(self._badInstructions)):
+            self._badInstructionSet = frozenset(self._badInstructions)
+        return self._badInstructionSet
+
     @property
     def searcher(self):
         return self._searcher
@@ -158,6 +270,10 @@ class Architecture(AbstractSingleton):
     def hasBranchDelaySlot(self):
         return self._hasBranchDelaySlot
 
+    @property
+    def hasITBlocks(self):
+        return self._hasITBlocks
+
     def getRegisterName(self, reg):
         if self.info is None:
             return reg
@@ -179,6 +295,7 @@ class ArchitectureX86(Architecture):
         super(ArchitectureX86, self).__init__( CS_ARCH_X86, CS_MODE_32, 4, 1)
         self._name = 'x86'
         self._maxInvalid = 6
+        self._maxInstructionLength = 15
         if 'keystone' in globals():
             self._ksarch = (keystone.KS_ARCH_X86, keystone.KS_MODE_32)
 
@@ -418,6 +535,7 @@ class ArchitectureArmThumb(Architecture):
         self._searcher = SearcherARM()
         self._name = 'ARMTHUMB'
         self._maxInvalid = 2
+        self._hasITBlocks = True
 
         if 'archinfo' in globals():
             self._info = archinfo.ArchARM()
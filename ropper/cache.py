@@ -0,0 +1,874 @@
+# coding=utf-8
+# Copyright 2018 Sascha Schirra
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" A ND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Binary gadget cache
+
+A cache file is a header, a directory of blocks and the blocks:
+
+    header      magic, format version, flags, number of blocks
+    directory   tag, offset, size and crc32 of every block
+    META        number of gadgets and sections, file checksum, architecture and gadget order
+    SECT        address, code offset, code size and name of every section
+    CODE        the code of all sections
+    COL0..COL7  one little endian array per column of GadgetTable.COLUMNS
+    TEXT        the instruction strings of the gadgets separated by NUL bytes
+    SEMA        optional, the semantic information of analysed gadgets
+    SHAD        optional, the records the merge of the endings dropped, which GadgetTable.narrow needs
+
+The file is mapped with mmap and every block is read with struct or copied into an array at once,
+nothing is evaluated. The gadgets are created when they are accessed.
+
+A PageCache keeps the gadget records of single code pages by the hash of their content, so a new build of a binary
+only has to be searched where its code changed.
+
+Several processes can share a cache folder. Files are written to a temporary file and renamed when they are complete,
+so a reader sees the old or the new file but never a partial one, and readers check the crc32 of every block.
+A CacheLock lets one process compute the gadgets of a cache file while the others wait for it.
+
+A CacheIndex keeps the size, the last access and the search time of every cache file in the file index. It removes the least
+recently used cache files and pages if the folder grows bigger than a budget and collects the statistics of the cache.
+
+A SemanticCache keeps the semantic information of gadgets in an append-only file, which all binaries share. Gadgets with the
+same bytes are analysed once, no matter in how many binaries they are found.
+"""
+from ropper.common.error import CacheError
+from ropper.gadget import GadgetTable
+from ropper.arch import getArchitecture
+from ropper.semantic import SemanticInformation
+from array import array
+import marshal
+import mmap
+import struct
+import sys
+import os
+import tempfile
+import time
+import json
+import zlib
+import re
+import capstone
+from hashlib import sha256
+
+# Optional locking support, one of them is available on every platform
+try:
+    import fcntl
+except:
+    pass
+
+try:
+    import msvcrt
+except:
+    pass
+
+MAGIC = b'RPRCACHE'
+VERSION = 3
+
+FLAG_LAZY = 1
+
+HEADER = struct.Struct('<8sHHI')
+BLOCK = struct.Struct('<4sQQI')
+META = struct.Struct('<II64s16s16s')
+SECTION = struct.Struct('<QQQH')
+SEMANTIC = struct.Struct('<II')
+
+PAGE_MAGIC = b'RPRPAGE\0'
+PAGE_HEADER = struct.Struct('<8sHHI')
+
+SEMANTIC_MAGIC = b'RPRSEMA\0'
+SEMANTIC_HEADER = struct.Struct('<8sHH')
+SEMANTIC_RECORD = struct.Struct('<32sII')
+
+
+def _crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+def _publish(fileName, chunks):
+    """
+    writes chunks to a temporary file next to fileName and renames it to fileName when it is written completely
+    """
+    fd, temp = tempfile.mkstemp(prefix='.%s.' % os.path.basename(fileName), suffix='.tmp', dir=os.path.dirname(fileName) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if hasattr(os, 'replace'):
+            os.replace(temp, fileName)
+        else:
+            os.rename(temp, fileName)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+class CacheLock(object):
+    """
+    Exclusive lock of a cache file between processes, which is held while the lock file fileName.lock is locked.
+    A lock of a process which dies is released by the operating system.
+    The holder of a lock can remove the lock file with remove. A process which locked the removed file
+    while it waited notices it and locks the new lock file, so two processes never hold different lock files.
+    """
+
+    def __init__(self, fileName):
+        self.__fileName = fileName + '.lock'
+        self.__file = None
+
+    @property
+    def locked(self):
+        return self.__file is not None
+
+    def acquire(self, blocking=True):
+        """
+        waits until no other process holds the lock and locks it
+        Without blocking it returns False at once if another process holds the lock.
+        returns True if the lock is held
+        """
+        if self.__file is not None:
+            return True
+        folder = os.path.dirname(self.__fileName)
+        if folder and not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        while True:
+            f = open(self.__fileName, 'a+b')
+            try:
+                if 'fcntl' in globals():
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                elif 'msvcrt' in globals():
+                    while True:
+                        try:
+                            f.seek(0)
+                            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                            break
+                        except (IOError, OSError):
+                            # LK_LOCK gives up after 10 seconds
+                            if not blocking:
+                                raise
+            except (IOError, OSError):
+                f.close()
+                if blocking:
+                    raise
+                return False
+            except BaseException:
+                f.close()
+                raise
+            self.__file = f
+            try:
+                stat = os.stat(self.__fileName)
+                current = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) == (current.st_dev, current.st_ino):
+                    return True
+            except OSError:
+                pass
+            # the lock file was removed by the process which held it
+            self.release()
+
+    def remove(self):
+        """
+        removes the lock file and releases the lock, the lock has to be held
+        """
+        try:
+            os.remove(self.__fileName)
+        except OSError:
+            # an open file cannot be removed on windows
+            pass
+        self.release()
+
+    def release(self):
+        if self.__file is None:
+            return
+        try:
+            if 'fcntl' in globals():
+                fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+            elif 'msvcrt' in globals():
+                self.__file.seek(0)
+                msvcrt.locking(self.__file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.__file.close()
+            self.__file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def _columnTag(index):
+    return ('COL%d' % index).encode('ascii')
+
+
+def _packColumn(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _unpackColumn(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _dumpSemanticInformation(info):
+    """
+    returns the marshalled fields of info or None if they cannot be stored
+    """
+    try:
+        return marshal.dumps((info.regs, info.usedRegs, info.clobberedRegisters, info.mems, info.expressions, info.spOffset, info.checkedConstraints, info.irsb))
+    except ValueError:
+        # information which cannot be stored is analysed again after loading
+        return None
+
+
+def _packSemanticInformation(infos):
+    data = bytearray(struct.pack('<I', 0))
+    count = 0
+    for row, info in sorted(infos.items()):
+        if not isinstance(info, SemanticInformation):
+            continue
+        packed = _dumpSemanticInformation(info)
+        if packed is None:
+            continue
+        data += SEMANTIC.pack(row, len(packed))
+        data += packed
+        count += 1
+    struct.pack_into('<I', data, 0, count)
+    return bytes(data)
+
+
+def _unpackSemanticInformation(data):
+    infos = {}
+    offset = 4
+    for i in range(struct.unpack_from('<I', data, 0)[0]):
+        row, size = SEMANTIC.unpack_from(data, offset)
+        offset += SEMANTIC.size
+        infos[row] = SemanticInformation(*marshal.loads(data[offset:offset + size]))
+        offset += size
+    return infos
+
+
+def saveTable(fileName, table, order='', semantic=True):
+    """
+    writes the gadgets of a GadgetTable or of a view of it to fileName
+    order is the name of the order of the gadgets, loadTable returns it unchanged
+    The semantic information of the gadgets is only written if semantic is True.
+    """
+    sections, columns, texts, infos, shadowed = table._export()
+
+    blocks = []
+    meta = META.pack(len(columns['address']), len(sections), table.fileName.encode('ascii'), str(table.arch).encode('ascii'), str(order).encode('ascii'))
+    blocks.append((b'META', meta))
+
+    section_table = bytearray()
+    code_offset = 0
+    for name, address, code in sections:
+        name = name.encode('utf-8')
+        section_table += SECTION.pack(address, code_offset, len(code), len(name))
+        section_table += name
+        code_offset += len(code)
+    blocks.append((b'SECT', bytes(section_table)))
+    blocks.append((b'CODE', b''.join([bytes(code) for name, address, code in sections])))
+
+    for index, (name, typecode) in enumerate(GadgetTable.COLUMNS):
+        blocks.append((_columnTag(index), _packColumn(columns[name])))
+    blocks.append((b'TEXT', '\0'.join(texts).encode('utf-8')))
+    if infos and semantic:
+        blocks.append((b'SEMA', _packSemanticInformation(infos)))
+    if shadowed is not None:
+        blocks.append((b'SHAD', _packColumn(shadowed)))
+
+    offset = HEADER.size + BLOCK.size * len(blocks)
+    chunks = [HEADER.pack(MAGIC, VERSION, FLAG_LAZY if table.lazy else 0, len(blocks))]
+    for tag, data in blocks:
+        chunks.append(BLOCK.pack(tag, offset, len(data), _crc(data)))
+        offset += len(data)
+    chunks.extend([data for tag, data in blocks])
+
+    _publish(fileName, chunks)
+
+
+def loadTable(fileName, decoderFactory, semantic=True):
+    """
+    returns (table, order) of a cache file written by saveTable
+    decoderFactory(arch, code, address) has to return a decoder of a section, e.g. Ropper.createDecoder.
+    The semantic information is only read if semantic is True.
+    Raises CacheError if the file is not a cache file of this version or if it is damaged.
+    """
+    with open(fileName, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise CacheError('Invalid cache file: %s' % fileName)
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, flags, block_count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise CacheError('Invalid cache file: %s' % fileName)
+        if version != VERSION:
+            raise CacheError('Unsupported cache version %d: %s' % (version, fileName))
+
+        blocks = {}
+        for i in range(block_count):
+            tag, offset, size, crc = BLOCK.unpack_from(data, HEADER.size + i * BLOCK.size)
+            if offset + size > len(data):
+                raise CacheError('Truncated cache file: %s' % fileName)
+            blocks[tag] = (offset, size, crc)
+
+        def block(tag):
+            if tag not in blocks:
+                raise CacheError('Missing block %s in cache file: %s' % (tag.decode('ascii'), fileName))
+            offset, size, crc = blocks[tag]
+            content = data[offset:offset + size]
+            if _crc(content) != crc:
+                raise CacheError('Damaged block %s in cache file: %s' % (tag.decode('ascii'), fileName))
+            return content
+
+        row_count, section_count, checksum, arch, order = META.unpack(block(b'META'))
+        checksum = checksum.rstrip(b'\0').decode('ascii')
+        arch = getArchitecture(arch.rstrip(b'\0').decode('ascii'))
+        order = order.rstrip(b'\0').decode('ascii')
+
+        code = block(b'CODE')
+        section_table = block(b'SECT')
+        sections = []
+        offset = 0
+        for i in range(section_count):
+            address, code_offset, code_size, name_size = SECTION.unpack_from(section_table, offset)
+            offset += SECTION.size
+            name = section_table[offset:offset + name_size].decode('utf-8')
+            offset += name_size
+            sections.append((name, decoderFactory(arch, code[code_offset:code_offset + code_size], address)))
+
+        columns = {}
+        for index, (name, typecode) in enumerate(GadgetTable.COLUMNS):
+            columns[name] = _unpackColumn(typecode, block(_columnTag(index)))
+            if len(columns[name]) != row_count:
+                raise CacheError('Invalid column %s in cache file: %s' % (name, fileName))
+
+        texts = block(b'TEXT').decode('utf-8')
+        texts = texts.split('\0') if texts else []
+        infos = None
+        if semantic and b'SEMA' in blocks:
+            infos = _unpackSemanticInformation(block(b'SEMA'))
+        shadowed = None
+        if b'SHAD' in blocks:
+            shadowed = _unpackColumn('I', block(b'SHAD'))
+    finally:
+        data.close()
+
+    return GadgetTable._fromColumns(checksum, arch, bool(flags & FLAG_LAZY), sections, columns, texts, infos, shadowed), order
+
+
+class PageCache(object):
+    """
+    Keeps the gadget records of code pages in files named by a hash of the bytes the records depend on.
+    The records are stored relative to the start of these bytes, so a page is found again at another offset, too.
+    """
+
+    VERSION = 2
+
+    def __init__(self, folder):
+        self.__folder = folder
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def folder(self):
+        return self.__folder
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    def key(self, arch, gtype, instruction_count, window, start, end):
+        """
+        returns the key of the page window[start:end]
+        window contains the page and the bytes around it which are needed to search it
+        """
+        m = sha256()
+        m.update(('%d_%s_%s_%d_%d_%d_%d_' % (PageCache.VERSION, arch, gtype, instruction_count, start, end, len(window))).encode('ascii'))
+        m.update(window)
+        return m.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.__folder, key[:2], key)
+
+    def get(self, key, base):
+        """
+        returns the records per ending of the page with key, moved to base, or None if the page is not cached
+        """
+        try:
+            with open(self.__path(key), 'rb') as f:
+                data = f.read()
+            magic, version, ending_count, crc = PAGE_HEADER.unpack_from(data, 0)
+            if magic != PAGE_MAGIC or version != PageCache.VERSION or _crc(data[PAGE_HEADER.size:]) != crc:
+                raise CacheError('Invalid page cache file: %s' % key)
+
+            offset = PAGE_HEADER.size
+            sizes = struct.unpack_from('<%dI' % ending_count, data, offset)
+            offset += 4 * ending_count
+            found = []
+            for size in sizes:
+                records = _unpackColumn('I', data[offset:offset + size * 4])
+                offset += size * 4
+                for i in range(0, len(records), 3):
+                    records[i] += base
+                found.append(records)
+        except (IOError, OSError, struct.error, CacheError):
+            self.__misses += 1
+            return None
+
+        # the modification time of a page is its last access, see CacheIndex.trim
+        try:
+            os.utime(self.__path(key), None)
+        except OSError:
+            pass
+        self.__hits += 1
+        return found
+
+    def put(self, key, found, base):
+        """
+        stores the records per ending of the page with key relative to base
+        """
+        data = bytearray(struct.pack('<%dI' % len(found), *[len(records) for records in found]))
+        for records in found:
+            records = array('I', records)
+            for i in range(0, len(records), 3):
+                records[i] -= base
+            data += _packColumn(records)
+
+        # several processes can compute the same page, they write the same content
+        path = self.__path(key)
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            _publish(path, [PAGE_HEADER.pack(PAGE_MAGIC, PageCache.VERSION, len(found), _crc(data)), data])
+        except (IOError, OSError):
+            pass
+
+
+class CacheIndex(object):
+    """
+    Keeps the size, the last access and the search time of the cache files of a folder in the file index
+    and the hits, misses and the time saved by the cache.
+    The index is changed under a CacheLock, so several processes can use it.
+    """
+
+    FILE_NAME = 'index'
+
+    def __init__(self, folder, budget=0):
+        """
+        budget is the maximum size of the folder in bytes, 0 means no limit
+        """
+        self.__folder = folder
+        self.__budget = budget
+        self.__fileName = os.path.join(folder, CacheIndex.FILE_NAME)
+
+    @property
+    def budget(self):
+        return self.__budget
+
+    @budget.setter
+    def budget(self, budget):
+        self.__budget = budget
+
+    def __read(self):
+        try:
+            with open(self.__fileName, 'rb') as f:
+                index = json.loads(f.read().decode('utf-8'))
+            if isinstance(index, dict) and isinstance(index.get('entries'), dict):
+                return index
+        except (IOError, OSError, ValueError):
+            pass
+        return {'entries': {}, 'hits': 0, 'misses': 0, 'saved': 0.0}
+
+    def __update(self, change):
+        if not os.path.exists(self.__folder):
+            return
+        with CacheLock(self.__fileName):
+            index = self.__read()
+            change(index)
+            _publish(self.__fileName, [json.dumps(index, sort_keys=True).encode('utf-8')])
+
+    def hit(self, name, loadTime):
+        """
+        counts a cache hit of the cache file name, which was loaded in loadTime seconds
+        """
+        def change(index):
+            entry = index['entries'].get(name)
+            index['hits'] += 1
+            if entry is not None:
+                entry['atime'] = time.time()
+                entry['hits'] += 1
+                index['saved'] += max(0.0, entry['search_time'] - loadTime)
+
+        self.__update(change)
+
+    def add(self, name, searchTime=None):
+        """
+        adds or updates the cache file name
+        searchTime is the time the gadgets were searched in, which is saved by every hit. If it is given, a miss is counted.
+        """
+        try:
+            size = os.path.getsize(os.path.join(self.__folder, name))
+        except OSError:
+            return
+
+        def change(index):
+            entry = index['entries'].setdefault(name, {'hits': 0, 'search_time': 0.0})
+            entry['size'] = size
+            entry['atime'] = time.time()
+            if searchTime is not None:
+                entry['search_time'] = searchTime
+                index['misses'] += 1
+
+        self.__update(change)
+
+    def __pages(self):
+        pages = []
+        for folder, names, files in os.walk(os.path.join(self.__folder, 'pages')):
+            for name in files:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                pages.append((stat.st_mtime, stat.st_size, path))
+        return pages
+
+    def __removeLock(self, fileName):
+        """
+        removes the lock file of fileName unless another process holds it
+        """
+        if not os.path.exists(fileName + '.lock'):
+            return
+        lock = CacheLock(fileName)
+        if lock.acquire(False):
+            lock.remove()
+
+    def __semantic(self):
+        path = os.path.join(self.__folder, SemanticCache.FILE_NAME)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        return [(stat.st_mtime, stat.st_size, path)]
+
+    def trim(self, budget=None, keep=None):
+        """
+        removes the least recently used cache files and pages until the folder is not bigger than budget
+        The semantic cache is removed as a whole, it is as old as its last change.
+        budget defaults to the budget of the index, nothing is removed then if the index has no limit.
+        A budget of 0 removes everything but the cache file keep, which is never removed.
+        returns the number of removed bytes
+        """
+        removed = [0]
+        if budget is None:
+            budget = self.__budget
+            if not budget:
+                return 0
+
+        def change(index):
+            files = []
+            for name, entry in list(index['entries'].items()):
+                try:
+                    entry['size'] = os.path.getsize(os.path.join(self.__folder, name))
+                except OSError:
+                    del index['entries'][name]
+                    continue
+                if name != keep:
+                    files.append((entry['atime'], entry['size'], name))
+            files.extend(self.__pages())
+            files.extend(self.__semantic())
+
+            size = sum([file[1] for file in files]) + (index['entries'][keep]['size'] if keep in index['entries'] else 0)
+            for atime, file_size, name in sorted(files):
+                if size <= budget:
+                    break
+                try:
+                    os.remove(os.path.join(self.__folder, name))
+                except OSError:
+                    continue
+                index['entries'].pop(name, None)
+                self.__removeLock(os.path.join(self.__folder, name))
+                size -= file_size
+                removed[0] += file_size
+
+            # lock files of cache files which were removed by other means
+            for name in os.listdir(self.__folder):
+                if name.endswith('.lock') and name != CacheIndex.FILE_NAME + '.lock' and not os.path.exists(os.path.join(self.__folder, name[:-5])):
+                    self.__removeLock(os.path.join(self.__folder, name[:-5]))
+
+        self.__update(change)
+        return removed[0]
+
+    def stats(self):
+        """
+        returns a dict with the number and size of cache files and pages, the size of the semantic cache, the total size,
+        the budget, hits, misses, hit rate and time saved
+        """
+        index = self.__read()
+        sizes = []
+        for name, entry in index['entries'].items():
+            try:
+                sizes.append(os.path.getsize(os.path.join(self.__folder, name)))
+            except OSError:
+                pass
+        pages = self.__pages()
+        semantic = sum([file[1] for file in self.__semantic()])
+        lookups = index['hits'] + index['misses']
+        return {'entries' : len(sizes),
+                'size' : sum(sizes),
+                'bytes_per_entry' : sum(sizes) // len(sizes) if sizes else 0,
+                'pages' : len(pages),
+                'pages_size' : sum([page[1] for page in pages]),
+                'semantic_size' : semantic,
+                'total_size' : sum(sizes) + sum([page[1] for page in pages]) + semantic,
+                'budget' : self.__budget,
+                'hits' : index['hits'],
+                'misses' : index['misses'],
+                'hit_rate' : float(index['hits']) / lookups if lookups else 0.0,
+                'time_saved' : index['saved']}
+
+
+class SemanticCache(object):
+    """
+    Keeps the SemanticInformation of gadgets in an append-only file of (key, size, crc32, marshalled fields) records.
+    The key is a hash of the architecture, the gadget bytes and the normalisation of the gadget: it is empty if the
+    semantic of the bytes does not depend on the address, otherwise it is the address. A failed analysis is stored as None.
+    A later record of a key replaces the earlier ones. flush appends the new information and the information whose
+    checked constraints changed since it was written. If most records are replaced, the file is compacted.
+    """
+
+    VERSION = 2
+
+    # name of the file in the cache folder
+    FILE_NAME = 'semantic'
+
+    # the file is compacted if it is bigger than this and contains more replaced than current records
+    COMPACT_SIZE = 0x100000
+
+    # operands which read the program counter, register lists like pop {r4, pc} only write it
+    PC_OPERAND = re.compile(r'\b(rip|eip|pc)\b')
+    REGISTER_LIST = re.compile(r'\{[^}]*\}')
+
+    # the gadget is disassembled at address + SHIFT to find operands whose text depends on the address
+    SHIFT = 0x10000
+
+    def __init__(self, fileName):
+        self.__fileName = fileName
+        self.__records = None
+        self.__size = 0
+        self.__count = 0
+        self.__file = None
+        self.__infos = {}
+        self.__written = {}
+        self.__cs = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @staticmethod
+    def pack(info):
+        """
+        returns the marshalled fields of a SemanticInformation or of None, which stands for a failed analysis
+        returns None if info cannot be stored
+        """
+        if info is None:
+            return marshal.dumps(None)
+        if not isinstance(info, SemanticInformation):
+            return None
+        return _dumpSemanticInformation(info)
+
+    @staticmethod
+    def unpack(data):
+        """
+        returns the SemanticInformation or None of data returned by pack
+        """
+        fields = marshal.loads(data)
+        return SemanticInformation(*fields) if fields is not None else None
+
+    def __disassembler(self, arch):
+        cs = self.__cs.get(arch)
+        if cs is None:
+            cs = self.__cs[arch] = capstone.Cs(arch.arch, arch.mode)
+        return cs
+
+    def normalisation(self, gadget):
+        """
+        returns '' if the semantic of the gadget bytes does not depend on its address, otherwise the address
+        """
+        lines = gadget.lines
+        for line in lines:
+            if SemanticCache.PC_OPERAND.search(SemanticCache.REGISTER_LIST.sub('', line[3])):
+                return '%x' % gadget.address
+        address = lines[0][0] + SemanticCache.SHIFT
+        shifted = [(mnemonic, op_str) for a, size, mnemonic, op_str in self.__disassembler(gadget.arch).disasm_lite(bytes(gadget.bytes), address)]
+        if shifted != [(line[2], line[3]) for line in lines]:
+            return '%x' % gadget.address
+        return ''
+
+    def key(self, gadget):
+        return sha256(b'\0'.join([str(gadget.arch).encode('ascii'), self.normalisation(gadget).encode('ascii'), bytes(gadget.bytes)])).digest()
+
+    def __read(self):
+        """
+        reads the records which were appended since the last read
+        """
+        if self.__records is None:
+            self.__records = {}
+            self.__size = 0
+        try:
+            with open(self.__fileName, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) != self.__file:
+                    # the file is new or it was compacted by another process
+                    self.__records = {}
+                    self.__size = 0
+                    self.__count = 0
+                    self.__file = (stat.st_dev, stat.st_ino)
+                if self.__size == 0:
+                    header = f.read(SEMANTIC_HEADER.size)
+                    if len(header) < SEMANTIC_HEADER.size or SEMANTIC_HEADER.unpack(header)[:2] != (SEMANTIC_MAGIC, SemanticCache.VERSION):
+                        return
+                    self.__size = SEMANTIC_HEADER.size
+                f.seek(self.__size)
+                data = f.read()
+        except (IOError, OSError):
+            # the file was removed by trimming or clearing the cache, flush starts a new one
+            self.__records = {}
+            self.__size = 0
+            self.__count = 0
+            self.__file = None
+            return
+
+        offset = 0
+        while offset + SEMANTIC_RECORD.size <= len(data):
+            key, size, crc = SEMANTIC_RECORD.unpack_from(data, offset)
+            payload = data[offset + SEMANTIC_RECORD.size:offset + SEMANTIC_RECORD.size + size]
+            if len(payload) < size or _crc(payload) != crc:
+                # a record which is still written or a damaged one, the records behind it are not read
+                break
+            self.__records[key] = payload
+            self.__count += 1
+            offset += SEMANTIC_RECORD.size + size
+        self.__size += offset
+
+    def __contains__(self, key):
+        if key in self.__infos:
+            return True
+        if self.__records is None:
+            self.__read()
+        return key in self.__records
+
+    def __getitem__(self, key):
+        if key not in self.__infos:
+            if key not in self:
+                self.__misses += 1
+                raise KeyError(key)
+            info = SemanticCache.unpack(self.__records[key])
+            self.__infos[key] = info
+            self.__written[key] = len(info.checkedConstraints) if info is not None else 0
+        self.__hits += 1
+        return self.__infos[key]
+
+    def __setitem__(self, key, info):
+        if info is not None and not isinstance(info, SemanticInformation):
+            raise TypeError('info has to be an instance of SemanticInformation or None')
+        self.__infos[key] = info
+        self.__written.pop(key, None)
+
+    def flush(self):
+        """
+        appends the new and changed information to the file
+        """
+        chunks = []
+        for key, info in self.__infos.items():
+            checked = len(info.checkedConstraints) if info is not None else 0
+            if self.__written.get(key) == checked:
+                continue
+            payload = SemanticCache.pack(info)
+            if payload is not None:
+                chunks.append(SEMANTIC_RECORD.pack(key, len(payload), _crc(payload)) + payload)
+            self.__written[key] = checked
+        if not chunks:
+            return
+
+        folder = os.path.dirname(self.__fileName)
+        try:
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with CacheLock(self.__fileName):
+                self.__read()
+                if self.__size == 0:
+                    _publish(self.__fileName, [SEMANTIC_HEADER.pack(SEMANTIC_MAGIC, SemanticCache.VERSION, 0)])
+                    self.__read()
+                with open(self.__fileName, 'r+b') as f:
+                    # a record behind the last valid one was not written completely, it is overwritten
+                    f.truncate(self.__size)
+                    f.seek(self.__size)
+                    f.write(b''.join(chunks))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.__read()
+                if self.__size > SemanticCache.COMPACT_SIZE and self.__count > 2 * len(self.__records):
+                    self.__compact()
+        except (IOError, OSError):
+            pass
+
+    def __compact(self):
+        """
+        replaces the file by a file with the current record of every key, the lock has to be held
+        """
+        chunks = [SEMANTIC_HEADER.pack(SEMANTIC_MAGIC, SemanticCache.VERSION, 0)]
+        for key, payload in self.__records.items():
+            chunks.append(SEMANTIC_RECORD.pack(key, len(payload), _crc(payload)))
+            chunks.append(payload)
+        _publish(self.__fileName, chunks)
+        self.__read()
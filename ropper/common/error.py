@@ -44,3 +44,6 @@ class NotSupportedError(RopperError):
 
 class RopChainError(RopperError):
     pass
+
+class CacheError(RopperError):
+    pass
@@ -179,6 +179,9 @@ class Console(cmd.Cmd):
         if self.__options.clear_cache:
             self.__rs.clearCache()
 
+        if self.__options.cache_stats:
+            self.do_cache('stats')
+
         if self.__options.file and self.__options.asm is None:
             for file in self.__options.file:
                 self.__loadFile(file)
@@ -869,6 +872,7 @@ nx\t- Clears the NX-Flag (ELF|PE)"""
                     'color':'If on output is colored',
                     'badbytes':'Gadget addresses are not allowed to contain this bytes',
                     'type':'The file is scanned for this type of gadgets. (rop, jop, sys, all)',
+                    'sort':'The gadgets are sorted by this order. (text, address, none)',
                     'detailed':'If on the gadgets will be printed with more detailed information',
                     'inst_count':'The max count of instructions in a gadgets',
                     'count_of_findings':'The max count of findings which will be printed with semantic search (0 = undefined, default: 5)',
@@ -1070,13 +1074,44 @@ nx\t- Clears the NX-Flag (ELF|PE)"""
     def help_clearcache(self):
         self.__printHelpText('clearcache','Clears the cache')
 
+    @safe_cmd
+    def do_cache(self, text):
+        splits = text.strip().split(' ')
+        if splits[0] == 'stats':
+            stats = self.__rs.cacheStatistics()
+            data = [(cstr('Entries'), cstr(stats['entries'])),
+                    (cstr('Size'), cstr('%d bytes' % stats['size'])),
+                    (cstr('Bytes per entry'), cstr(stats['bytes_per_entry'])),
+                    (cstr('Pages'), cstr(stats['pages'])),
+                    (cstr('Pages size'), cstr('%d bytes' % stats['pages_size'])),
+                    (cstr('Semantic size'), cstr('%d bytes' % stats['semantic_size'])),
+                    (cstr('Total size'), cstr('%d bytes' % stats['total_size'])),
+                    (cstr('Budget'), cstr('%d bytes' % stats['budget'] if stats['budget'] else 'unlimited')),
+                    (cstr('Hits'), cstr(stats['hits'])),
+                    (cstr('Misses'), cstr(stats['misses'])),
+                    (cstr('Hit rate'), cstr('%.1f%%' % (stats['hit_rate'] * 100))),
+                    (cstr('Time saved'), cstr('%.2f s' % stats['time_saved']))]
+            printTable('Cache', (cstr('Name'), cstr('Value')), data)
+        elif splits[0] == 'trim':
+            size = None
+            if len(splits) > 1:
+                if not splits[1].isdigit():
+                    raise RopperError('Size has to be a number of bytes')
+                size = int(splits[1])
+            self.__printInfo('%d bytes removed' % self.__rs.trimCache(size))
+        elif splits[0] == 'clear':
+            self.__rs.clearCache()
+        else:
+            self.help_cache()
+
+    def help_cache(self):
+        self.__printHelpText('cache [stats|trim [size]|clear]', 'shows the cache statistics, removes the least recently used cache files until the cache is not bigger than size bytes or clears the cache')
+
     @safe_cmd
     def do_semantic(self, text):
         if not text:
             self.help_semantic()
             return
-        if not self.currentFile.analysed:
-            self.__rs.analyseGadgets(self.currentFile)
         constraint = None
         constraints = text.split(';')
 
@@ -1106,6 +1141,10 @@ nx\t- Clears the NX-Flag (ELF|PE)"""
             count += 1
 
         self.__cprinter.printInfo('%d gadgets found' % count)
+        statistics = self.__rs.semanticStatistics()
+        if statistics:
+            self.__cprinter.printInfo('%d gadgets considered, %d pruned, %d cached, %d solved (%d sat, %d unsat) in %.2fs' % (statistics['considered'], statistics['pruned'],
+                statistics['cached'], statistics['solved'], statistics['sat'], statistics['unsat'], statistics['solver_time']))
 
         self.__cprinter.println()
 
@@ -34,15 +34,26 @@ from ropper.common.error import RopperError
 from ropper.common.coloredstring import *
 from binascii import hexlify, unhexlify
 from ropper.semantic import Analyser, Category
+from array import array
+from itertools import compress
 import ropper.arch
 import sys
 
+if sys.version_info.major > 2:
+    from sys import intern
+
 # Optional sqlite support
 try:
     import sqlite3
 except:
     pass
 
+# Optional numpy support
+try:
+    import numpy
+except:
+    pass
+
 
 
 
@@ -50,29 +61,44 @@ class GadgetType(enum.Enum):
     _enum_ = 'ROP JOP SYS ALL'
 
 
+class GadgetOrder(enum.Enum):
+    _enum_ = 'TEXT ADDRESS NONE'
+
+
 class Gadget(object):
 
     DETAILED = False
     IMAGE_BASES = {}
     ANALYSER = Analyser()
 
+    # lines are kept as (address, mnemonic, op_str) and the text is built when it is needed
+    __slots__ = ('__arch', '__lines', '__gadget', '__category', '__affected_regs', '_fileName', '_section', '__bytes', '__buffer', '__offset', '__length', '__info', '__analysed')
+
     def __init__(self, fileName, section, arch, lines=None, bytes=None, semantic_information=None):
         #super(Gadget, self).__init__()
         if isinstance(arch, str):
             arch = ropper.arch.getArchitecture(arch)
         self.__arch = arch
-        self.__lines = lines
-        self.__gadget = ''
+        self.__lines = None
+        self.__gadget = None
         self.__category = None
         self.__affected_regs = None
         self._fileName = fileName
         self._section = section
         self.__bytes = bytes
+        self.__buffer = None
+        self.__offset = 0
+        self.__length = 0
         self.__info = semantic_information
         self.__analysed = semantic_information is not None
+        if lines is not None:
+            self._lines = lines
         #if init:
         #    self.__initialize(lines, bytes)
 
+    def __reduce__(self):
+        return (Gadget, (self._fileName, self._section, self.__arch, self.lines, self.bytes, self.__info))
+
     @property
     def info(self):
 
@@ -81,6 +107,14 @@ class Gadget(object):
     @info.setter
     def info(self, info):
         self.__info = info
+        self.__analysed = info is not False
+
+    @property
+    def analysed(self):
+        """
+        True if the semantic analysis of the gadget was done, info is None if it failed
+        """
+        return self.__analysed
 
     @property
     def arch(self):
@@ -90,17 +124,16 @@ class Gadget(object):
     def lines(self):
         if self.__lines == None:
             self.__lines = []
-        return self.__lines
+        return [(address, mnem + ' ' + args if args else mnem, mnem, args) for address, mnem, args in self.__lines]
 
     @property
     def _lines(self):
-        if self.__lines == None:
-            self.__lines = []
-        return self.__lines
+        return self.lines
 
     @_lines.setter
     def _lines(self, value):
-        self.__lines = value
+        self.__lines = [(line[0], intern(line[2]), intern(line[3])) for line in value]
+        self.__gadget = None
 
     @property
     def section(self):
@@ -112,39 +145,53 @@ class Gadget(object):
 
     @property
     def _bytes(self):
-        if self.__bytes == None:
-            self.__bytes = bytearray()
-        return self.__bytes
+        return self.bytes
 
     @_bytes.setter
     def _bytes(self, value):
-        self.__bytes = value
+        self.bytes = value
 
 
     @property
     def bytes(self):
+        if self.__buffer is not None:
+            return bytearray(self.__buffer[self.__offset:self.__offset + self.__length])
         if self.__bytes == None:
             self.__bytes = bytearray()
         return self.__bytes
 
     @bytes.setter
     def bytes(self, bytes):
+        self.__buffer = None
         self.__bytes = bytes
 
+    def _setBuffer(self, buffer, offset, length):
+        """
+        uses buffer[offset:offset+length] as bytes of the gadget without copying them
+        """
+        self.__buffer = buffer
+        self.__offset = offset
+        self.__length = length
+
     @property
     def imageBase(self):
         return Gadget.IMAGE_BASES.get(self._fileName,0)
 
     @property
     def address(self):
-        return self.imageBase + self.lines[0][0]
+        return self.imageBase + self.__lines[0][0]
 
     @property
     def _gadget(self):
-        if self.__gadget == '':
-            for line in self.lines:
-                self.__gadget += line[1] + '; '
-        return self.__gadget
+        if self.__gadget is not None:
+            return self.__gadget
+        toReturn = ''
+        for address, mnem, args in self.__lines or ():
+            if args:
+                toReturn += mnem + ' ' + args + '; '
+            else:
+                toReturn += mnem + '; '
+        return toReturn
 
     @_gadget.setter
     def _gadget(self, value):
@@ -153,15 +200,13 @@ class Gadget(object):
     def __initialize(self, lines, bytes):
         if bytes:
             self._bytes = bytes
-        self.__lines = lines
+        self._lines = lines
 
     def append(self, address, mnem, args='', bytes=None):
-        if args:
-            self._lines.append((address, mnem + ' ' + args, mnem ,args))
-            self.__gadget += mnem + ' ' + args + '; '
-        else:
-            self._lines.append((address, mnem, mnem,args))
-            self.__gadget += mnem + '; '
+        if self.__lines == None:
+            self.__lines = []
+        self.__lines.append((address, intern(mnem), intern(args)))
+        self.__gadget = None
 
         if bytes:
             self.bytes += bytes
@@ -175,27 +220,34 @@ class Gadget(object):
             return bool(re.match(filter, self._gadget))
 
     def addressesContainsBytes(self, badbytes):
-        line =  self._lines[0]
         for b in badbytes:
 
             address = self.address
             if type(b) == str:
                 b = ord(b)
 
-            # TODO: This should be changed. Only 4 bytes are checked
             for i in range(self.arch.addressLength):
                 if (address & 0xff) == b:
 
                     return True
                 address >>= 8
 
+    def sortKey(self):
+        """
+        returns the plain instruction string, which is used to sort gadgets
+        The string is kept in the gadget once it is built.
+        """
+        if self.__gadget is None:
+            self.__gadget = self._gadget
+        return self.__gadget
+
     def simpleInstructionString(self):
         toReturn = ''
-        for line in self._lines:
-            if line[3]:
-                toReturn += cstr(line[2], Color.LIGHT_YELLOW)+ ' ' + cstr(line[3], Color.LIGHT_GRAY)+ cstr('; ', Color.LIGHT_BLUE)
+        for address, mnem, args in self.__lines or ():
+            if args:
+                toReturn += cstr(mnem, Color.LIGHT_YELLOW)+ ' ' + cstr(args, Color.LIGHT_GRAY)+ cstr('; ', Color.LIGHT_BLUE)
             else:
-                toReturn += cstr(line[2], Color.LIGHT_YELLOW)+ cstr('; ', Color.LIGHT_BLUE)
+                toReturn += cstr(mnem, Color.LIGHT_YELLOW)+ cstr('; ', Color.LIGHT_BLUE)
 
 
         return toReturn
@@ -206,9 +258,9 @@ class Gadget(object):
 
         if isinstance(self.arch, ropper.arch.ArchitectureArmThumb):
             address += 1
-            toReturn = '%s (%s): ' % (cstr(toHex(self._lines[0][0] + self.imageBase, self.__arch.addressLength), analyseColor),cstr(toHex(address + self.imageBase, self.__arch.addressLength), Color.GREEN))
+            toReturn = '%s (%s): ' % (cstr(toHex(self.__lines[0][0] + self.imageBase, self.__arch.addressLength), analyseColor),cstr(toHex(address + self.imageBase, self.__arch.addressLength), Color.GREEN))
         else:
-            toReturn = '%s: ' % cstr(toHex(self._lines[0][0] + self.imageBase, self.__arch.addressLength), analyseColor)
+            toReturn = '%s: ' % cstr(toHex(self.__lines[0][0] + self.imageBase, self.__arch.addressLength), analyseColor)
         toReturn += self.simpleInstructionString()
         if self.__info:
             toReturn += '\nClobbered Register = %s; StackPointer-Offset = %s\n' % (", ".join(list(self.info.clobberedRegisters)),self.info.spOffset if self.info.spOffset is not None else 'Undef')
@@ -219,10 +271,7 @@ class Gadget(object):
         if not self.__affected_regs:
             self.__affected_regs = set()
 
-            full_line = self.simpleInstructionString()
-            line = self.__lines[0][1]
-
-            for l_tup in self.__lines:
+            for l_tup in self.lines:
                 line = l_tup[1]
                 for cat, regexs in self.__arch._categories.items():
                     for regex in regexs[0]:
@@ -241,18 +290,19 @@ class Gadget(object):
     @property
     def category(self):
         if not self.__category:
-            line = self.__lines[0][1]
+            lines = self.lines
+            line = lines[0][1]
             for cat, regexs in self.__arch._categories.items():
                 for regex in regexs[0]:
                     match = re.match(regex, line)
                     if match:
                         for invalid in regexs[1]:
-                            for l in self.__lines[1:]:
+                            for l in lines[1:]:
                                 if l[1].startswith(invalid):
                                     self.__category = (Category.NONE,)
                                     return self.__category
 
-                        self.__category = (cat, len(self.__lines) -1 ,match.groupdict())
+                        self.__category = (cat, len(lines) -1 ,match.groupdict())
                         self.__category[2]['affected'] = self.affected_regs
                         return self.__category
             self.__category = (Category.NONE,)
@@ -260,16 +310,41 @@ class Gadget(object):
         return self.__category
 
     def __len__(self):
-        return len(self._lines)
+        return len(self.__lines) if self.__lines else 0
 
     def __cmp__(self, other):
         if isinstance(other, self.__class__) and len(self) == len(other):
             return cmp(str(self),str(other))
         return -1
 
+    def _key(self):
+        """
+        returns the bytes of the gadget, or its instruction string if it has no bytes
+        Gadgets with the same key and architecture are equal, wherever they are located.
+        """
+        if self.__buffer is not None:
+            return bytes(self.__buffer[self.__offset:self.__offset + self.__length])
+        if self.__bytes:
+            return bytes(self.__bytes)
+        return self._gadget
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Gadget):
+            return NotImplemented
+        return self._key() == other._key() and (self.__arch is other.__arch or str(self.__arch) == str(other.__arch))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self._key())
+
     def disassemblyString(self):
         toReturn = ''
-        for line in self._lines:
+        for line in self.lines:
             toReturn += cstr(toHex(line[0] + self.imageBase, self.__arch.addressLength), Color.RED) +': '+ cstr(line[1], Color.LIGHT_GRAY) + '\n'
 
         return toReturn
@@ -277,18 +352,620 @@ class Gadget(object):
     def __str__(self):
         if not Gadget.DETAILED:
             return self.simpleString()
-        if not len(self._lines):
+        lines = self.lines
+        if not len(lines):
             return "empty gadget"
-        address = self._lines[0][0]
+        address = lines[0][0]
         if self.__arch == ropper.arch.ARMTHUMB:
             address += 1
-            toReturn = cstr('Gadget', Color.BLUE)+': %s (%s)\n' % (cstr(toHex(self._lines[0][0] + self.imageBase, self.__arch.addressLength), Color.YELLOW),cstr(toHex(address+ self.imageBase, self.__arch.addressLength), Color.GREEN))
+            toReturn = cstr('Gadget', Color.BLUE)+': %s (%s)\n' % (cstr(toHex(lines[0][0] + self.imageBase, self.__arch.addressLength), Color.YELLOW),cstr(toHex(address+ self.imageBase, self.__arch.addressLength), Color.GREEN))
         else:
-            toReturn = cstr('Gadget', Color.BLUE)+': %s\n' % (cstr(toHex(self._lines[0][0] + self.imageBase, self.__arch.addressLength), Color.YELLOW))
-        for line in self._lines:
+            toReturn = cstr('Gadget', Color.BLUE)+': %s\n' % (cstr(toHex(lines[0][0] + self.imageBase, self.__arch.addressLength), Color.YELLOW))
+        for line in lines:
             toReturn += cstr(toHex(line[0] + self.imageBase, self.__arch.addressLength), Color.RED) +': '+ cstr(line[1], Color.LIGHT_GRAY) + '\n'
 
         return toReturn
 
     def __repr__(self):
-        return 'Gadget(%s, %s, %s, %s, %s, %s)' % (repr(self.fileName), repr(self.section), repr(self.__arch), repr(self.__lines), repr(self._bytes), repr(self.info))
+        return 'Gadget(%s, %s, %s, %s, %s, %s)' % (repr(self.fileName), repr(self.section), repr(self.__arch), repr(self.__lines and self.lines), repr(self.bytes), repr(self.info))
+
+
+class GadgetTable(object):
+    """
+    Holds the gadgets of a file in parallel arrays and creates the Gadget objects when they are accessed.
+    Filtering and sorting work on the arrays, with numpy if it is available. The result is a view of the table,
+    which shares the arrays and the created gadgets with it.
+    A lazy table stores only the boundaries of the gadgets. Their instruction strings are disassembled when they are
+    needed the first time, e.g. to match, sort or remove duplicates.
+    A table of searched sections keeps the gadgets the merge of the endings dropped, too. With them narrow derives the
+    gadgets of a search with fewer instructions or endings from the table.
+    """
+
+    NO_TEXT = 0xffffffff
+
+    def __init__(self, fileName, arch, lazy=False):
+        if isinstance(arch, str):
+            arch = ropper.arch.getArchitecture(arch)
+        self.__fileName = fileName
+        self.__arch = arch
+        self.__lazy = lazy
+        self.__sections = []
+        self.__sectionIds = {}
+        self.__texts = []
+        self.__textIds = {}
+        self.__memo = {}
+        self.__gadgets = {}
+        self.__infos = {}
+
+        self.__address = array('Q')
+        self.__section = array('H')
+        self.__offset = array('I')
+        self.__length = array('I')
+        self.__count = array('H')
+        self.__ending = array('h')
+        self.__category = array('b')
+        self.__text = array('I')
+        self.__digest = array('q')
+        # (section, offset, length, instruction count, ending) of the shadowed records or None if they are unknown
+        self.__shadowed = array('I')
+        self.__rows = None
+
+    @classmethod
+    def fromGadgets(cls, fileName, arch, gadgets):
+        """
+        creates a table of already created gadgets, e.g. gadgets loaded from the cache
+        """
+        table = cls(fileName, arch)
+        for gadget in gadgets:
+            table.addGadget(gadget)
+        return table
+
+    @property
+    def fileName(self):
+        return self.__fileName
+
+    @property
+    def arch(self):
+        return self.__arch
+
+    @property
+    def lazy(self):
+        return self.__lazy
+
+    @property
+    def narrowable(self):
+        """
+        True if narrow can be used, i.e. all gadgets of the table were searched and the view contains all of them
+        """
+        return self.__shadowed is not None and len(self) == len(self.__address)
+
+    @property
+    def rows(self):
+        """
+        indices of the gadgets of this view in the arrays
+        """
+        if self.__rows is None:
+            return array('I', range(len(self.__address)))
+        return self.__rows
+
+    @property
+    def addresses(self):
+        imageBase = Gadget.IMAGE_BASES.get(self.__fileName, 0) or 0
+        if self.__rows is None:
+            addresses = self.__address
+        else:
+            addresses = map(self.__address.__getitem__, self.__rows)
+        if not imageBase:
+            return array('Q', addresses)
+        return array('Q', [address + imageBase for address in addresses])
+
+    @property
+    def instructionCounts(self):
+        return array('H', [self.__count[row] for row in self.rows])
+
+    def __addSectionId(self, name, decoder):
+        if decoder is None and name in self.__sectionIds:
+            return self.__sectionIds[name]
+        self.__sections.append((name, decoder))
+        if decoder is None:
+            self.__sectionIds[name] = len(self.__sections) - 1
+        return len(self.__sections) - 1
+
+    def __addText(self, text):
+        text_id = self.__textIds.get(text)
+        if text_id is None:
+            text_id = len(self.__texts)
+            self.__texts.append(text)
+            self.__textIds[text] = text_id
+            self.__memo.pop('ranks', None)
+        return text_id
+
+    def __append(self, address, section_id, offset, length, count, ending, text, digest):
+        self.__address.append(address)
+        self.__section.append(section_id)
+        self.__offset.append(offset)
+        self.__length.append(length)
+        self.__count.append(count)
+        self.__ending.append(ending)
+        self.__category.append(-1)
+        self.__text.append(GadgetTable.NO_TEXT if text is None else self.__addText(text))
+        self.__digest.append(digest)
+
+    def __disassemble(self, decoder, offset, length):
+        text = ''
+        for address, mnem, args in decoder.instructions(offset, length, self.__arch.hasITBlocks):
+            if args:
+                text += mnem + ' ' + args + '; '
+            else:
+                text += mnem + '; '
+        return text
+
+    def __textId(self, row):
+        text_id = self.__text[row]
+        if text_id == GadgetTable.NO_TEXT:
+            decoder = self.__sections[self.__section[row]][1]
+            text_id = self.__text[row] = self.__addText(self.__disassemble(decoder, self.__offset[row], self.__length[row]))
+        return text_id
+
+    def __disassembleRows(self):
+        if self.__lazy:
+            for row in self.rows:
+                self.__textId(row)
+
+    def addSection(self, name, decoder, records, endings, digests=None, shadowed=None):
+        """
+        adds the gadgets of the (start, length, instruction count) records of a section
+        decoder has to provide code, address and instructions(start, length, itBlocks) of the section
+        digests are the hashes of the gadget bytes. They are computed if they are not given.
+        shadowed are the (start, length, instruction count, ending) records the merge of the endings dropped.
+        Without them the table cannot be narrowed.
+        """
+        section_id = self.__addSectionId(name, decoder)
+        code = decoder.code
+        for i in range(0, len(records), 3):
+            text = None if self.__lazy else self.__disassemble(decoder, records[i], records[i + 1])
+            digest = hash(code[records[i]:records[i] + records[i + 1]]) if digests is None else digests[i // 3]
+            self.__append(decoder.address + records[i], section_id, records[i], records[i + 1], records[i + 2], endings[i // 3], text, digest)
+
+        if shadowed is None:
+            self.__shadowed = None
+        elif self.__shadowed is not None:
+            for i in range(0, len(shadowed), 4):
+                self.__shadowed.append(section_id)
+                self.__shadowed.extend(shadowed[i:i + 4])
+
+    def addGadget(self, gadget):
+        row = len(self.__address)
+        self.__append(gadget.lines[0][0], self.__addSectionId(gadget.section, None), 0, len(gadget.bytes), len(gadget), -1, gadget._gadget, hash(gadget))
+        self.__gadgets[row] = gadget
+        self.__shadowed = None
+
+    def narrow(self, instructionCount, first, count):
+        """
+        returns a new table with the gadgets a search with at most instructionCount instructions and the endings first to first + count - 1
+        of this table would find. The endings of the new table start at 0.
+        A search walks backwards from every ending and stops at the first gadget with too many instructions. These walks are
+        repeated on the records of the table and its shadowed records, so the code is not disassembled again.
+        The gadgets keep their semantic information.
+        """
+        if not self.narrowable:
+            raise RopperError('The gadgets of this table cannot be narrowed')
+
+        # (section, ending, end of the ending, -start, row) in the order a search walks them, shadowed records have negative rows
+        records = []
+        last = first + count
+        for row in range(len(self.__address)):
+            if first <= self.__ending[row] < last:
+                records.append((self.__section[row], self.__ending[row], self.__offset[row] + self.__length[row], -self.__offset[row], row))
+        shadowed = self.__shadowed
+        for i in range(0, len(shadowed), 5):
+            if first <= shadowed[i + 4] < last:
+                records.append((shadowed[i], shadowed[i + 4], shadowed[i + 1] + shadowed[i + 2], -shadowed[i + 1], -1 - i // 5))
+        records.sort()
+
+        table = GadgetTable(self.__fileName, self.__arch, self.__lazy)
+        table.__sections = list(self.__sections)
+        table.__sectionIds = dict(self.__sectionIds)
+        table.__texts = list(self.__texts)
+        table.__textIds = dict(self.__textIds)
+
+        walk = None
+        starts = set()
+        for section, ending, end, start, row in records:
+            if (section, ending, end) != walk:
+                walk = (section, ending, end)
+                stopped = False
+            if stopped:
+                continue
+            start = -start
+            instructions = self.__count[row] if row >= 0 else shadowed[(-1 - row) * 5 + 3]
+            if instructions > instructionCount:
+                stopped = True
+                continue
+            if (section, start) in starts:
+                table.__shadowed.extend((section, start, end - start, instructions, ending - first))
+                continue
+            starts.add((section, start))
+
+            if row >= 0:
+                text_id = self.__text[row]
+                table.__append(self.__address[row], section, start, end - start, instructions, ending - first, None, self.__digest[row])
+                table.__text[-1] = text_id
+                table.__category[-1] = self.__category[row]
+                gadget = self.__gadgets.get(row)
+                info = self.__infos.get(row) if gadget is None else gadget.info
+                if info is not None:
+                    table.__infos[len(table.__address) - 1] = info
+            else:
+                # the gadget was shadowed by a gadget which is not part of the new table
+                decoder = self.__sections[section][1]
+                text = None if self.__lazy else self.__disassemble(decoder, start, end - start)
+                table.__append(decoder.address + start, section, start, end - start, instructions, ending - first, text, hash(decoder.code[start:end]))
+
+        return table
+
+    # name and typecode of the columns which are stored in the cache
+    COLUMNS = (('address', 'Q'), ('section', 'H'), ('offset', 'I'), ('length', 'I'), ('count', 'H'), ('ending', 'h'), ('category', 'b'), ('text', 'I'))
+
+    def _export(self):
+        """
+        returns (sections, columns, texts, infos, shadowed) of the gadgets of this view for the cache
+        sections are (name, address, code) tuples, columns are the arrays of COLUMNS and infos the semantic information per row.
+        shadowed are the shadowed records of a narrowable table or None.
+        The bytes of gadgets which were added with addGadget are put together at their offsets into one code block per section.
+        """
+        rows = self.__rows
+        columns = {}
+        for name, typecode in GadgetTable.COLUMNS:
+            column = getattr(self, '_GadgetTable__' + name)
+            columns[name] = array(typecode, column if rows is None else map(column.__getitem__, rows))
+        rows = self.rows
+
+        sections = []
+        loose = {}
+        for name, decoder in self.__sections:
+            if decoder is None:
+                loose[len(sections)] = []
+                sections.append(None)
+            else:
+                sections.append((name, decoder.address, decoder.code))
+
+        if loose:
+            for index, row in enumerate(rows):
+                if self.__section[row] in loose:
+                    loose[self.__section[row]].append((index, self.__gadgets[row]))
+            for section_id, gadgets in loose.items():
+                base = min([gadget.lines[0][0] for index, gadget in gadgets]) if gadgets else 0
+                code = bytearray(max([gadget.lines[0][0] + len(gadget.bytes) for index, gadget in gadgets]) - base if gadgets else 0)
+                for index, gadget in gadgets:
+                    offset = gadget.lines[0][0] - base
+                    code[offset:offset + len(gadget.bytes)] = gadget.bytes
+                    columns['offset'][index] = offset
+                for index, gadget in gadgets:
+                    if code[columns['offset'][index]:columns['offset'][index] + len(gadget.bytes)] != gadget.bytes:
+                        raise RopperError('Gadgets of section %s overlap with different bytes' % self.__sections[section_id][0])
+                sections[section_id] = (self.__sections[section_id][0], base, bytes(code))
+
+        infos = {}
+        for index, row in enumerate(rows):
+            gadget = self.__gadgets.get(row)
+            info = self.__infos.get(row) if gadget is None else gadget.info
+            if info is not None:
+                infos[index] = info
+
+        return sections, columns, list(self.__texts), infos, array('I', self.__shadowed) if self.narrowable else None
+
+    @classmethod
+    def _fromColumns(cls, fileName, arch, lazy, sections, columns, texts, infos=None, shadowed=None):
+        """
+        creates a table of the output of _export
+        sections are (name, decoder) tuples. The gadgets are created when they are accessed.
+        """
+        table = cls(fileName, arch, lazy)
+        table.__sections = list(sections)
+        table.__texts = texts
+        table.__textIds = dict(zip(texts, range(len(texts))))
+        for name, typecode in GadgetTable.COLUMNS:
+            setattr(table, '_GadgetTable__' + name, columns[name])
+        table.__infos = dict(infos or {})
+        table.__shadowed = shadowed
+
+        codes = [decoder.code for name, decoder in table.__sections]
+        table.__digest = array('q', [hash(codes[section][offset:offset + length]) for section, offset, length in zip(table.__section, table.__offset, table.__length)])
+        return table
+
+    def __gadget(self, row):
+        gadget = self.__gadgets.get(row)
+        if gadget is None:
+            name, decoder = self.__sections[self.__section[row]]
+            gadget = Gadget(self.__fileName, name, self.__arch)
+            for address, mnem, args in decoder.instructions(self.__offset[row], self.__length[row], self.__arch.hasITBlocks):
+                gadget.append(address, mnem, args)
+            gadget._setBuffer(decoder.code, self.__offset[row], self.__length[row])
+            if row in self.__infos:
+                gadget.info = self.__infos.pop(row)
+            self.__gadgets[row] = gadget
+        return gadget
+
+    def __bytes(self, row):
+        decoder = self.__sections[self.__section[row]][1]
+        if decoder is None:
+            return self.__gadgets[row]._key()
+        return decoder.code[self.__offset[row]:self.__offset[row] + self.__length[row]]
+
+    def _select(self, rows):
+        if 'numpy' in globals() and isinstance(rows, numpy.ndarray):
+            rows = rows.astype(numpy.uint32).tobytes()
+        view = GadgetTable.__new__(GadgetTable)
+        view.__dict__.update(self.__dict__)
+        view.__rows = array('I', rows)
+        return view
+
+    def __len__(self):
+        if self.__rows is None:
+            return len(self.__address)
+        return len(self.__rows)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.__gadget(row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._select(self.rows[index])
+        return self.__gadget(self.rows[index])
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __npRows(self):
+        return numpy.frombuffer(self.rows, dtype=numpy.uint32)
+
+    def filterBadBytes(self, badbytes):
+        """
+        returns a view without the gadgets whose address contains one of the badbytes
+        """
+        if not badbytes:
+            return self
+        if 'numpy' in globals():
+            rows = self.__npRows()
+            imageBase = Gadget.IMAGE_BASES.get(self.__fileName, 0) or 0
+            addresses = numpy.frombuffer(self.__address, dtype=numpy.uint64)[rows] + numpy.uint64(imageBase)
+            return self._select(rows[badBytesMask(addresses, badbytes, self.__arch.addressLength)])
+
+        return self.filterMask(badBytesMask(self.addresses, badbytes, self.__arch.addressLength))
+
+    def filterMask(self, mask):
+        """
+        returns a view of the gadgets whose entry in mask is true
+        """
+        if 'numpy' in globals() and isinstance(mask, numpy.ndarray):
+            return self._select(self.__npRows()[mask])
+        return self._select(compress(self.rows, mask))
+
+    def filterQuality(self, quality):
+        """
+        returns a view of the gadgets with at most quality+1 instructions
+        """
+        if 'numpy' in globals():
+            rows = self.__npRows()
+            return self._select(rows[numpy.frombuffer(self.__count, dtype=numpy.uint16)[rows] <= quality + 1])
+        return self._select([row for row in self.rows if self.__count[row] <= quality + 1])
+
+    def match(self, filter, quality=None):
+        """
+        returns a view of the gadgets which match the regex filter. The regex is applied once per distinct gadget.
+        """
+        table = self.filterQuality(quality) if quality else self
+        if not filter:
+            return table
+
+        matches = {}
+        arm = self.__arch in (ropper.arch.ARMTHUMB, ropper.arch.ARM)
+        rows = []
+        for row in table.rows:
+            text_id = self.__textId(row)
+            matched = matches.get(text_id)
+            if matched is None:
+                text = self.__texts[text_id]
+                matched = matches[text_id] = bool(re.match(filter, text.replace('.w', '') if arm else text))
+            if matched:
+                rows.append(row)
+        return self._select(rows)
+
+    def __groupDuplicates(self):
+        """
+        returns the first row of every distinct gadget and a dict of these rows and the rows of the gadgets with the same bytes
+        The hashes of the bytes are compared first, the bytes only if the hashes are equal.
+        """
+        first_rows = []
+        groups = {}
+        kept = {}
+        for row in self.rows:
+            key = self.__digest[row]
+            first = kept.get(key)
+            if first is not None and self.__bytes(first) != self.__bytes(row):
+                key = self.__bytes(row)
+                first = kept.get(key)
+            if first is None:
+                kept[key] = row
+                first_rows.append(row)
+                groups[row] = []
+            else:
+                groups[first].append(row)
+        return first_rows, groups
+
+    def deleteDuplicates(self):
+        """
+        returns a view which contains only the first gadget of all gadgets with the same bytes
+        """
+        first_rows, groups = self.__groupDuplicates()
+        return self._select(first_rows)
+
+    def duplicates(self):
+        """
+        returns a dict of every gadget of deleteDuplicates and the addresses of the other gadgets with the same bytes
+        """
+        imageBase = Gadget.IMAGE_BASES.get(self.__fileName, 0) or 0
+        first_rows, groups = self.__groupDuplicates()
+        to_return = {}
+        for row in first_rows:
+            to_return[self.__gadget(row)] = array('Q', [self.__address[duplicate] + imageBase for duplicate in groups[row]])
+        return to_return
+
+    def sort(self):
+        """
+        returns a view, which is sorted by the instruction strings of the gadgets
+        """
+        self.__disassembleRows()
+        ranks = self.__memo.get('ranks')
+        if ranks is None:
+            ranks = array('I', [0] * len(self.__texts))
+            for rank, text_id in enumerate(sorted(range(len(self.__texts)), key=self.__texts.__getitem__)):
+                ranks[text_id] = rank
+            self.__memo['ranks'] = ranks
+
+        if 'numpy' in globals():
+            rows = self.__npRows()
+            keys = numpy.frombuffer(ranks, dtype=numpy.uint32)[numpy.frombuffer(self.__text, dtype=numpy.uint32)[rows]]
+            return self._select(rows[numpy.argsort(keys, kind='stable')])
+
+        return self._select(sorted(self.rows, key=lambda row: ranks[self.__text[row]]))
+
+    def sortByAddress(self):
+        """
+        returns a view, which is sorted by the addresses of the gadgets
+        """
+        if 'numpy' in globals():
+            rows = self.__npRows()
+            keys = numpy.frombuffer(self.__address, dtype=numpy.uint64)[rows]
+            return self._select(rows[numpy.argsort(keys, kind='stable')])
+
+        return self._select(sorted(self.rows, key=self.__address.__getitem__))
+
+    def categories(self):
+        """
+        returns the category of every gadget of the view. A category is computed once per distinct gadget.
+        """
+        categories = {}
+        to_return = []
+        for row in self.rows:
+            if self.__category[row] < 0:
+                text_id = self.__textId(row)
+                if text_id not in categories:
+                    categories[text_id] = self.__gadget(row).category[0].value
+                self.__category[row] = categories[text_id]
+            to_return.append(Category[self.__category[row]])
+        return to_return
+
+    def filterCategory(self, category):
+        """
+        returns a view of the gadgets of category
+        """
+        return self._select([row for row, cat in zip(self.rows, self.categories()) if cat == category])
+
+
+class SuffixIndex(object):
+    """
+    Trie of the reversed bytes of gadgets, a lookup walks the bytes of one gadget from the end
+    The gadgets can be Gadget objects or bytes.
+    """
+
+    def __init__(self, gadgets=()):
+        self.__root = {}
+        self.__count = 0
+        for gadget in gadgets:
+            self.add(gadget)
+
+    @staticmethod
+    def __bytes(gadget):
+        return bytearray(gadget.bytes if isinstance(gadget, Gadget) else gadget)
+
+    def __len__(self):
+        return self.__count
+
+    def add(self, gadget):
+        node = self.__root
+        for byte in reversed(SuffixIndex.__bytes(gadget)):
+            node = node.setdefault(byte, {})
+        if None not in node:
+            node[None] = True
+            self.__count += 1
+
+    def __contains__(self, gadget):
+        node = self.__find(gadget)
+        return node is not None and None in node
+
+    def __find(self, gadget):
+        node = self.__root
+        for byte in reversed(SuffixIndex.__bytes(gadget)):
+            node = node.get(byte)
+            if node is None:
+                return None
+        return node
+
+    def endsWithKnown(self, gadget):
+        """
+        returns True if the bytes of a known gadget are a suffix of the bytes of gadget
+        """
+        node = self.__root
+        if None in node:
+            return True
+        for byte in reversed(SuffixIndex.__bytes(gadget)):
+            node = node.get(byte)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def isSuffixOfKnown(self, gadget):
+        """
+        returns True if the bytes of gadget are a suffix of the bytes of a known gadget
+        """
+        return self.__count > 0 and self.__find(gadget) is not None
+
+
+def sortGadgets(gadgets, order=GadgetOrder.TEXT):
+    """
+    returns a list or a GadgetTable of gadgets sorted by order
+    The sort is stable, so sorting the concatenation of already sorted lists only merges them.
+    """
+    if order == GadgetOrder.NONE:
+        return gadgets
+    if isinstance(gadgets, GadgetTable):
+        return gadgets.sortByAddress() if order == GadgetOrder.ADDRESS else gadgets.sort()
+    if order == GadgetOrder.ADDRESS:
+        return sorted(gadgets, key=lambda gadget: gadget.address)
+    return sorted(gadgets, key=Gadget.sortKey)
+
+
+def badBytesMask(addresses, badbytes, addressLength=8):
+    """
+    returns a mask with a true value for every address whose lowest addressLength bytes contain none of the badbytes
+    All addresses are checked at once. Without numpy the packed addresses are mapped through a 256 byte table with bytes.translate.
+    """
+    badbytes = bytearray(badbytes)
+    if not badbytes:
+        return [True] * len(addresses)
+
+    if 'numpy' in globals():
+        lut = numpy.zeros(256, dtype=bool)
+        lut[list(set(badbytes))] = True
+        address_bytes = numpy.asarray(addresses, dtype=numpy.uint64).astype('<u8').view(numpy.uint8).reshape(-1, 8)
+        return ~lut[address_bytes[:, :addressLength]].any(axis=1)
+
+    lut = bytearray(256)
+    for b in badbytes:
+        lut[b] = 1
+    words = array('Q')
+    words.frombytes(array('Q', addresses).tobytes().translate(lut))
+    if addressLength >= 8:
+        return [not word for word in words]
+    mask = (1 << (8 * addressLength)) - 1
+    return [not word & mask for word in words]
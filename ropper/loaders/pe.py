@@ -47,6 +47,7 @@ class PE(Loader):
     def __init__(self, filename, bytes=None, arch=None):
 
         super(PE, self).__init__(filename, bytes, arch)
+        self.__cfgTargets = None
 
     @property
     def entryPoint(self):
@@ -113,6 +114,31 @@ class PE(Loader):
     def _getImageBase(self):
         return self._binary.imageBase
 
+    @property
+    def cfgTargets(self):
+        """
+        returns the 16 byte aligned rvas of all CFG guarded functions and of the unaligned ones only, or None if there is no load config
+        They are computed once per loader, because they do not depend on the image base.
+        """
+        if self.__cfgTargets is None:
+            loadConfig = self._binary.dataDirectory[pe.ImageDirectoryEntry.LOAD_CONFIG]
+            if not loadConfig:
+                return None
+            # For unaligned functions all the 16 bytes in their aligned space can be used
+            unaligned = frozenset([func & ~0xf for func in loadConfig.cfGuardedFunctions if func & 0xf])
+            self.__cfgTargets = (unaligned.union([func for func in loadConfig.cfGuardedFunctions if not func & 0xf]), unaligned)
+        return self.__cfgTargets
+
+    def cfgMask(self, addresses):
+        """
+        returns a mask with a true value for every address which passes the CFG checks
+        """
+        targets, unaligned = self.cfgTargets
+        imageBase = self.imageBase
+        # If a guarded function is 16 byte aligned then it's only possible to jump directly to that function.
+        # If it is not, then it's possible to jump to anywhere in the 16 bytes of the aligned function's address
+        return [((rva & ~0xf) in unaligned) if rva & 0xf else (rva in targets) for rva in [address - imageBase for address in addresses]]
+
     def checksec(self):
 
         return {'SafeSEH' : self.imageNtHeaders.OptionalHeader.DataDirectory[ImageDirectoryEntry.LOAD_CONFIG].Size != 0,
@@ -138,6 +138,8 @@ available rop chain generators:
             '--instructions', help='Searches for instructions (e.g. "jmp esp", "pop eax; ret")', metavar='<instructions>')
         parser.add_argument(
             '--type', help='Sets the type of gadgets [rop, jop, sys, all] (default: all)', metavar='<type>', default='all')
+        parser.add_argument(
+            '--sort', help='Sets the order of the gadgets [text, address, none] (default: text)', metavar='<order>', default='text')
         parser.add_argument(
             '--detailed', help='Prints gadgets more detailed', action='store_true')
         parser.add_argument(
@@ -152,6 +154,8 @@ available rop chain generators:
             '--nocolor', help='Disables colored output', action='store_true')
         parser.add_argument(
             '--clear-cache', help='Clears the cache', action='store_true')
+        parser.add_argument(
+            '--cache-stats', help='Prints the cache statistics', action='store_true')
         parser.add_argument(
             '--no-load', help='Don\'t load the gadgets automatically when start the console (--console)', action='store_true', default=False)
         parser.add_argument(
@@ -175,7 +179,7 @@ available rop chain generators:
 
         self.nocolor = self.__args.nocolor or self.isWindows()
 
-        if not self.__args.clear_cache and not self.__args.help_examples and not self.__args.asm and not self.disasm and not self.__args.console and not self.__args.file and not self.__args.version:
+        if not self.__args.clear_cache and not self.__args.cache_stats and not self.__args.help_examples and not self.__args.asm and not self.disasm and not self.__args.console and not self.__args.file and not self.__args.version:
             self.__missingArgument('[-f|--file]')
 
         if self.__args.I:
@@ -191,6 +195,7 @@ available rop chain generators:
         ropper_options['detailed'] = self.__args.detailed
         ropper_options['inst_count'] = self.__args.inst_count
         ropper_options['type'] = self.__args.type
+        ropper_options['sort'] = self.__args.sort
         ropper_options['cfg_only'] = self.__args.cfg_only
         ropper_options['count_of_findings'] = self.__args.count_of_findings
         ropper_options['multiprocessing'] = not self.__args.single
@@ -292,6 +297,12 @@ available rop chain generators:
             return  (True,True)
         return False
 
+    def _setSort(self, value):
+        if value in ['text','address','none']:
+            self.sort = value
+            return (True,False)
+        return False
+
     def _setColor(self, value):
         if value.lower() in ('on', 'off'):
             self.nocolor = bool(value == 'off')
@@ -303,6 +314,7 @@ VALID_OPTIONS = {'all' : Options._setAll,
                      'badbytes' : Options._setBadbytes,
                      'detailed' : Options._setDetailed,
                      'type' : Options._setType,
+                     'sort' : Options._setSort,
                      'color' : Options._setColor,
                      'multiprocessing' : Options._setMultiprocessing,
                      'count_of_findings' : Options._setCountOfFindings}
@@ -31,15 +31,19 @@ from ropper.common.error import *
 from ropper.common.enum import Enum
 from ropper.arch import x86
 from multiprocessing import Process, Pool, Queue, cpu_count, current_process, JoinableQueue
-from .gadget import Gadget, GadgetType
+from .gadget import Gadget, GadgetTable, GadgetType, GadgetOrder, sortGadgets
 from binascii import hexlify, unhexlify
 from struct import pack
+from array import array
 import re
 import multiprocessing as mp
 import struct
 import sys
 import capstone
 
+if sys.version_info.major > 2:
+    from sys import intern
+
 # Optional keystone support
 try:
     import keystone
@@ -50,8 +54,137 @@ except:
 class Format(Enum):
     _enum_ = 'RAW STRING HEX'
 
+class DecodeCache(object):
+    """
+    Decodes the instructions of one section lazily and keeps them per byte offset.
+    The entries are shared by every gadget candidate and every ending of the section.
+    """
+
+    def __init__(self, disassembler, code, address, maxLength):
+        self.__disassembler = disassembler
+        self.__code = code
+        self.__address = address
+        self.__maxLength = maxLength
+        self.__instructions = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def code(self):
+        return self.__code
+
+    @property
+    def address(self):
+        return self.__address
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__instructions)
+
+    def get(self, offset):
+        """
+        returns (size, mnemonic, op_str) of the instruction at offset or None if the bytes cannot be decoded
+        """
+        if offset in self.__instructions:
+            self.__hits += 1
+            return self.__instructions[offset]
+
+        self.__misses += 1
+        instruction = None
+        for address, size, mnemonic, op_str in self.__disassembler.disasm_lite(self.__code[offset:offset + self.__maxLength], self.__address + offset, 1):
+            instruction = (size, intern(mnemonic), intern(op_str))
+        self.__instructions[offset] = instruction
+        return instruction
+
+    def update(self, instructions):
+        """
+        adds instructions which were decoded by a DecodeCache of the same code, e.g. in a worker process
+        """
+        self.__instructions.update(instructions)
+
+    def instructions(self, start, length, itBlocks=False):
+        """
+        returns (address, mnemonic, op_str) of the instructions of the gadget at start
+        """
+        to_return = []
+        index = start
+        end = start + length
+        context = None
+
+        while index < end:
+            if context is not None:
+                instruction = context.pop(0)
+            else:
+                instruction = self.get(index)
+                if itBlocks and instruction[1].startswith('it'):
+                    context = self.decodeRange(index, end)
+                    instruction = context.pop(0)
+            size, mnemonic, op_str = instruction
+
+            to_return.append((self.__address + index, mnemonic, op_str))
+            index += size
+
+        return to_return
+
+    def clear(self):
+        """
+        removes all decoded instructions
+        """
+        self.__instructions = {}
+
+    def prune(self, records):
+        """
+        keeps only the instructions of the gadget records (start, length, instruction count)
+        """
+        self.__instructions = self.export(records)
+
+    def export(self, records):
+        """
+        returns the decoded instructions of the gadget records (start, length, instruction count)
+        """
+        instructions = {}
+        for i in range(0, len(records), 3):
+            index = records[i]
+            end = index + records[i + 1]
+            while index < end:
+                instruction = self.__instructions.get(index)
+                if instruction is None:
+                    break
+                instructions[index] = instruction
+                index += instruction[0]
+
+        return instructions
+
+    def decodeRange(self, start, end):
+        """
+        decodes code[start:end] in one pass without using the cache
+        This is needed for instructions which depend on their predecessors, e.g. instructions in a thumb IT block.
+        """
+        return [(size, intern(mnemonic), intern(op_str)) for address, size, mnemonic, op_str in self.__disassembler.disasm_lite(self.__code[start:end], self.__address + start)]
+
+
+# State of the running chunk search. It is set before the worker processes are forked,
+# so the workers inherit the section bytes instead of receiving them pickled.
+_chunkSearch = None
+
+
+def _searchChunk(chunk):
+    return _chunkSearch[0]._searchChunk(chunk)
+
+
 class Ropper(object):
 
+    CHUNK_SIZE = 0x40000
+    MIN_CHUNK_SIZE = 0x2000
+    PAGE_SIZE = 0x1000
+
     def __init__(self, callback=None):
         """
         callback function signature:
@@ -59,13 +192,46 @@ class Ropper(object):
         """
         super(Ropper, self).__init__()
         self.__callback = callback
-        self.__cs = None
+        self.__cs = {}
+        self.__decodeStatistics = (0, 0)
+        self.__pageCache = None
+
+    @property
+    def pageCache(self):
+        """
+        cache of the gadget records of code pages, e.g. ropper.cache.PageCache, or None
+        If it is set, a section is searched page by page and only the pages which are not in the cache are scanned.
+        """
+        return self.__pageCache
+
+    @pageCache.setter
+    def pageCache(self, pageCache):
+        self.__pageCache = pageCache
+
+    @property
+    def decodeStatistics(self):
+        """
+        (hits, misses) of the decode caches used by the last gadget search
+        """
+        return self.__decodeStatistics
 
 
     def __getCs(self, arch):
-        if not self.__cs or self.__cs.arch != arch.arch or self.__cs.mode != arch.mode:
-            self.__cs = capstone.Cs(arch.arch, arch.mode)
-        return self.__cs
+        """
+        returns a capstone handle for arch. The handles are kept per architecture and mode, with detail mode off.
+        """
+        cs = self.__cs.get((arch.arch, arch.mode))
+        if cs is None:
+            cs = capstone.Cs(arch.arch, arch.mode)
+            cs.detail = False
+            self.__cs[(arch.arch, arch.mode)] = cs
+        return cs
+
+    def createDecoder(self, arch, code, address):
+        """
+        returns a DecodeCache of code at address, e.g. to create the gadgets of a GadgetTable loaded from the cache
+        """
+        return DecodeCache(self.__getCs(arch), code, address, arch.maxInstructionLength)
 
     def assemble(self, code, arch=x86, format=Format.HEX):
         if 'keystone' not in globals():
@@ -274,210 +440,505 @@ class Ropper(object):
                     toReturn.append(pprg)
         return toReturn
 
-    def searchGadgets(self, binary, instructionCount=5, gtype=GadgetType.ALL, multiprocessing=False):
+    def searchGadgets(self, binary, instructionCount=5, gtype=GadgetType.ALL, multiprocessing=False, table=False, lazy=False, order=GadgetOrder.TEXT):
+        for searched, gadgets in self.searchGadgetsInBinaries([binary], instructionCount, gtype, multiprocessing, table, lazy, order):
+            return gadgets
+
+    def searchGadgetsInBinaries(self, binaries, instructionCount=5, gtype=GadgetType.ALL, multiprocessing=False, table=False, lazy=False, order=GadgetOrder.TEXT):
+        """
+        searches the gadgets of several binaries
+        With multiprocessing the sections of all binaries are queued into one pool of worker processes.
+        yields (binary, gadgets) as soon as all sections of a binary are searched
+        The gadgets are sorted by their instruction strings, by address (order=GadgetOrder.ADDRESS) or not at all (order=GadgetOrder.NONE).
+        If table is True, the gadgets are returned in a GadgetTable instead of a list.
+        If lazy is True, the gadgets are returned in a lazy GadgetTable, which disassembles a gadget when its instructions are needed.
+        A lazy table is not sorted by instruction strings.
+        """
+        def collection(binary):
+            return GadgetTable(binary.checksum, binary.arch, lazy) if table or lazy else []
+
+        binaries = list(binaries)
+        self.__decodeStatistics = (0, 0)
+        for binary in binaries:
+            if Gadget.IMAGE_BASES.get(binary.checksum) == None:
+                Gadget.IMAGE_BASES[binary.checksum] = binary.originalImageBase
+
+        if not multiprocessing:
+            for binary in binaries:
+                gadgets = collection(binary)
+                for section in binary.executableSections:
+                    if self.__callback:
+                        self.__callback(section, None, 0)
+                    decoder, records, endings, shadowed = self.__searchSectionSingle(section, binary, instructionCount, gtype)
+                    self.__collectGadgets(gadgets, section, binary, decoder, records, endings, shadowed=shadowed)
+
+                yield binary, self.__sortGadgets(gadgets, order)
+            return
+
+        if mp.get_start_method() != 'fork':
+            mp.set_start_method('fork', force=True)
+
+        sections = []
+        owners = []
+        remaining = [0] * len(binaries)
+        results = [collection(binary) for binary in binaries]
+        for binary_index, binary in enumerate(binaries):
+            for section in binary.executableSections:
+                sections.append((section, binary))
+                owners.append(binary_index)
+                remaining[binary_index] += 1
+
+        for binary_index, binary in enumerate(binaries):
+            if not remaining[binary_index]:
+                yield binary, results[binary_index]
+
+        for section_index, decoder, records, endings, digests, shadowed in self.__searchSectionsForked(sections, instructionCount, gtype, lazy):
+            section, binary = sections[section_index]
+            binary_index = owners[section_index]
+            self.__collectGadgets(results[binary_index], section, binary, decoder, records, endings, order, digests, shadowed)
+            remaining[binary_index] -= 1
+            if not remaining[binary_index]:
+                yield binary, self.__sortGadgets(results[binary_index], order)
+                results[binary_index] = None
+
+    def __collectGadgets(self, gadgets, section, binary, decoder, records, endings, order=GadgetOrder.NONE, digests=None, shadowed=None):
+        """
+        adds the gadgets of a searched section to a list or a GadgetTable
+        The gadgets of a list are sorted by order first. So the final sort only merges the sorted sections while the workers search the other sections.
+        digests are the hashes of the gadget bytes if the workers computed them already
+        shadowed are the records the merge dropped, see __mergeRecords. A table keeps them to narrow the search later.
+        """
+        if isinstance(gadgets, GadgetTable):
+            # the table creates the gadgets later, so only the instructions of the found gadgets are kept
+            if gadgets.lazy:
+                decoder.clear()
+            else:
+                decoder.prune(records)
+            gadgets.addSection(section.name, decoder, records, endings, digests, shadowed)
+            found = gadgets[len(gadgets) - len(endings):]
+        else:
+            found = sortGadgets(self.__createGadgets(binary.arch, decoder, binary.checksum, section.name, records), order)
+            gadgets.extend(found)
+
+        if self.__callback:
+            self.__callback(section, found, 1.0)
+
+    def __sortGadgets(self, gadgets, order):
+        if isinstance(gadgets, GadgetTable) and gadgets.lazy and order == GadgetOrder.TEXT:
+            # sorting needs the instruction strings, so a lazy table stays in the order the gadgets were found
+            return gadgets
+        return sortGadgets(gadgets, order)
+
+    def iterGadgets(self, binary, instructionCount=5, gtype=GadgetType.ALL, multiprocessing=False, ordered=False):
+        """
+        searches the gadgets of binary and yields them in lists as soon as a chunk of a section is searched
+        Every gadget address is yielded once. If ordered is True, the lists are yielded in section and chunk order and every list is sorted by address.
+        """
+        self.__decodeStatistics = (0, 0)
         if Gadget.IMAGE_BASES.get(binary.checksum) == None:
             Gadget.IMAGE_BASES[binary.checksum] = binary.originalImageBase
-        gadgets = []
-        for section in binary.executableSections:
 
-            if self.__callback:
-                self.__callback(section, None, 0)
+        sections = [(section, binary) for section in binary.executableSections]
+        if multiprocessing:
+            if mp.get_start_method() != 'fork':
+                mp.set_start_method('fork', force=True)
+            chunks = self.__scanSectionsForked(sections, instructionCount, gtype, ordered)
+        else:
+            chunks = self.__scanSections(sections, instructionCount, gtype)
+
+        starts = [set() for section in sections]
+        for section_index, task_index, decoder, found, digests, last in chunks:
+            records = array('I')
+            merged, endings, digests, shadowed = self.__mergeRecords(found)
+            for i in range(0, len(merged), 3):
+                if merged[i] not in starts[section_index]:
+                    starts[section_index].add(merged[i])
+                    records.extend(merged[i:i + 3])
+
+            section = sections[section_index][0]
+            gadgets = self.__createGadgets(binary.arch, decoder, binary.checksum, section.name, records)
+            if ordered:
+                gadgets.sort(key=lambda gadget: gadget.address)
+            if last:
+                starts[section_index] = None
+                if self.__callback:
+                    self.__callback(section, gadgets, 1.0)
+            if gadgets:
+                yield gadgets
 
-            if not multiprocessing:
-                newGadgets = self._searchGadgetsSingle(section=section, binary=binary, instruction_count=instructionCount, gtype=gtype)
-            else:
-                if mp.get_start_method() != 'fork':
-                    mp.set_start_method('fork', force=True)
-                newGadgets = self._searchGadgetsForked(section=section, binary=binary, instruction_count=instructionCount, gtype=gtype)
+    def _searchGadgetsSingle(self, section, binary, instruction_count=5, gtype=GadgetType.ALL):
+        gadgets = []
+        decoder, records, endings, shadowed = self.__searchSectionSingle(section, binary, instruction_count, gtype)
+        self.__collectGadgets(gadgets, section, binary, decoder, records, endings)
 
-            gadgets.extend(newGadgets)
+        return gadgets
 
-        return sorted(gadgets, key=Gadget.simpleInstructionString)
+    def __searchSectionSingle(self, section, binary, instruction_count, gtype):
+        """
+        searches a section in this process
+        returns the decoder, the gadget records, the ending of every record and the shadowed records
+        """
+        for decoder, found in self.__scanSection(section, binary, instruction_count, gtype):
+            pass
 
-    def _searchGadgetsSingle(self, section, binary, instruction_count=5, gtype=GadgetType.ALL):
+        records, endings, digests, shadowed = self.__mergeRecords(found)
+        return decoder, records, endings, shadowed
 
-        toReturn = []
+    def __scanSection(self, section, binary, instruction_count, gtype, batch_size=None):
+        """
+        searches a section in this process
+        yields (decoder, records per ending) after every batch_size bytes of the section or once if batch_size is None
+        """
         code = bytes(bytearray(section.bytes))
         # TODO: Another solution should be used here. This is a hack for compatibility reasons. to resolve the gadget address calculation of segments of elf files have a different base address if calculated segment.virtualAddress - segment.offset 
         offset = section.offset - (binary.originalImageBase - (section.virtualAddress - section.offset))
         #offset = section.offset
 
         arch = binary.arch
+        endings = arch.endings[gtype]
+        found = [array('I') for ending in endings]
+        max_progress = float(len(code))
+        decoder = DecodeCache(self.__getCs(arch), code, offset, arch.maxInstructionLength)
+        batch_end = batch_size
+
+        scanner = arch.endingScanner(gtype)
+        if self.__pageCache is not None and not batch_size:
+            self.__scanPages(decoder, arch, scanner, gtype, 0, len(code), instruction_count, found, section)
+            self.__addDecodeStatistics(decoder.hits, decoder.misses)
+            yield decoder, found
+            return
+
+        for index, ending_index, bound in scanner.scan(code):
+            if batch_size and index >= batch_end:
+                yield decoder, found
+                found = [array('I') for ending in endings]
+                batch_end = index - index % batch_size + batch_size
+
+            self.__gatherGadgetsAt(decoder, arch, index, bound, scanner.matcher(ending_index), instruction_count, found[ending_index])
 
-        max_progress = len(code) * len(arch.endings[gtype])
-
-        vaddrs = set()
-        for ending in arch.endings[gtype]:
-            offset_tmp = 0
-            tmp_code = code[:]
-
-            match = re.search(ending[0], tmp_code)
-            while match:
-                offset_tmp += match.start()
-                index = match.start()
-
-                if offset_tmp % arch.align == 0:
-                    #for x in range(arch.align, (depth + 1) * arch.align, arch.align): # This can be used if you want to use a bytecount instead of an instruction count per gadget
-                    none_count = 0
-
-                    for x in range(0, index+1, arch.align):
-                        code_part = tmp_code[index - x:index + ending[1]]
-                        gadget, leng = self.__createGadget(arch, code_part, offset + offset_tmp - x, ending,binary.checksum, section.name)
-                        if gadget:
-                            if leng > instruction_count:
-                                break
-                            if gadget:
-                                if gadget.address not in vaddrs:
-                                    vaddrs.update([gadget.address])
-                                    toReturn.append(gadget)
-                            none_count = 0
-                        else:
-                            none_count += 1
-                            if none_count == arch.maxInvalid:
-                                break
-
-                tmp_code = tmp_code[index+arch.align:]
-                offset_tmp += arch.align
-
-                match = re.search(ending[0], tmp_code)
+            if self.__callback:
+                self.__callback(section, [], index / max_progress)
 
-                if self.__callback:
-                    progress = arch.endings[gtype].index(ending) * len(code) + len(code) - len(tmp_code)
-                    self.__callback(section, toReturn, float(progress) / max_progress)
+        self.__addDecodeStatistics(decoder.hits, decoder.misses)
+        yield decoder, found
 
-        if self.__callback:
-            self.__callback(section, toReturn, 1.0)
+    def __scanSections(self, sections, instruction_count, gtype):
+        """
+        searches a list of (section, binary) tuples in this process
+        yields (section index, chunk index, decoder, records per ending, None, last chunk of the section)
+        The None takes the place of the digests, which are computed by the worker processes of a forked search.
+        """
+        for section_index, (section, binary) in enumerate(sections):
+            if self.__callback:
+                self.__callback(section, None, 0)
 
-        return toReturn
+            batches = self.__scanSection(section, binary, instruction_count, gtype, Ropper.MIN_CHUNK_SIZE)
+            decoder, found = next(batches)
+            chunk_index = 0
+            for next_decoder, next_found in batches:
+                yield section_index, chunk_index, decoder, found, None, False
+                decoder, found = next_decoder, next_found
+                chunk_index += 1
+            yield section_index, chunk_index, decoder, found, None, True
 
     def _searchGadgetsForked(self, section, binary, instruction_count=5, gtype=GadgetType.ALL):
+        gadgets = []
+        for section_index, decoder, records, endings, digests, shadowed in self.__searchSectionsForked([(section, binary)], instruction_count, gtype):
+            self.__collectGadgets(gadgets, section, binary, decoder, records, endings)
 
-        to_return = []
-        code = bytes(bytearray(section.bytes))
-
-        processes = []
-        arch = binary.arch
-
-        max_progress = len(code) * len(arch.endings[gtype])
-
-        ending_queue = JoinableQueue()
-        gadget_queue = Queue()
-        tmp_code = code[:]
-
-        process_count = min(cpu_count()+1, len(arch.endings[gtype]))
-        for ending in arch.endings[gtype]:
-            ending_queue.put(ending)
-
-        for cpu in range(process_count):
-            ending_queue.put(None)
-
-        # TODO: Another solution should be used here. This is a hack for compatibility reasons. to resolve the gadget address calculation of segments of elf files have a different base address if calculated segment.virtualAddress - segment.offset 
-        offset = section.offset - (binary.originalImageBase - (section.virtualAddress - section.offset))
-
-        for cpu in range(process_count):
-            processes.append(Process(target=self.__gatherGadgetsByEndings, args=(tmp_code, arch, binary.checksum, section.name, offset, ending_queue, gadget_queue, instruction_count), name="GadgetSearch%d"%cpu))
-            processes[cpu].daemon=True
-            processes[cpu].start()
-
-
-
-        count = 0
-        ending_count = 0
-        if self.__callback:
-            self.__callback(section, to_return, 0)
-        while ending_count < len(arch.endings[gtype]):
-            gadgets = gadget_queue.get()
-            if gadgets != None:
-                to_return.extend(gadgets)
-
-                ending_count += 1
-                if self.__callback:
-                    self.__callback(section, to_return, float(ending_count) / len(arch.endings[gtype]))
-
-        return to_return
+        return gadgets
 
-    def __gatherGadgetsByEndings(self,code, arch, fileName, sectionName, offset, ending_queue, gadget_queue, instruction_count):
+    def __searchSectionsForked(self, sections, instruction_count, gtype, lazy=False):
+        """
+        searches a list of (section, binary) tuples with one pool of worker processes
+        yields (section index, decoder, records, endings, digests, shadowed records) as soon as all chunks of a section are searched
+        digests are the hashes of the gadget bytes or None if the section was searched in this process.
+        If lazy is True, the workers do not send back the instructions of the gadgets.
+        """
+        results = [{} for section in sections]
+        for section_index, task_index, decoder, found, digests, last in self.__scanSectionsForked(sections, instruction_count, gtype, lazy=lazy):
+            results[section_index][task_index] = (found, digests)
+            if not last:
+                continue
 
-        #try:
-        while True:
-            ending = ending_queue.get()
-            if ending is None:
-                ending_queue.task_done()
-                break
+            section, binary = sections[section_index]
+            # chunks own the endings inside of them, so the results are merged in the same order as a single search would have found them
+            found = [array('I') for ending in binary.arch.endings[gtype]]
+            digests = [array('q') for ending in binary.arch.endings[gtype]]
+            for chunk_index in sorted(results[section_index]):
+                chunk_found, chunk_digests = results[section_index][chunk_index]
+                if chunk_digests is None:
+                    digests = None
+                for ending_index, records in enumerate(chunk_found):
+                    found[ending_index].extend(records)
+                    if digests is not None:
+                        digests[ending_index].extend(chunk_digests[ending_index])
+            results[section_index] = None
+
+            records, endings, digests, shadowed = self.__mergeRecords(found, digests)
+            yield section_index, decoder, records, endings, digests, shadowed
+
+    def __scanSectionsForked(self, sections, instruction_count, gtype, ordered=False, lazy=False):
+        """
+        searches a list of (section, binary) tuples with one pool of worker processes
+        yields (section index, chunk index, decoder, records per ending, last chunk of the section) as soon as a chunk is searched
+        If ordered is True, the chunks are yielded in section and chunk order.
+        """
+        global _chunkSearch
+
+        units = []
+        for section, binary in sections:
+            # TODO: Another solution should be used here. This is a hack for compatibility reasons. to resolve the gadget address calculation of segments of elf files have a different base address if calculated segment.virtualAddress - segment.offset 
+            offset = section.offset - (binary.originalImageBase - (section.virtualAddress - section.offset))
+            units.append((bytes(bytearray(section.bytes)), binary.arch, binary.checksum, section.name, offset))
+
+        process_count = cpu_count()
+        chunk_size = self.__chunkSize(sum([len(unit[0]) for unit in units]), process_count)
+        if self.__pageCache is not None:
+            # the chunks consist of whole pages, so the pages are the same as in a search in this process
+            chunk_size -= chunk_size % Ropper.PAGE_SIZE
+        tasks = []
+        for section_index, unit in enumerate(units):
+            for start, end in self.__createChunks(len(unit[0]), unit[1], chunk_size):
+                tasks.append((len(tasks), section_index, start, end))
+
+        if len(tasks) < 2:
+            for chunk in self.__scanSections(sections, instruction_count, gtype):
+                yield chunk
+            return
+
+        decoders = [None] * len(units)
+        remaining = [0] * len(units)
+        done = [0] * len(units)
+        for task_index, section_index, start, end in tasks:
+            remaining[section_index] += 1
+
+        # the section bytes are inherited by the forked workers, they only send back gadget records and the instructions they consist of
+        _chunkSearch = (self, units, gtype, instruction_count, lazy)
+        pool = Pool(min(process_count, len(tasks)))
+        try:
+            search = pool.imap if ordered else pool.imap_unordered
+            for task_index, found, digests, instructions, hits, misses in search(_searchChunk, tasks):
+                task_index, section_index, start, end = tasks[task_index]
+                section = sections[section_index][0]
+                code, arch, fileName, sectionName, offset = units[section_index]
+                self.__addDecodeStatistics(hits, misses)
+
+                if decoders[section_index] is None:
+                    decoders[section_index] = DecodeCache(self.__getCs(arch), code, offset, arch.maxInstructionLength)
+                    if self.__callback:
+                        self.__callback(section, None, 0)
+                decoder = decoders[section_index]
+                decoder.update(instructions)
+
+                done[section_index] += end - start
+                remaining[section_index] -= 1
+                if remaining[section_index]:
+                    if self.__callback:
+                        self.__callback(section, [], float(done[section_index]) / len(code))
+                else:
+                    decoders[section_index] = None
+                yield section_index, task_index, decoder, found, digests, not remaining[section_index]
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _chunkSearch = None
+
+    def __chunkSize(self, length, process_count):
+        """
+        returns a chunk size, which is small enough to balance the work over all processes
+        """
+        chunk_size = int(length / (process_count * 4))
+        return max(Ropper.MIN_CHUNK_SIZE, min(Ropper.CHUNK_SIZE, chunk_size))
 
-            gadgets = self.__gatherGadgetsByEnding(code, arch, fileName, sectionName, offset, ending, instruction_count)
+    def __createChunks(self, length, arch, chunk_size):
+        """
+        splits a section into byte ranges of chunk_size bytes
+        """
+        chunk_size -= chunk_size % arch.align
 
-            gadget_queue.put(gadgets)
-            ending_queue.task_done()
+        return [(start, min(start + chunk_size, length)) for start in range(0, length, chunk_size)]
 
+    def _searchChunk(self, task):
+        """
+        searches the gadgets of all endings between chunk start and chunk end
+        The scan starts overlap bytes before the chunk, so gadget start bounds are the same as in a search of the whole section.
+        returns the gadget records per ending, the hashes of their bytes and the instructions which are needed to create the gadgets
+        The workers are forked, so their hashes are the same as the hashes of the parent process.
+        """
+        task_index, section_index, start, end = task
+        ropper, units, gtype, instruction_count, lazy = _chunkSearch
+        code, arch, fileName, sectionName, offset = units[section_index]
+        endings = arch.endings[gtype]
+        found = [array('I') for ending in endings]
+        decoder = DecodeCache(self.__getCs(arch), code, offset, arch.maxInstructionLength)
 
-        #except BaseException as e:
-        #    raise RopperError(e)
+        scanner = arch.endingScanner(gtype)
+        self.__scanPages(decoder, arch, scanner, gtype, start, end, instruction_count, found)
 
+        instructions = {}
+        if not lazy:
+            for records in found:
+                instructions.update(decoder.export(records))
 
-    def __gatherGadgetsByEnding(self, code, arch, fileName, sectionName, offset, ending, instruction_count):
-        vaddrs = set()
-        offset_tmp = 0
+        digests = [array('q', [hash(code[records[i]:records[i] + records[i + 1]]) for i in range(0, len(records), 3)]) for records in found]
 
-        tmp_code = code[:]
-        to_return = []
-        match = re.search(ending[0], tmp_code)
+        return task_index, found, digests, instructions, decoder.hits, decoder.misses
 
-        while match:
-            offset_tmp += match.start()
-            index = match.start()
+    def __scanRange(self, decoder, arch, scanner, start, end, instruction_count, found):
+        """
+        appends the records of the gadgets of all endings between start and end to found
+        The scan starts overlap bytes before start, so gadget start bounds are the same as in a search of the whole section.
+        """
+        # an ending at start can belong to a gadget which starts up to this many bytes before start
+        overlap = instruction_count * arch.maxInstructionLength
+        for index, ending_index, bound in scanner.scan(decoder.code, max(0, start - overlap), end):
+            if index < start:
+                continue
+            self.__gatherGadgetsAt(decoder, arch, index, bound, scanner.matcher(ending_index), instruction_count, found[ending_index])
 
-            if offset_tmp % arch.align == 0:
-                #for x in range(arch.align, (depth + 1) * arch.align, arch.align): # This can be used if you want to use a bytecount instead of an instruction count per gadget
+    def __scanPages(self, decoder, arch, scanner, gtype, start, end, instruction_count, found, section=None):
+        """
+        appends the records of the gadgets of all endings between start and end to found
+        With a page cache the range is searched page by page. The records of a page only depend on the bytes of the page and
+        of the margins around it, which are scanned or decoded for it. So the records of a page are cached by the hash of these bytes.
+        """
+        if self.__pageCache is None:
+            self.__scanRange(decoder, arch, scanner, start, end, instruction_count, found)
+            return
+
+        code = decoder.code
+        before = instruction_count * arch.maxInstructionLength
+        # the ending, a branch delay slot and an instruction which is decoded behind the end of a gadget
+        after = max([size for pattern, size in arch.endings[gtype]] + [0]) + arch.align + arch.maxInstructionLength
+        for page_start in range(start, end, Ropper.PAGE_SIZE):
+            page_end = min(page_start + Ropper.PAGE_SIZE, end)
+            window_start = max(0, page_start - before)
+            window = code[window_start:min(len(code), page_end + after)]
+            key = self.__pageCache.key(arch, gtype, instruction_count, window, page_start - window_start, page_end - window_start)
+            page_found = self.__pageCache.get(key, window_start)
+            if page_found is None:
+                page_found = [array('I') for records in found]
+                self.__scanRange(decoder, arch, scanner, page_start, page_end, instruction_count, page_found)
+                self.__pageCache.put(key, page_found, window_start)
+
+            for records, page_records in zip(found, page_found):
+                records.extend(page_records)
+            if section is not None and self.__callback:
+                self.__callback(section, [], page_end / float(len(code)))
+
+    def __addDecodeStatistics(self, hits, misses):
+        self.__decodeStatistics = (self.__decodeStatistics[0] + hits, self.__decodeStatistics[1] + misses)
+
+    def __gatherGadgetsAt(self, decoder, arch, index, bound, matcher, instruction_count, records):
+        """
+        disassembles backwards from the ending at index and appends a (start, length, instruction count) record for every valid gadget to records
+        matcher is the (match, prefixes, size) tuple of the ending, see EndingScanner.matcher
+        """
+        end = index + matcher[2]
+        if arch.hasBranchDelaySlot and end + arch.align < len(decoder.code):
+            end += arch.align
+
+        none_count = 0
+        bad_instructions = arch.badInstructionSet
+        #for x in range(arch.align, (depth + 1) * arch.align, arch.align): # This can be used if you want to use a bytecount instead of an instruction count per gadget
+        for x in range(0, index - bound + 1, arch.align):
+            length, leng = self.__measureGadget(arch, decoder, index - x, end, matcher, bad_instructions)
+            if length:
+                if leng > instruction_count:
+                    break
+                records.extend((index - x, length, leng))
                 none_count = 0
+            else:
+                none_count += 1
+                if none_count == arch.maxInvalid:
+                    break
 
-                for x in range(0, index+1, arch.align):
-                    start = index - x
-                    end = index + ending[1] + arch.align if (arch.hasBranchDelaySlot and index + ending[1] + arch.align < len(tmp_code)) else index + ending[1]
-                    code_part = tmp_code[start:end]
-                    gadget, leng = self.__createGadget(arch, code_part, offset + offset_tmp - x , ending, fileName, sectionName)
-                    if gadget:
-                        if leng > instruction_count:
-                            break
-                        if gadget:
-                            to_return.append(gadget)
-                        none_count = 0
-                    else:
-                        none_count += 1
-                        if none_count == arch.maxInvalid:
-                            break
-
-            tmp_code = tmp_code[index+arch.align:]
-            offset_tmp += arch.align
-
-            match = re.search(ending[0], tmp_code)
+    def __mergeRecords(self, found, digests=None):
+        """
+        found contains one record array per ending. If endings share a start address, the gadget of the first ending is kept.
+        digests contains the hashes of the records per ending or is None.
+        returns the merged records, the ending of every record, the merged digests or None and the dropped
+        (start, length, instruction count, ending) records, which are shadowed by the gadget of an earlier ending
+        """
+        to_return = array('I')
+        endings = array('B')
+        merged = array('q') if digests is not None else None
+        shadowed = array('I')
+        starts = set()
+        for ending_index, records in enumerate(found):
+            for i in range(0, len(records), 3):
+                if records[i] not in starts:
+                    starts.add(records[i])
+                    to_return.extend(records[i:i + 3])
+                    endings.append(ending_index)
+                    if merged is not None:
+                        merged.append(digests[ending_index][i // 3])
+                else:
+                    shadowed.extend(records[i:i + 3])
+                    shadowed.append(ending_index)
 
-        return to_return
+        return to_return, endings, merged, shadowed
 
-    def __createGadget(self, arch, code_str, codeStartAddress, ending, binary=None, section=None):
-        gadget = Gadget(binary, section, arch)
+    def __measureGadget(self, arch, decoder, start, end, matcher, bad_instructions):
+        """
+        returns (length in bytes, instruction count) of the gadget at start or (0, -1) if there is no valid gadget
+        """
         hasret = False
-        if codeStartAddress == 0x0000000001b34d74:
-            print("found")
-        disassembler = self.__getCs(arch)
+        code = decoder.code
+        get = decoder.get
+        match, prefixes = matcher[0], matcher[1]
+        has_it_blocks = arch.hasITBlocks
+        has_delay_slot = arch.hasBranchDelaySlot
+        index = start
+        context = None
+        length = 0
+        leng = 0
+
+        while index < end:
+            if context is not None:
+                if not context:
+                    break
+                instruction = context.pop(0)
+            else:
+                instruction = get(index)
+                if instruction is None or index + instruction[0] > end:
+                    break
+                if has_it_blocks and instruction[1].startswith('it'):
+                    context = decoder.decodeRange(index, end)
+                    instruction = context.pop(0)
+            size, mnemonic, op_str = instruction
 
-        for i in disassembler.disasm(code_str, codeStartAddress):
-            if re.match(ending[0], i.bytes):
+            if not hasret and code[index:index + 1] in prefixes and match(code, index, index + size):
                 hasret = True
 
-            if hasret or i.mnemonic not in arch.badInstructions:
-                gadget.append(
-                    i.address, i.mnemonic,i.op_str, bytes=i.bytes)
+            bad = mnemonic in bad_instructions
+            if hasret or not bad:
+                length = index + size - start
+                leng += 1
 
-            if (hasret and not arch.hasBranchDelaySlot) or i.mnemonic in arch.badInstructions:
+            if (hasret and not has_delay_slot) or bad:
                 break
+            index += size
 
+        if hasret and leng > 0:
+            return length, leng
+        return 0, -1
 
+    def __createGadgets(self, arch, decoder, binary, section, records):
+        """
+        creates the gadgets of (start, length, instruction count) records
+        """
+        return [self.__createGadget(arch, decoder, records[i], records[i + 1], binary, section) for i in range(0, len(records), 3)]
 
-        leng = len(gadget)
-        if hasret and leng > 0:
-            return gadget,leng
-        return None, -1
+    def __createGadget(self, arch, decoder, start, length, binary=None, section=None):
+        gadget = Gadget(binary, section, arch)
+        for address, mnemonic, op_str in decoder.instructions(start, length, arch.hasITBlocks):
+            gadget.append(address, mnemonic, op_str)
+
+        gadget._setBuffer(decoder.code, start, length)
+        return gadget
 
 
     def __disassembleBackward(self, section, binary, vaddr,offset, count):
@@ -516,7 +977,7 @@ class Ropper(object):
             raise RopperError('The address doesn\'t have the correct alignment')
         Gadget.IMAGE_BASES[binary.checksum] = binary.imageBase
         code = bytes(bytearray(section.bytes))
-        disassembler = capstone.Cs(binary.arch.arch, binary.arch.mode)
+        disassembler = self.__getCs(binary.arch)
 
         if count < 0:
             return self.__disassembleBackward(section, binary, vaddr, offset, count*-1)
@@ -33,9 +33,10 @@ try:
 except:
     pass
 import ropper.z3helper as z3helper
+import capstone
 from ropper.common.error import RopperError
 from ropper.common.utils import isHex
-from ropper.gadget import Category
+from ropper.gadget import Category, GadgetTable, SuffixIndex
 from ropper.semantic import ExpressionBuilder, Analyser, Slicer, create_register_expression, create_number_expression
 import time
 import sys
@@ -45,6 +46,14 @@ class Searcher(object):
 
     CONSTRAINT_REGEX = '(\[?[a-zA-Z0-9]+\]?)([\+\*\-=/])?=(\[?[a-zA-Z0-9]+\]?)$'
 
+    # registers which capstone reports and archinfo might not know, they never hold a constrained value
+    FLAG_REGISTERS = ('rflags', 'eflags', 'flags', 'fpsw', 'mxcsr', 'nzcv', 'cpsr', 'apsr', 'fpscr', 'fpsr')
+
+    def __init__(self):
+        super(Searcher, self).__init__()
+        self.__cs = {}
+        self.__access = {}
+
     def prepareFilter(self, filter):
         filter = filter.replace('\\','\\\\')
         filter = filter.replace('(','\\(')
@@ -89,12 +98,6 @@ class Searcher(object):
             to_return.append((reg1,reg2))
         return to_return
 
-    def __isSimilarGadget(self, gadget, found_gadgets):
-        for fg in found_gadgets:
-            if bytes(gadget.bytes).endswith(bytes(fg.bytes)):
-                return True
-        return False
-
     def __areRegistersNotUsed(self, constraint_values, semantic_info):
 
         for reg in constraint_values:
@@ -102,6 +105,70 @@ class Searcher(object):
                 return True
         return False
 
+    def __registerAccess(self, gadget):
+        """
+        returns the names of the registers the instructions of gadget write and read, including implicit accesses,
+        or (None, None) if capstone cannot tell them. The result is kept per gadget bytes.
+        """
+        code = bytes(gadget.bytes)
+        access = self.__access.get(code)
+        if access is None:
+            cs = self.__cs.get(gadget.arch)
+            if cs is None:
+                cs = self.__cs[gadget.arch] = capstone.Cs(gadget.arch.arch, gadget.arch.mode)
+                cs.detail = True
+            written = set()
+            read = set()
+            try:
+                for instruction in cs.disasm(code, gadget.address):
+                    regs_read, regs_write = instruction.regs_access()
+                    read.update([cs.reg_name(reg) for reg in regs_read])
+                    written.update([cs.reg_name(reg) for reg in regs_write])
+                access = (written, read)
+            except capstone.CsError:
+                access = (None, None)
+            self.__access[code] = access
+        return access
+
+    def __isAccessed(self, arch, register, registers):
+        """
+        True if register shares bytes with one of registers or if this is unknown
+        A name of capstone which archinfo does not know might be the register, apart from the flag registers.
+        """
+        if registers is None or arch.info is None:
+            return True
+        locations = arch.info.registers
+        location = locations.get(arch.getRegisterName(register))
+        if location is None:
+            return True
+        for name in registers:
+            other = locations.get(name)
+            if other is None:
+                if name not in Searcher.FLAG_REGISTERS:
+                    return True
+            elif location[0] < other[0] + other[1] and other[0] < location[0] + location[1]:
+                return True
+        return False
+
+    def mayFulfil(self, gadget, constraints):
+        """
+        False if the register accesses of gadget show that it cannot fulfil the constraints, e.g. ['rdi==rsi']
+        The check does not need the semantic analysis, semanticSearch analyses only the gadgets for which it is True.
+        """
+        return self.__mayFulfil(gadget, z3helper.ConstraintCompiler(None).getSymbols(constraints))
+
+    def __mayFulfil(self, gadget, constraint_values):
+        """
+        syntactic prefilter of the semantic search: False if the gadget does not write a constrained register or does not read its source
+        """
+        written, read = self.__registerAccess(gadget)
+        for set_reg, get_reg in constraint_values:
+            if not self.__isAccessed(gadget.arch, set_reg, written):
+                return False
+            if get_reg is not None and not self.__isAccessed(gadget.arch, get_reg, read):
+                return False
+        return True
+
     def __areStableRegistersClobbered(self, stable_registers, clobbered_registers):
         clobber_reg = False
         for reg in clobbered_registers:
@@ -109,7 +176,14 @@ class Searcher(object):
                 return True
         return False
 
-    def semanticSearch(self, gadgets, constraints, maxLen ,stableRegs=[]):
+    def semanticSearch(self, gadgets, constraints, maxLen ,stableRegs=[], analyse=None, statistics=None):
+        """
+        yields the gadgets which fulfil the constraints, the shortest gadgets first
+        analyse(gadgets) has to set the semantic information of gadgets which are not analysed yet. It is called with the gadgets
+        of one length which can write the constrained registers, so only those are analysed. Without it the gadgets have to be analysed already.
+        The counts of the query are added to the dict statistics: the gadgets which were considered, pruned without the solver,
+        answered by checkedConstraints and solved, the sat and unsat results and the time spent in the solver.
+        """
 
         if 'z3' not in globals():
             raise RopperError('z3 has to be installed in order to use semantic search')
@@ -118,71 +192,80 @@ class Searcher(object):
             raise RopperError('archinfo has to be installed in order to use semantic search')
         if 'pyvex' not in globals():
             raise RopperError('pyvex has to be installed in order to use semantic search')
-        to_return = []
-        count = 0
-        max_count = len(gadgets)
-        count = 0
-        found = False
-        found_gadgets = []
+        if statistics is None:
+            statistics = {}
+        for key in ('considered', 'pruned', 'cached', 'solved', 'sat', 'unsat'):
+            statistics.setdefault(key, 0)
+        statistics.setdefault('solver_time', 0.0)
+
+        # a gadget which ends with the bytes of a found gadget is skipped
+        found_gadgets = SuffixIndex()
         slicer = Slicer()
         constraint_key = " ".join(list(set(constraints)))
+        constraint_values = z3helper.ConstraintCompiler(None).getSymbols(constraints)
+        # the constraints are compiled once per architecture, gadgets with the same register versions share a solver
+        # which contains the negated constraint, the expressions of a gadget are pushed and popped again
+        templates = {}
+        solvers = {}
+        builder = ExpressionBuilder()
+        lengths = {}
+        for gadget in gadgets:
+            lengths.setdefault(len(gadget), []).append(gadget)
         for glen in range(1, maxLen+1):
-            for gadget in gadgets:
-                if len(gadget) != glen:
-                    continue
+            length = lengths.get(glen, [])
+            candidates = [gadget for gadget in length if self.__mayFulfil(gadget, constraint_values)]
+            statistics['considered'] += len(length)
+            statistics['pruned'] += len(length) - len(candidates)
+            if analyse is not None:
+                analyse([gadget for gadget in candidates if not gadget.analysed])
+            for gadget in candidates:
                 semantic_info = gadget.info
-                if not semantic_info:
-                    continue
-
-                #constraint_values = self.extractValues(constraints, semantic_info, gadget.arch)
-                cc = z3helper.ConstraintCompiler(gadget.arch, semantic_info)
-                constraint_values = cc.getSymbols(constraints)
-
-                if self.__isSimilarGadget(gadget, found_gadgets) \
+                if not semantic_info \
+                or found_gadgets.endsWithKnown(gadget) \
                 or self.__areRegistersNotUsed(constraint_values, semantic_info) \
                 or self.__areStableRegistersClobbered(stableRegs, semantic_info.clobberedRegisters):
+                    statistics['pruned'] += 1
                     continue
-                constraint_string = cc.compile(';'.join(constraints))
                 if constraint_key not in semantic_info.checkedConstraints:
-                    set_reg = constraint_values[0][0]
-                    slice_instructions = []
+                    template = templates.get(gadget.arch)
+                    if template is None:
+                        template = templates[gadget.arch] = z3helper.ConstraintCompiler(gadget.arch).template(';'.join(constraints))
+                    constraint_term = template.instantiate(semantic_info)
+                    solver = solvers.get(constraint_term)
+                    if solver is None:
+                        solver = solvers[constraint_term] = z3.Solver()
+                        solver.add(z3.Not(builder.build(constraint_term)))
+
                     slice = slicer.slice(semantic_info.expressions, [set_reg for set_reg, get_reg in constraint_values])
-                    count += 1
-                    solver = z3.Solver()
-
-                    expr_len = len(semantic_info.expressions)
-                    expr = None
-                    tmp = None
-
-                    for inst in slice.expressions:
-                       # tmp = inst
-                       # if tmp == False:
-                       #     continue
-                        if expr is None:
-                            expr = inst
-                        else:
-                            expr = 'And(%s, %s)' % (expr, inst)
-
-                    expr = ExpressionBuilder().build(semantic_info.regs, semantic_info.mems, expr, constraint_string)
-                    solver.add(expr)
-                    if solver.check() == z3.unsat:
-                        found = True
-                        found_gadgets.append(gadget)
+                    solver.push()
+                    solver.add(semantic_info.builder.build(('and',) + tuple(slice.expressions)))
+                    start = time.time()
+                    result = solver.check()
+                    statistics['solver_time'] += time.time() - start
+                    solver.pop()
+                    statistics['solved'] += 1
+                    if result == z3.unsat:
+                        statistics['unsat'] += 1
+                        found_gadgets.add(gadget)
                         semantic_info.checkedConstraints[constraint_key] = True
 
                         yield gadget
                     else:
+                        statistics['sat'] += 1
                         semantic_info.checkedConstraints[constraint_key] = False
-                elif semantic_info.checkedConstraints[constraint_key]:
-                    count += 1
-                    found_gadgets.append(gadget)
-                    yield gadget
                 else:
-                    count += 1
+                    statistics['cached'] += 1
+                    if semantic_info.checkedConstraints[constraint_key]:
+                        found_gadgets.add(gadget)
+                        yield gadget
 
 
     def search(self, gadgets, filter, quality = None, pprinter=None):
         filter = self.prepareFilter(filter)
+        if isinstance(gadgets, GadgetTable):
+            # the regex is applied once per distinct gadget and the quality is checked on the instruction counts
+            return list(gadgets.match(filter, quality))
+
         filtered = {}
         count = 0
         max_count = len(gadgets)
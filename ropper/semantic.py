@@ -58,6 +58,13 @@ class Analyser(object):
             self.__work = False
             return
 
+    @property
+    def working(self):
+        """
+        False if the dependencies of the analysis are missing, analyse returns False then
+        """
+        return self.__work
+
     def analyse(self, gadget):
         if not self.__work:
             return False
@@ -78,31 +85,15 @@ class Analyser(object):
     def findSpOffset(self, g, anal, sp ):
         if sp not in anal.regs:
             return 0
-        slicer = Slicer()
-        slice_instructions = []
-        slice = slicer.slice(anal.expressions, [sp])
         solver = z3.Solver()
-
-        expr_len = len(anal.expressions)
-        expr = None
-        tmp = None
-
-        for inst in anal.expressions:
-
-            if not inst:
-                continue
-            if expr is None:
-                expr = inst[0]
-            else:
-                expr = 'And(%s, %s)' % (expr, inst[0])
-
-        if expr:
-            expr = ExpressionBuilder().build(anal.regs, anal.mems, expr)
-            sp1 = anal.regs[sp][0]
-            sp2 = anal.regs[sp][-1]
-            size = int(sp1.split('_')[-1])
-            sp1 = z3.BitVec(sp1, size)
-            sp2 = z3.BitVec(sp2, size)
+        terms = [inst[0] for inst in anal.expressions if inst]
+
+        if terms:
+            builder = anal.builder
+            expr = builder.build(('and',) + tuple(terms))
+            sp1 = builder.symbol(anal.regs[sp][0])
+            sp2 = builder.symbol(anal.regs[sp][-1])
+            size = sp1.size()
             diff = z3.BitVec('diff', size)
             solver.add(z3.And(expr, diff == sp2 - sp1))
             solver.check()
@@ -238,7 +229,6 @@ class Analysis(object):
     @property
     def _memory(self):
         if self.__mem is None:
-            #self.__mem = z3.Array('memory_%d' % self.__mem_counter , z3.BitVecSort(self.__arch.bits), z3.BitVecSort(8))
             self.__mem = 'memory%d_%d_%d' % (self.__mem_counter, self.__arch.bits, 8)
             self.mems.append(self.__mem)
             self.__mem_counter += 1
@@ -251,13 +241,11 @@ class Analysis(object):
         size = size/8
         old = self._memory
         for i in range(int(size)):
-            #old = z3.Store(old, addr+i, z3.Extract((i+1)*8-1,i*8,data))
-
-            value = 'Extract(%d, %d, %s)' % ((i+1)*8-1, i*8, data)
-            old = 'Store(%s, %s + %d, %s)' % (old, addr, i, value)
+            value = ('extract', (i+1)*8-1, i*8, data)
+            old = ('store', old, ('+', addr, i), value)
 
         self.__mem = None
-        return '%s == %s' % (old, self._memory)
+        return ('==', old, self._memory)
 
     def writeRegister(self, offset, size, value):
         reg = self.__arch.translate_register_name(offset & 0xfffffffe, size)
@@ -281,9 +269,9 @@ class Analysis(object):
         reg_list.append('%s_%d_%d' % (reg, count, real_size))
 
         if size < real_size:
-            return 'Extract(%d, 0, %s) == %s' %(size-1,self.__registerAccessors[(reg)][-1],value)
+            return ('==', ('extract', size-1, 0, self.__registerAccessors[(reg)][-1]), value)
         else:
-            return '%s == %s' % (self.__registerAccessors[(reg)][-1], value)
+            return ('==', self.__registerAccessors[(reg)][-1], value)
 
     def __getRegisterAccessor(self, register, size):
         register_list = self.__registerAccessors.get((register))
@@ -324,10 +312,21 @@ class SemanticInformation(object):
         self.spOffset = spOffset
         self._checkedConstraints = {} if checked_constraints is None else checked_constraints
         self.irsb = irsb
+        self.__builder = None
+
     @property
     def checkedConstraints(self):
         return self._checkedConstraints
 
+    @property
+    def builder(self):
+        """
+        the ExpressionBuilder of the expressions, it is not stored with the information
+        """
+        if self.__builder is None:
+            self.__builder = ExpressionBuilder()
+        return self.__builder
+
     def __repr__(self):
         return 'SemanticInformation(%s, %s, %s, %s, %s, %s, %s, %s)' % (repr(self.regs), repr(self.usedRegs), repr(self.clobberedRegisters), repr(self.mems), repr(self.expressions), repr(self.spOffset), repr(self.checkedConstraints), repr(self.irsb))
 
@@ -367,14 +366,14 @@ class ZExpressions(CommandClass):
     @staticmethod
     def const(dest, data, analysis):
         analysis.currentInstruction.tmps[dest] = data.con.value if not math.isnan(data.con.value) else 0
-        return ('BitVecVal(%d, %d)' % (analysis.currentInstruction.tmps[dest], data.con.size), (data.con.value,))
+        return (create_number_expression(int(analysis.currentInstruction.tmps[dest]), data.con.size), (data.con.value,))
 
     @staticmethod
     def rdtmp(dest, data, analysis):
         tmp = '%s_%d' % (str(data), data.result_size(analysis.irsb.tyenv))
         analysis.currentInstruction.tmps[dest] = tmp
         analysis.regs[tmp] = [tmp]
-        return ('%s' % (tmp), (tmp,))
+        return (tmp, (tmp,))
 
     @staticmethod
     def binop(dest, data, analysis):
@@ -413,168 +412,168 @@ class ZOperations(CommandClass):
 
     @staticmethod
     def Iop_Add32(arg1, arg2, analysis):
-        return '%s + %s' % (arg1, arg2)
+        return ('+', arg1, arg2)
 
     @staticmethod
     def Iop_Add16(arg1, arg2, analysis):
-        return '%s + %s' % (arg1, arg2)
+        return ('+', arg1, arg2)
 
     @staticmethod
     def Iop_Add8(arg1, arg2, analysis):
-        return '%s + %s' % (arg1, arg2)
+        return ('+', arg1, arg2)
 
     @staticmethod
     def Iop_Xor32(arg1, arg2, analysis):
-        return '%s ^ %s' % (arg1, arg2)
+        return ('^', arg1, arg2)
 
     @staticmethod
     def Iop_Xor16(arg1, arg2, analysis):
-        return '%s ^ %s' % (arg1, arg2)
+        return ('^', arg1, arg2)
 
     @staticmethod
     def Iop_Xor8(arg1, arg2, analysis):
-        return '%s ^ %s' % (arg1, arg2)
+        return ('^', arg1, arg2)
 
     @staticmethod
     def Iop_Mul32(arg1, arg2, analysis):
-        return '%s * %s' % (arg1, arg2)
+        return ('*', arg1, arg2)
 
     @staticmethod
     def Iop_Mul16(arg1, arg2, analysis):
-        return '%s * %s' % (arg1, arg2)
+        return ('*', arg1, arg2)
 
     @staticmethod
     def Iop_Mul8(arg1, arg2, analysis):
-        return '%s * %s' % (arg1, arg2)
+        return ('*', arg1, arg2)
 
     @staticmethod
     def Iop_Div32(arg1, arg2, analysis):
-        return '%s / %s' % (arg1, arg2)
+        return ('/', arg1, arg2)
 
     @staticmethod
     def Iop_Div16(arg1, arg2, analysis):
-        return '%s / %s' % (arg1, arg2)
+        return ('/', arg1, arg2)
 
     @staticmethod
     def Iop_Div8(arg1, arg2, analysis):
-        return '%s / %s' % (arg1, arg2)
+        return ('/', arg1, arg2)
 
     @staticmethod
     def Iop_Sub32(arg1, arg2, analysis):
-        return '%s - %s' % (arg1, arg2)
+        return ('-', arg1, arg2)
 
     @staticmethod
     def Iop_Sub16(arg1, arg2, analysis):
-        return '%s - %s' % (arg1, arg2)
+        return ('-', arg1, arg2)
 
     @staticmethod
     def Iop_Sub8(arg1, arg2, analysis):
-        return '%s - %s' % (arg1, arg2)
+        return ('-', arg1, arg2)
 
     @staticmethod
     def Iop_Add64(arg1, arg2, analysis):
-        return '%s + %s' % (arg1, arg2)
+        return ('+', arg1, arg2)
 
     @staticmethod
     def Iop_Xor64(arg1, arg2, analysis):
-        return '%s ^ %s' % (arg1, arg2)
+        return ('^', arg1, arg2)
 
     @staticmethod
     def Iop_And64(arg1, arg2, analysis):
-        return '%s & %s' % (arg1, arg2)
+        return ('&', arg1, arg2)
 
     @staticmethod
     def Iop_And32(arg1, arg2, analysis):
-        return '%s & %s' % (arg1, arg2)
+        return ('&', arg1, arg2)
 
     @staticmethod
     def Iop_And16(arg1, arg2, analysis):
-        return '%s & %s' % (arg1, arg2)
+        return ('&', arg1, arg2)
 
     @staticmethod
     def Iop_And8(arg1, arg2, analysis):
-        return '%s & %s' % (arg1, arg2)
+        return ('&', arg1, arg2)
 
     @staticmethod
     def Iop_Or64(arg1, arg2, analysis):
-        return '%s | %s' % (arg1, arg2)
+        return ('|', arg1, arg2)
 
     @staticmethod
     def Iop_Or32(arg1, arg2, analysis):
-        return '%s | %s' % (arg1, arg2)
+        return ('|', arg1, arg2)
 
     @staticmethod
     def Iop_Or16(arg1, arg2, analysis):
-        return '%s | %s' % (arg1, arg2)
+        return ('|', arg1, arg2)
 
     @staticmethod
     def Iop_Or8(arg1, arg2, analysis):
-        return '%s | %s' % (arg1, arg2)
+        return ('|', arg1, arg2)
 
 
     @staticmethod
     def Iop_Mul64(arg1, arg2, analysis):
-        return '%s * %s' % (arg1, arg2)
+        return ('*', arg1, arg2)
 
     @staticmethod
     def Iop_Div64(arg1, arg2, analysis):
-        return '%s / %s' % (arg1, arg2)
+        return ('/', arg1, arg2)
 
     @staticmethod
     def Iop_Sub64(arg1, arg2, analysis):
-        return '%s - %s' % (arg1, arg2)
+        return ('-', arg1, arg2)
 
     @staticmethod
     def Iop_32Uto64(arg1, analysis):
-        return 'ZeroExt(32,%s)' % arg1
+        return ('zext', 32, arg1)
 
     @staticmethod
     def Iop_32to64(arg1, analysis):
-        return 'SignExt(32,%s)' % arg1
+        return ('sext', 32, arg1)
 
     @staticmethod
     def Iop_8to32(arg1, analysis):
-        return 'SignExt(24,%s)' % arg1
+        return ('sext', 24, arg1)
 
     @staticmethod
     def Iop_16to32(arg1, analysis):
-        return 'SignExt(16,%s)' % arg1
+        return ('sext', 16, arg1)
 
     @staticmethod
     def Iop_8to32(arg1, analysis):
-        return 'ZeroExt(24,%s)' % arg1
+        return ('zext', 24, arg1)
 
     @staticmethod
     def Iop_8Uto32(arg1, analysis):
-        return 'ZeroExt(24,%s)' % arg1
+        return ('zext', 24, arg1)
 
     @staticmethod
     def Iop_16Uto32(arg1, analysis):
-        return 'ZeroExt(16,%s)' % arg1
+        return ('zext', 16, arg1)
 
     @staticmethod
     def Iop_64Uto32(arg1, analysis):
-        return 'Extract(31,0,%s)' % arg1
+        return ('extract', 31, 0, arg1)
 
     @staticmethod
     def Iop_64to32(arg1, analysis):
-        return 'Extract(31,0,%s)' % arg1
+        return ('extract', 31, 0, arg1)
 
     @staticmethod
     def Iop_32to8(arg1, analysis):
-        return 'Extract(7,0,%s)' % arg1
+        return ('extract', 7, 0, arg1)
 
     @staticmethod
     def Iop_32Uto8(arg1, analysis):
-        return 'Extract(7,0,%s)' % arg1
+        return ('extract', 7, 0, arg1)
 
     @staticmethod
     def Iop_32to16(arg1, analysis):
-        return 'Extract(15,0,%s)' % arg1
+        return ('extract', 15, 0, arg1)
 
     @staticmethod
     def Iop_32Uto16(arg1, analysis):
-        return 'Extract(15,0,%s)' % arg1
+        return ('extract', 15, 0, arg1)
 
 
 class ZStatements(CommandClass):
@@ -611,7 +610,7 @@ class ZStatements(CommandClass):
         if value is None or value[0] is None:
             return False
 
-        return ('%s == %s' % (tmp, value[0]), tmp, value[1])
+        return (('==', tmp, value[0]), tmp, value[1])
 
     @staticmethod
     def store(stmt, analysis):
@@ -695,35 +694,66 @@ class Slicer(object):
 
 
 class ExpressionBuilder(object):
+    """
+    Builds z3 expressions of the terms of the analysis by calling the z3 constructors, the terms are not parsed.
+    A term is the name of a symbol, an int which gets the sort of the other operand or a tuple (operation, arguments...).
+    The names of registers and temporaries end with the size in bits, memories are named memory<n>_<address bits>_8.
+    The symbols are created once, so one builder is used for all expressions of a gadget.
+    """
+
+    OPERATIONS = {
+        '==' : lambda a, b: a == b,
+        '+' : lambda a, b: a + b,
+        '-' : lambda a, b: a - b,
+        '*' : lambda a, b: a * b,
+        '/' : lambda a, b: a / b,
+        '^' : lambda a, b: a ^ b,
+        '&' : lambda a, b: a & b,
+        '|' : lambda a, b: a | b,
+        'and' : lambda *args: z3.And(*args) if len(args) > 1 else (args[0] if args else z3.BoolVal(True)),
+        'not' : lambda a: z3.Not(a),
+        'val' : lambda value, size: z3.BitVecVal(value, size),
+        'extract' : lambda high, low, a: z3.Extract(high, low, a),
+        'zext' : lambda count, a: z3.ZeroExt(count, a),
+        'sext' : lambda count, a: z3.SignExt(count, a),
+        'concat' : lambda a, b: z3.Concat(a, b),
+        'select' : lambda memory, addr: z3.Select(memory, addr),
+        'store' : lambda memory, addr, value: z3.Store(memory, addr, value)
+        }
+
+    # the arguments of these operations which are numbers and not terms
+    PARAMETERS = {'val' : 2, 'extract' : 2, 'zext' : 1, 'sext' : 1}
 
     def __init__(self):
-        self.__z3objects = {}
-
-    def __getattr__(self, name):
-        if name in self.__z3objects:
-            return self.__z3objects[name]
-        return super(ExpressionBuilder, self).__getattribute__(name)
-
-    def _createRegs(self, objects, regsDict):
-        for regs in regsDict.values():
-            for reg in regs:
-                objects[reg] = z3.BitVec(reg, int(reg.split('_')[-1],10))
-
-    def _createMem(self, objects, mems):
-        for mem in mems:
-            sizes = mem.split('_')
-            objects[mem] = z3.Array(mem, z3.BitVecSort(int(sizes[-2],10)), z3.BitVecSort(int(sizes[-1],10)))
-
-    def build(self, regs, mems, expression, constraint=None):
-        z3objects = {}
-        self._createRegs(z3objects, regs)
-        self._createMem(z3objects, mems)
+        self.__symbols = {}
+
+    def symbol(self, name):
+        symbol = self.__symbols.get(name)
+        if symbol is None:
+            sizes = name.split('_')
+            if name.startswith('memory'):
+                symbol = z3.Array(name, z3.BitVecSort(int(sizes[-2],10)), z3.BitVecSort(int(sizes[-1],10)))
+            else:
+                symbol = z3.BitVec(name, int(sizes[-1],10))
+            self.__symbols[name] = symbol
+        return symbol
+
+    def __build(self, term):
+        if isinstance(term, str):
+            return self.symbol(term)
+        if not isinstance(term, tuple):
+            return term
+        parameters = ExpressionBuilder.PARAMETERS.get(term[0], 0)
+        args = list(term[1:1+parameters])
+        args.extend([self.__build(arg) for arg in term[1+parameters:]])
+        return ExpressionBuilder.OPERATIONS[term[0]](*args)
+
+    def build(self, expression, constraint=None):
+        """
+        returns the z3 expression of the term expression
+        if a constraint term is given, the expression which is unsatisfiable if expression implies the constraint is returned
+        """
         if constraint is None:
-            return eval(expression, globals(), z3objects)
-        f = True
-        f = z3.And(f,eval(expression, globals(), z3objects))
-        g = eval(constraint, globals(), z3objects)
-
-        return z3.And(f, z3.Not(g))
-#        return z3.Not(eval(expression, globals(), z3objects) == eval(constraint, globals(), z3objects))
-#        return z3.And(eval(expression, globals(), z3objects), z3.Not(eval(constraint, globals(), z3objects))
+            return self.__build(expression)
+
+        return z3.And(self.__build(expression), z3.Not(self.__build(constraint)))
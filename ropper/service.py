@@ -26,42 +26,66 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from __future__ import print_function
-from filebytes.pe import ImageDirectoryEntry
 from ropper.common.utils import isWindows, isHex, toHex, getFileNameFromPath
 from ropper.common.coloredstring import cstr, Color
-from ropper.common.error import RopperError
+from ropper.common.error import RopperError, CacheError
 from ropper.loaders.loader import Loader, Type
 from ropper.ropchain.ropchain import RopChain
 from ropper.arch import getArchitecture
 from ropper.rop import Ropper, Format
-from ropper.gadget import Gadget, GadgetType
+from ropper.gadget import Gadget, GadgetTable, GadgetType, GadgetOrder, sortGadgets, badBytesMask
+from ropper.cache import saveTable, loadTable, PageCache, CacheLock, CacheIndex, SemanticCache
+from itertools import compress
+from multiprocessing import Pool, cpu_count
 from binascii import unhexlify
-from codecs import encode, decode
 from ropper.semantic import Analyser, SemanticInformation
 import tempfile
+import time
 import re
 import os
-import multiprocessing
 import sys
+import multiprocessing as mp
+
+def deleteDuplicates(gadgets, callback=None, seen=None):
+    """
+    returns the first gadget of all gadgets with the same bytes
+    seen is a dict of the kept gadgets and the addresses of their duplicates. It is updated, so a stream of gadget lists can be filtered.
+    """
+    if isinstance(gadgets, GadgetTable) and seen is None:
+        gadgets = gadgets.deleteDuplicates()
+        if callback:
+            callback(None, True, 1.0)
+        return gadgets
 
-def deleteDuplicates(gadgets, callback=None):
     toReturn = []
-    inst = set()
-    count = 0
-    added = False
+    kept = seen if seen is not None else {}
     len_gadgets = len(gadgets)
+    step = max(1, len_gadgets // 100)
     for i,gadget in enumerate(gadgets):
-        inst.add(gadget._gadget)
-        if len(inst) > count:
-            count = len(inst)
+        addresses = kept.get(gadget)
+        added = addresses is None
+        if added:
+            kept[gadget] = []
             toReturn.append(gadget)
-            added = True
-        if callback:
+        else:
+            addresses.append(gadget.address)
+        if callback and ((i+1) % step == 0 or i+1 == len_gadgets):
             callback(gadget, added, float(i+1)/(len_gadgets))
-            added = False
     return toReturn
 
 
+def findDuplicates(gadgets):
+    """
+    returns a dict of the gadgets which are kept by deleteDuplicates and the addresses of the other gadgets with the same bytes
+    """
+    if isinstance(gadgets, GadgetTable):
+        return gadgets.duplicates()
+
+    duplicates = {}
+    deleteDuplicates(gadgets, seen=duplicates)
+    return duplicates
+
+
 def filterBadBytes(gadgets, badbytes, callback=None):
 
     def formatBadBytes(badbytes):
@@ -76,92 +100,72 @@ def filterBadBytes(gadgets, badbytes, callback=None):
 
     if not badbytes:
         return gadgets
-    added = False
     badbytes = formatBadBytes(badbytes)
+
+    def filterList(gadgets):
+        if not gadgets:
+            return gadgets
+        mask = badBytesMask([gadget.address for gadget in gadgets], badbytes, gadgets[0].arch.addressLength)
+        return list(compress(gadgets, mask))
+
     if isinstance(gadgets, dict):
         toReturn = {}
 
         gadget_count = 0
         for file, gadget in gadgets.items():
             gadget_count += len(gadget)
+        done = 0
         for file, gadget in gadgets.items():
-            t = []
-            for i,g in enumerate(gadget):
-                if not badbytes or not g.addressesContainsBytes(badbytes):
-                    t.append(g)
-                    added = True
-                if callback:
-                    callback(gadget, added, float(i)/(gadget_count-1))
-                    added = False
-            toReturn[file] = t
-    elif isinstance(gadgets, list):
-        toReturn = []
-        for i, gadget in enumerate(gadgets):
-            if not badbytes or not gadget.addressesContainsBytes(badbytes):
-                toReturn.append(gadget)
-                added = True
+            if isinstance(gadget, GadgetTable):
+                toReturn[file] = gadget.filterBadBytes(badbytes)
+            else:
+                toReturn[file] = filterList(gadget)
+            done += len(gadget)
             if callback:
-                callback(gadget, added, float(i)/(len(gadgets)-1))
-                added = False
+                callback(None, True, float(done) / gadget_count if gadget_count else 1.0)
+    elif isinstance(gadgets, GadgetTable):
+        toReturn = gadgets.filterBadBytes(badbytes)
+        if callback:
+            callback(None, True, 1.0)
+    elif isinstance(gadgets, list):
+        toReturn = filterList(gadgets)
+        if callback:
+            callback(None, True, 1.0)
 
     return toReturn
 
 
 def cfgFilterGadgets(binary, gadgets, callback=None):
+    """
+    returns the gadgets whose address passes the Microsoft CFG checks of binary
+    The guarded functions are read once per loader, so changing the image base or the option does not parse them again.
+    """
+    if binary.cfgTargets is None:
+        return gadgets
 
-    def intern(gadgets, callback=None,current=0, length=0):
-        result = []
-        added = False
-
-        loadConfig = binary._binary.dataDirectory[ImageDirectoryEntry.LOAD_CONFIG]
-        if not loadConfig:
-            return gadgets
-        alignedCFGFunctions = [func for func in loadConfig.cfGuardedFunctions if func % 16 == 0]
-
-        # For unaligned functions we can use all the 16-bytes in their aligned space, so we align the unaligned functions
-        unalignedCFGFunctions = [(func - func % 16) for func in loadConfig.cfGuardedFunctions if func % 16 != 0]
-        
-        for gadget in gadgets:
-            # calculate relative address of the gadget when loaded to memory
-            gadgetRVA = gadget.address - binary.imageBase
-
-            # consider Microsoft CFG implementation imprecision - chop off 4 lsbits
-            gadgetRVA16ByteAligend = gadgetRVA - (gadgetRVA % 16)
-            
-            # If a guarded function is 16-byte aligned then it's only possible to jump directly to that function.
-            # If a guarded function is not 16-byte aligned, then it's possible to jump to anywhere in the 16-bytes of the aligned function's address
-            if gadgetRVA % 16 == 0:
-                inList = gadgetRVA16ByteAligend in alignedCFGFunctions + unalignedCFGFunctions
-            else:
-                inList = gadgetRVA16ByteAligend in unalignedCFGFunctions
-
-            if inList:
-                # this is a gadget which passes CFG checks
-                result.append(gadget)
-                added = True
-
-            if callback:
-                # occasional progress reporting
-                callback(gadget, added, float(current)/gadgetLen)
-                added = False
-            current += 1
-        return result
+    def filterGadgets(gadgets):
+        if isinstance(gadgets, GadgetTable):
+            return gadgets.filterMask(binary.cfgMask(gadgets.addresses))
+        return list(compress(gadgets, binary.cfgMask([gadget.address for gadget in gadgets])))
 
-    if isinstance(gadgets,  list):
-        gadgetLen = len(gadgets)-1
-        return intern(gadgets, callback, length=gadgetLen)
-    elif isinstance(gadgets, dict):
+    if isinstance(gadgets, dict):
         result = {}
-        i = 0
-        glen = 0
+        gadget_count = 0
         for file, glist in gadgets.items():
-            glen += len(glist)-1
+            gadget_count += len(glist)
+        done = 0
         for file, glist in gadgets.items():
-            result[file] = intern(glist, callback, i, glen)
-            i += len(result[file])
-
+            result[file] = filterGadgets(glist)
+            done += len(glist)
+            if callback:
+                callback(None, True, float(done) / gadget_count if gadget_count else 1.0)
         return result
 
+    result = filterGadgets(gadgets)
+    if callback:
+        callback(None, True, 1.0)
+    return result
+
 
 class Options(object):
 
@@ -213,6 +217,14 @@ class Options(object):
         elif not gtype:
             options['type'] = 'all'
 
+        order = options.get('sort')
+        if order and not isinstance(order, str):
+            raise TypeError('sort has to be an instance of str')
+        elif order and order not in ['text', 'address', 'none']:
+            raise AttributeError('sort has to be a "text", "address" or "none"')
+        elif not order:
+            options['sort'] = 'text'
+
         detailed = options.get('detailed')
         if detailed != None and not isinstance(detailed, bool):
             raise TypeError('detailed has to be an instance of bool')
@@ -268,11 +280,42 @@ class Options(object):
         return self.__getattr__(key)
 
 
+# Gadgets of the running semantic analysis. They are set before the worker processes are forked,
+# so the workers inherit them instead of receiving them pickled.
+def parseSize(value, default):
+    """
+    returns the number of bytes of a size like 1048576, 512K, 100M or 1G
+    returns default and writes a warning if value is not a size
+    """
+    match = re.match(r'^\s*([0-9]+)\s*([kKmMgG]?)[bB]?\s*$', value or '')
+    if match is None:
+        if value:
+            sys.stderr.write('[WARNING] Invalid size: %s, %d bytes are used\n' % (value, default))
+        return default
+    return int(match.group(1)) * 1024 ** ' KMG'.index(match.group(2).upper() or ' ')
+
+
+_analysis = None
+
+
+def _analyseBatch(batch):
+    """
+    analyses the gadgets start to end - 1 of the running analysis
+    returns (start, end, information packed by SemanticCache.pack per gadget)
+    """
+    start, end = batch
+    analyser = Analyser()
+    return start, end, [SemanticCache.pack(analyser.analyse(gadget)) for gadget in _analysis[start:end]]
+
+
 class RopperService(object):
 
     ROPPER_FOLDER = os.environ.get("ROPPER_FOLDER") or os.path.join(os.path.expanduser('~'), ".ropper/")
     CACHE_FOLDER = os.environ.get("ROPPER_CACHE") or os.path.join(ROPPER_FOLDER, "cache/")
-    CACHE_FILE_COUNT = 16
+    # maximum size of the cache folder in bytes, 0 means no limit
+    CACHE_SIZE = parseSize(os.environ.get("ROPPER_CACHE_SIZE"), 1024 * 1024 * 1024)
+    # number of gadgets a worker analyses at once, the semantic cache is written after every batch
+    ANALYSIS_BATCH_SIZE = 64
 
     def __init__(self, options={}, callbacks=None):
         super(RopperService, self).__init__()
@@ -281,6 +324,13 @@ class RopperService(object):
             self.__ropper = Ropper(callback=callbacks.__gadgetSearchProgress__)
         else:
             self.__ropper = Ropper()
+        # pages which did not change since another build of a binary was searched are not searched again
+        self.__ropper.pageCache = PageCache(os.path.join(RopperService.CACHE_FOLDER, 'pages'))
+        # the least recently used cache files and pages are removed if the cache folder grows bigger than CACHE_SIZE
+        self.__cacheIndex = CacheIndex(RopperService.CACHE_FOLDER, RopperService.CACHE_SIZE)
+        # the semantic information is kept apart from the gadgets and shared by all binaries
+        self.__semanticCache = SemanticCache(os.path.join(RopperService.CACHE_FOLDER, SemanticCache.FILE_NAME))
+        self.__semanticStatistics = {}
         self.__files = []
         self.__callbacks = callbacks
         if self.__options.color:
@@ -334,138 +384,124 @@ class RopperService(object):
     def __getCacheFileName(self, file):
         return "%s_%s_%d_%s_%d" % (file.loader.checksum, str(file.arch), self.options.inst_count,str(self.options.type), sys.version_info.major)
 
-    def __saveCache(self, file):
-        cache_file = None
+    def __getCacheFile(self, file):
+        return RopperService.CACHE_FOLDER + os.path.sep + self.__getCacheFileName(file)
+
+    def __getCacheLock(self, file):
+        return CacheLock(self.__getCacheFile(file))
+
+    def __saveCache(self, file, searchTime=None):
+        """
+        searchTime is the time the gadgets of file were searched in, it is given if the cache missed
+        """
         try:
-            temp = RopperService.CACHE_FOLDER
-            if not os.path.exists(temp):
-                os.makedirs(temp)
-
-            cache_file = temp + os.path.sep + self.__getCacheFileName(file)
-            count = RopperService.CACHE_FILE_COUNT
-            if not isWindows() and len(file.allGadgets) > 1000:
-                if os.path.exists(cache_file):
-                    os.remove(cache_file)
-
-                length = len(file.allGadgets)
-
-                step = int(length / count)
-                for i in range(count-1):
-                    gadgets = file.allGadgets[i*step: (i+1)*step]
-                    with open(cache_file+'_%d' % (i+1),'wb') as f:
-                        f.write(encode(repr(gadgets).encode('ascii'),'zip'))
-
-                gadgets = file.allGadgets[(count-1)*step:]
-                with open(cache_file+'_%d' % (count),'wb') as f:
-                    f.write(encode(repr(gadgets).encode('ascii'),'zip'))
-                return
+            if not os.path.exists(RopperService.CACHE_FOLDER):
+                os.makedirs(RopperService.CACHE_FOLDER)
 
-            with open(cache_file,'wb') as f:
-                f.write(encode(repr(file.allGadgets).encode('ascii'),'zip'))
+            saveTable(self.__getCacheFile(file), file.allGadgets, self.__getGadgetOrder(), semantic=False)
+            self.__cacheIndex.add(self.__getCacheFileName(file), searchTime)
+            self.__cacheIndex.trim(keep=self.__getCacheFileName(file))
         except BaseException as e:
+            # the cache file is replaced only by a complete file, so a failed write leaves the old one
             print(e)
-            if cache_file:
-                for i in range(1, RopperService.CACHE_FILE_COUNT+1):
-                    if os.path.exists(cache_file+'_%d' % i):
-                        os.remove(cache_file+'_%d' % i)
-
-
-    def __loadCachePerProcess(self, fqueue, gqueue):
-        nan=0
-        while True:
-            cacheFileName = fqueue.get()
-            if cacheFileName is None:
-                fqueue.task_done()
-                break
-            if os.path.exists(cacheFileName):
-                with open(cacheFileName,'rb') as f:
-                    data = f.read()
-                    gqueue.put(eval(decode(data,'zip')))
-            else:
-                gqueue.put([])
-            fqueue.task_done()
-
 
-    def __loadCache(self, file):
-        mp = False
-        nan= 0
-        processes = []
-        single = False
-        cache_file = None
+    def __loadCache(self, file, name=None):
+        """
+        loads the cache file name of file, the cache file of the current options by default
+        """
         try:
-            if multiprocessing.get_start_method() != 'fork':
-                multiprocessing.set_start_method('fork')
-            temp = RopperService.CACHE_FOLDER
-            cache_file = temp + os.path.sep + self.__getCacheFileName(file)
-
+            name = name or self.__getCacheFileName(file)
+            cache_file = RopperService.CACHE_FOLDER + os.path.sep + name
             if not os.path.exists(cache_file):
-                if not os.path.exists(cache_file+'_%d' % 1):
-                    return
-                else:
-                    if isWindows():
-                        raise RopperError('Cache has to be cleared.')
-                    mp = True and multiprocessing.cpu_count()>1
-            else:
-                single = True
+                return
             if self.__callbacks and hasattr(self.__callbacks, '__message__'):
                 self.__callbacks.__message__('Load gadgets from cache')
             if self.__callbacks and hasattr(self.__callbacks, '__gadgetSearchProgress__'):
-                        self.__callbacks.__gadgetSearchProgress__(None, [], 0)
-            if not mp:
-                all_gadgets = []
-                if single:
-                    with open(cache_file,'rb') as f:
-                        data = f.read()
-                        all_gadgets.extend(eval(decode(data,'zip')))
-                        if self.__callbacks and hasattr(self.__callbacks, '__gadgetSearchProgress__'):
-                            self.__callbacks.__gadgetSearchProgress__(None, all_gadgets, 1.0)
-                else:
-                    for i in range(1,RopperService.CACHE_FILE_COUNT+1):
-                        if os.path.exists(cache_file+'_%d' % i):
-                            with open(cache_file+'_%d' % i,'rb') as f:
-                                data = f.read()
-                                all_gadgets.extend(eval(decode(data,'zip')))
-                                if self.__callbacks and hasattr(self.__callbacks, '__gadgetSearchProgress__'):
-                                    self.__callbacks.__gadgetSearchProgress__(None, all_gadgets, float(i)/RopperService.CACHE_FILE_COUNT)
-                return all_gadgets
+                self.__callbacks.__gadgetSearchProgress__(None, [], 0)
 
-            else:
-                count = min(multiprocessing.cpu_count(),RopperService.CACHE_FILE_COUNT)
-
-                gqueue = multiprocessing.Queue()
-                fqueue = multiprocessing.JoinableQueue()
-                for i in range(1,RopperService.CACHE_FILE_COUNT+1):
-                    fqueue.put(cache_file+'_%d' % i)
-                all_gadgets = []
-                for i in range(count):
-                    p=multiprocessing.Process(target=self.__loadCachePerProcess, args=(fqueue, gqueue))
-                    p.start()
-                    processes.append(p)
-
-                for i in range(count):
-                    fqueue.put(None)
-
-                for i in range(RopperService.CACHE_FILE_COUNT):
-                    gadgets = gqueue.get()
-                    all_gadgets.extend(gadgets)
-                    if self.__callbacks and hasattr(self.__callbacks, '__gadgetSearchProgress__'):
-                        self.__callbacks.__gadgetSearchProgress__(None, all_gadgets, float(i+1)/RopperService.CACHE_FILE_COUNT)
-
-                return sorted(all_gadgets, key=Gadget.simpleInstructionString)
+            start = time.time()
+            gadgets, order = loadTable(cache_file, self.__ropper.createDecoder)
+            if gadgets.fileName != file.loader.checksum:
+                raise CacheError('Cache file does not belong to %s' % file.loader.fileName)
+            self.__cacheIndex.hit(name, time.time() - start)
+
+            if self.__callbacks and hasattr(self.__callbacks, '__gadgetSearchProgress__'):
+                self.__callbacks.__gadgetSearchProgress__(None, gadgets, 1.0)
+            if order != str(self.__getGadgetOrder()):
+                gadgets = sortGadgets(gadgets, self.__getGadgetOrder())
+            return gadgets
         except KeyboardInterrupt:
-            if mp:
-                for p in processes:
-                    if p and p.is_alive():
-                        p.terminate()
+            pass
         except BaseException as e:
-            if mp:
-                for p in processes:
-                    if p and p.is_alive():
-                        p.terminate()
-            if cache_file:
-                for i in range(1,RopperService.CACHE_FILE_COUNT+1):
-                    if os.path.exists(cache_file+'_%d' % i):
-                        os.remove(cache_file+'_%d' % i)
+            # caches of older versions and damaged caches are searched again and replaced.
+            # They are not removed here, because another process could have replaced them already.
+            pass
+
+    def __getCachedSupersets(self, file):
+        """
+        returns the ((inst_count, type), cache file name) of the cache files of file which contain the gadgets of the current options,
+        the ones with the fewest gadgets first
+        """
+        prefix = "%s_%s_" % (file.loader.checksum, str(file.arch))
+        suffix = "_%d" % sys.version_info.major
+        supersets = []
+        if not os.path.exists(RopperService.CACHE_FOLDER):
+            return supersets
+        for name in os.listdir(RopperService.CACHE_FOLDER):
+            if not name.startswith(prefix) or not name.endswith(suffix):
+                continue
+            inst_count, type = name[len(prefix):-len(suffix)].split('_', 1)
+            if not inst_count.isdigit() or type not in ('rop', 'jop', 'sys', 'all'):
+                continue
+            if int(inst_count) >= self.options.inst_count and self.__getEndingOffset(file, type) is not None:
+                supersets.append(((int(inst_count), type), name))
+        supersets.sort(key=lambda superset: (superset[0][0], len(file.arch.endings[self.__getGadgetType(superset[0][1])])))
+        return supersets
+
+    def __getEndingOffset(self, file, type):
+        """
+        returns the index of the first ending of the current type in the endings of type or None if they are not part of them
+        """
+        endings = file.arch.endings[self.__getGadgetType()]
+        superset = file.arch.endings[self.__getGadgetType(type)]
+        for first in range(len(superset) - len(endings) + 1):
+            if superset[first:first + len(endings)] == endings:
+                return first
+        return None
+
+    def __narrowGadgets(self, file, gadgets, options):
+        """
+        returns the gadgets of the current inst_count and type derived from gadgets which were searched with the (inst_count, type) options
+        or None if they cannot be derived
+        """
+        if gadgets is None or options is None or not gadgets.narrowable or options[0] < self.options.inst_count:
+            return None
+        first = self.__getEndingOffset(file, options[1])
+        if first is None:
+            return None
+        gadgets = gadgets.narrow(self.options.inst_count, first, len(file.arch.endings[self.__getGadgetType()]))
+        return sortGadgets(gadgets, self.__getGadgetOrder())
+
+    def __deriveGadgets(self, file, previous=(None, None)):
+        """
+        derives the gadgets of the current options from a superset of them without searching: the previous (gadgets, options) of file
+        or a cache file. The derived gadgets are cached.
+        returns the gadgets or None if there is no superset
+        """
+        gadgets = self.__narrowGadgets(file, *previous)
+        if gadgets is None:
+            for options, name in self.__getCachedSupersets(file):
+                gadgets = self.__narrowGadgets(file, self.__loadCache(file, name), options)
+                if gadgets is not None:
+                    break
+        if gadgets is not None:
+            self.__setAllGadgets(file, gadgets)
+            self.__saveCache(file)
+        return gadgets
+
+    def __setAllGadgets(self, file, gadgets):
+        file.allGadgets = gadgets
+        file.searchOptions = (self.options.inst_count, self.options.type) if gadgets is not None else None
 
 
     def _badbytes_changed(self, value):
@@ -494,6 +530,12 @@ class RopperService(object):
             if f.loaded:
                 self.loadGadgetsFor(f.name)
 
+    def _sort_changed(self, value):
+        for f in self.__files:
+            if f.loaded:
+                f.allGadgets = sortGadgets(f.allGadgets, self.__getGadgetOrder())
+                f.gadgets = self.__prepareGadgets(f, f.allGadgets, f.type)
+
     def _inst_count_changed(self, value):
         for f in self.__files:
             if f.loaded:
@@ -512,6 +554,21 @@ class RopperService(object):
             import shutil
             shutil.rmtree(temp)
 
+    def trimCache(self, size=None):
+        """
+        removes the least recently used cache files and pages until the cache is not bigger than size bytes
+        size defaults to CACHE_SIZE, a size of 0 removes all cache files and pages
+        returns the number of removed bytes
+        """
+        return self.__cacheIndex.trim(size)
+
+    def cacheStatistics(self):
+        """
+        returns a dict with the number, the size and the bytes per entry of the cache files, the number and size of the cached pages,
+        the size of the semantic cache, the total size, the budget, the hits, misses and hit rate and the seconds saved by the hits
+        """
+        return self.__cacheIndex.stats()
+
 
     def getFileFor(self, name):
         return self._getFileFor(name)
@@ -602,54 +659,197 @@ class RopperService(object):
         return self.__filterBadBytes(to_return)
 
     def analyseGadgets(self, fileObject):
-        gadgets = fileObject.gadgets
-        analyser = Analyser()
+        """
+        sets the semantic information of the gadgets of fileObject
+        Gadgets with the same bytes in this or another binary are analysed once, see SemanticCache.
+        With multiprocessing the other gadgets are analysed in batches by a pool of worker processes.
+        The information of every finished batch is written to the semantic cache, so an interrupted analysis continues where it stopped.
+        """
+        self.__analyseGadgets(fileObject.gadgets)
+        fileObject.analysed = True
+
+    def __analyseGadgets(self, gadgets):
+        if not gadgets:
+            return
         cb = None
         lg = len(gadgets)
         if self.__callbacks and hasattr(self.__callbacks, '__analyseGadgetsProgress__'):
             cb = self.__callbacks.__analyseGadgetsProgress__
-        for i,g in enumerate(gadgets):
-            g.info = analyser.analyse(g)
-            if cb:
-                cb(g, float(i)/lg)
+
+        done = 0
+        keys = []
+        pending = {}
+        for g in gadgets:
+            key = self.__semanticCache.key(g)
+            if key in self.__semanticCache:
+                g.info = self.__semanticCache[key]
+                done += 1
+                if cb:
+                    cb(g, float(done)/lg)
+            else:
+                if key not in pending:
+                    keys.append(key)
+                    pending[key] = []
+                pending[key].append(g)
+
+        for key, info in self.__analyse(keys, [pending[key][0] for key in keys]):
+            for g in pending[key]:
+                g.info = info
+                done += 1
+                if cb:
+                    cb(g, float(done)/lg)
         if cb:
              cb(None, 1.0)
-        self.__saveCache(fileObject)
-        fileObject.analysed = True
+
+    def __analyse(self, keys, gadgets):
+        """
+        analyses the gadgets in batches of ANALYSIS_BATCH_SIZE gadgets and yields (key, information) per gadget
+        The information is added to the semantic cache, which is written after every batch.
+        """
+        global _analysis
+        analyser = Analyser()
+        batch_size = RopperService.ANALYSIS_BATCH_SIZE
+        batches = [(start, min(start + batch_size, len(gadgets))) for start in range(0, len(gadgets), batch_size)]
+
+        def add(index, info):
+            if info is not False:
+                self.__semanticCache[keys[index]] = info
+            return keys[index], info
+
+        if not analyser.working or not self.options.multiprocessing or len(batches) < 2:
+            for start, end in batches:
+                for index in range(start, end):
+                    yield add(index, analyser.analyse(gadgets[index]))
+                self.__semanticCache.flush()
+            return
+
+        if mp.get_start_method() != 'fork':
+            mp.set_start_method('fork', force=True)
+        _analysis = gadgets
+        pool = Pool(min(cpu_count(), len(batches)))
+        try:
+            for start, end, packed in pool.imap_unordered(_analyseBatch, batches):
+                for index, data in zip(range(start, end), packed):
+                    # information which cannot be sent back is analysed again in this process
+                    yield add(index, SemanticCache.unpack(data) if data is not None else analyser.analyse(gadgets[index]))
+                self.__semanticCache.flush()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _analysis = None
+
+    def __getGadgetType(self, type=None):
+        type = type or self.options.type
+        if type == 'rop':
+            return GadgetType.ROP
+        elif type == 'jop':
+            return GadgetType.JOP
+        elif type == 'sys':
+            return GadgetType.SYS
+        elif type == 'all':
+            return GadgetType.ALL
+
+    def __getGadgetOrder(self):
+        if self.options.sort == 'address':
+            return GadgetOrder.ADDRESS
+        elif self.options.sort == 'none':
+            return GadgetOrder.NONE
+        return GadgetOrder.TEXT
+
+    def iterGadgetsFor(self, name, ordered=False):
+        """
+        yields the gadgets of a file in lists as soon as they are found
+        The lists pass the same badbytes, cfg and duplicate filters as loadGadgetsFor, but a duplicate is dropped in favour of the first one found.
+        If the file is searched completely, its gadgets are loaded like by loadGadgetsFor.
+        """
+        fc = self._getFileFor(name)
+        if not fc:
+            raise RopperError('No such file opened: %s' % name)
+
+        Gadget.IMAGE_BASES[fc.loader.checksum] = fc.loader.imageBase
+        allGadgets = self.__loadCache(fc)
+        if allGadgets == None:
+            allGadgets = self.__deriveGadgets(fc, (fc.allGadgets, fc.searchOptions))
+        if allGadgets != None:
+            self.__setAllGadgets(fc, allGadgets)
+            fc.gadgets = self.__prepareGadgets(fc, fc.allGadgets, fc.type)
+            fc.analysed = fc.gadgets[0].info is not None if len(fc.gadgets) > 0 else False
+            if fc.gadgets:
+                yield list(fc.gadgets)
+            return
+
+        allGadgets = []
+        seen = {}
+        start = time.time()
+        for gadgets in self.__ropper.iterGadgets(fc.loader, instructionCount=self.options.inst_count, gtype=self.__getGadgetType(), multiprocessing=self.options.multiprocessing, ordered=ordered):
+            allGadgets.extend(gadgets)
+            if self.options.badbytes:
+                gadgets = filterBadBytes(gadgets, self.options.badbytes)
+            if self.options.cfg_only and fc.type == Type.PE:
+                gadgets = cfgFilterGadgets(fc.loader, gadgets)
+            if not self.options.all:
+                gadgets = deleteDuplicates(gadgets, seen=seen)
+            if gadgets:
+                yield gadgets
+
+        self.__setAllGadgets(fc, sortGadgets(allGadgets, self.__getGadgetOrder()))
+        self.__saveCache(fc, time.time() - start)
+        fc.gadgets = self.__prepareGadgets(fc, fc.allGadgets, fc.type)
+        fc.analysed = False
 
     def loadGadgetsFor(self, name=None):
 
-        def load_gadgets(f):
-            gtype = None
-            cache = False
-            Gadget.IMAGE_BASES[f.loader.checksum] = f.loader.imageBase
-            if self.options.type == 'rop':
-                gtype = GadgetType.ROP
-            elif self.options.type == 'jop':
-                gtype = GadgetType.JOP
-            elif self.options.type == 'sys':
-                gtype = GadgetType.SYS
-            elif self.options.type == 'all':
-                gtype = GadgetType.ALL
-            f.allGadgets = self.__loadCache(f)
-            if f.allGadgets == None:
-                cache = True
-                f.allGadgets = self.__ropper.searchGadgets(f.loader, instructionCount=self.options.inst_count, gtype=gtype,multiprocessing=self.options.multiprocessing)
-
-            if cache:
-                self.__saveCache(f)
+        def prepare_gadgets(f):
             f.gadgets = self.__prepareGadgets(f, f.allGadgets, f.type)
             f.analysed = f.gadgets[0].info is not None if len(f.gadgets) > 0 else False
             #self._analyseGadgets(f.gadgets)
 
+        gtype = self.__getGadgetType()
+        missing = []
+        for fc in self.__files:
+            if name is not None and fc.loader.fileName != name:
+                continue
+            Gadget.IMAGE_BASES[fc.loader.checksum] = fc.loader.imageBase
+            # the gadgets of other options in memory or in the cache can contain the gadgets of the current options
+            previous = (fc.allGadgets, fc.searchOptions)
+            self.__setAllGadgets(fc, self.__loadCache(fc))
+            if fc.allGadgets == None:
+                self.__deriveGadgets(fc, previous)
+            if fc.allGadgets == None:
+                missing.append(fc)
+            else:
+                prepare_gadgets(fc)
 
-        if name is None:
-            for fc in self.__files:
-                load_gadgets(fc)
-        else:
-            for fc in self.__files:
-                if fc.loader.fileName == name:
-                    load_gadgets(fc)
+        # Only one process searches the gadgets of a cache file, the others wait for its lock and load the cache then.
+        # The locks are acquired in the order of the cache files, so two processes cannot wait for each other.
+        to_search = []
+        locks = {}
+        try:
+            for fc in sorted(missing, key=self.__getCacheFile):
+                lock = locks.get(self.__getCacheFile(fc))
+                if lock is None:
+                    lock = self.__getCacheLock(fc)
+                    lock.acquire()
+                    locks[self.__getCacheFile(fc)] = lock
+                self.__setAllGadgets(fc, self.__loadCache(fc))
+                if fc.allGadgets == None:
+                    to_search.append(fc)
+                else:
+                    prepare_gadgets(fc)
+
+            # the sections of all files without a cache are searched together, every file is finished as soon as its last section is searched
+            # a file is charged with the time from the start of the search until it is finished
+            loaders = [fc.loader for fc in to_search]
+            start = time.time()
+            for loader, gadgets in self.__ropper.searchGadgetsInBinaries(loaders, instructionCount=self.options.inst_count, gtype=gtype, multiprocessing=self.options.multiprocessing, table=True, order=self.__getGadgetOrder()):
+                fc = to_search[loaders.index(loader)]
+                self.__setAllGadgets(fc, gadgets)
+                self.__saveCache(fc, time.time() - start)
+                prepare_gadgets(fc)
+        finally:
+            for lock in locks.values():
+                lock.release()
 
     def printGadgetsFor(self, name=None):
         def print_gadgets(f):
@@ -714,29 +914,36 @@ class RopperService(object):
 
     def semanticSearch(self, search, stableRegs=[], name=None):
         count = 0
+        self.__semanticStatistics = {}
         if name:
             fc = self._getFileFor(name)
             if not fc:
                 raise RopperError('No such file opened: %s' % name)
 
             s = fc.loader.arch.searcher
-            for gadget in s.semanticSearch(fc.gadgets, search, self.options.inst_count, stableRegs):
+            for gadget in s.semanticSearch(fc.gadgets, search, self.options.inst_count, stableRegs, self.__analyseGadgets, self.__semanticStatistics):
                 if self.options.count_of_findings == 0 or self.options.count_of_findings > count:
                     yield(fc.name, gadget)
                 else:
                     break
                 count += 1
-            self.__saveCache(fc)
+            self.__semanticCache.flush()
         else:
             for fc in self.__files:
                 s = fc.loader.arch.searcher
-                for gadget in s.semanticSearch(fc.gadgets, search, self.options.inst_count, stableRegs):
+                for gadget in s.semanticSearch(fc.gadgets, search, self.options.inst_count, stableRegs, self.__analyseGadgets, self.__semanticStatistics):
                     if self.options.count_of_findings == 0 or self.options.count_of_findings > count:
                         yield(fc.name, gadget)
                     else:
                         break
                     count += 1
-                self.__saveCache(fc)
+                self.__semanticCache.flush()
+
+    def semanticStatistics(self):
+        """
+        returns the statistics of the last semantic search, see Searcher.semanticSearch
+        """
+        return dict(self.__semanticStatistics)
 
     def searchdict(self, search, quality=None, name=None):
         to_return = {}
@@ -821,6 +1028,7 @@ class FileContainer(object):
         self.__all_gadgets = None
         self.__gadgets = None
         self.__loaded = False
+        self.__search_options = None
 
     @property
     def name(self):
@@ -850,6 +1058,17 @@ class FileContainer(object):
     def gadgets(self, gadgets):
         self.__gadgets = gadgets
 
+    @property
+    def searchOptions(self):
+        """
+        (inst_count, type) of the search allGadgets were found by or None
+        """
+        return self.__search_options
+
+    @searchOptions.setter
+    def searchOptions(self, options):
+        self.__search_options = options
+
     @property
     def allGadgets(self):
         return self.__all_gadgets
@@ -857,4 +1076,6 @@ class FileContainer(object):
     @allGadgets.setter
     def allGadgets(self, gadgets):
         self.__loaded = True if gadgets is not None else False
+        if gadgets is not None and not isinstance(gadgets, GadgetTable):
+            gadgets = GadgetTable.fromGadgets(self.__loader.checksum, self.__loader.arch, gadgets)
         self.__all_gadgets = gadgets
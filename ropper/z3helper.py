@@ -31,7 +31,7 @@ from ropper.common.error import RopperError
 
 class ConstraintCompiler(object):
     """
-    Compile a user given constraints to z3 expressions
+    Compile a user given constraints to the terms of ropper.semantic.ExpressionBuilder
 
     constraint := assignment | pop_reg
     assignment := reg, adjust, reg | number
@@ -48,7 +48,7 @@ class ConstraintCompiler(object):
     POP_REGEX = '((pop) +'+REG_REGEX.format('reg_dst_2')+')'
     CONSTRAINT_REGEX = '(' + ASSIGNMENT_REGEX + '|' + POP_REGEX + ')'
 
-    def __init__(self, architecture, semantic_info):
+    def __init__(self, architecture, semantic_info=None):
         self.__architecture = architecture
         self.__semantic_info = semantic_info
 
@@ -71,7 +71,13 @@ class ConstraintCompiler(object):
 
     def compile(self, constraints):
         """
-        compile a line of semantic expressions
+        compile a line of semantic expressions for the semantic information of the compiler
+        """
+        return self.template(constraints).instantiate(self.__semantic_info)
+
+    def template(self, constraints):
+        """
+        compile a line of semantic expressions to a ConstraintTemplate, which does not depend on a gadget
         """
         tokens = self._tokenize(constraints)[::-1]
         to_return = None
@@ -89,11 +95,11 @@ class ConstraintCompiler(object):
                 if to_return is None:
                     to_return = constraint
                 else:
-                    to_return = 'And(%s, %s)' % (to_return, constraint)
+                    to_return = ('and', to_return, constraint)
             else:
                 raise ConstraintError('Invalid token: %s' % token)
 
-        return to_return
+        return ConstraintTemplate(to_return, self.__architecture.info.bits)
 
     def _tokenize(self, constraints):
         """
@@ -124,8 +130,8 @@ class ConstraintCompiler(object):
 
     def _assignment(self, register, tokens):
         register = self.__architecture.getRegisterName(register)
-        reg1_last = self.__semantic_info.regs[register][-1]
-        reg1_init = self.__semantic_info.regs[register][0]
+        reg1_last = ('$reg', register, -1)
+        reg1_init = ('$reg', register, 0)
         op = tokens.pop()
         if not re.match(ConstraintCompiler.ADJUST_REGEX, op):
             raise ConstraintError('Invalid syntax: %s' % op)
@@ -140,50 +146,72 @@ class ConstraintCompiler(object):
             value = self._readMemory(register_name)
             tokens.pop()
         elif re.match(ConstraintCompiler.NUMBER_REGEX, value):
-            value = create_number_expression(int(value), int(reg1_last.split('_')[-1]))
+            value = ('$val', int(value), register)
 
         elif value in self.__architecture.info.registers:
             value = self.__architecture.getRegisterName(value)
-            value = self.__semantic_info.regs[value][0]
-            value = create_register_expression(value, int(value.split('_')[-1]))
+            value = ('$reg', value, 0)
         else:
             print(re.match(ConstraintCompiler.NUMBER_REGEX, value))
             raise ConstraintError('Invalid Assignment: %s%s%s' % (register, op, value))
-        reg1_last = create_register_expression(reg1_last, int(reg1_last.split('_')[-1]))
-        reg1_init = create_register_expression(reg1_init, int(reg1_init.split('_')[-1]))
         return self._create(reg1_last, reg1_init, value, op[0])
 
     def _create(self, left_last, left_init, right, adjust):
         if adjust != '=':
-            return '%s == %s %s %s' % (left_last, left_init, adjust, right)
+            return ('==', left_last, (adjust, left_init, right))
         else:
-            return '%s == %s' % (left_last, right)
+            return ('==', left_last, right)
 
     def _readMemory(self, register):
-        register_init = self.__semantic_info.regs[register][0]
-        if self.__semantic_info.mems:
-            memory = self.__semantic_info.mems[-1]
-        else:
-            memory = 'memory%d_%d_%d' % (0, self.__architecture.info.bits, 8)
-            self.__semantic_info.mems.append(memory)
-        size = int(register_init.split('_')[-1])
-        register_expr = create_register_expression(register_init, size)
-        mem_expr = create_read_memory_expression(memory, register_expr, size)
-        return mem_expr
+        return ('$read', -1, register, 0)
 
     def _popReg(self, pop, tokens):
         reg_name = tokens.pop()
         self.symbols.append((reg_name,None))
-        reg = self.__semantic_info.regs[reg_name][-1]
-        if self.__semantic_info.mems:
-            memory = self.__semantic_info.mems[0]
-        else:
-            memory = 'memory%d_%d_%d' % (0, self.__architecture.info.bits, 8)
-            self.__semantic_info.mems.append(memory)
-        size = int(reg.split('_')[-1])
-        register_expr = create_register_expression(reg, size)
-        mem_expr = create_read_memory_expression(memory, register_expr, size)
-        return mem_expr
+        return ('$read', 0, reg_name, -1)
+
+
+class ConstraintTemplate(object):
+    """
+    A compiled constraint whose registers and memory are placeholders, instantiate replaces them by the symbols of a gadget
+
+    ('$reg', register, index) is the symbol regs[register][index] of the semantic information
+    ('$val', number, register) is number with the size of the register
+    ('$read', memory index, register, index) reads the memory at the address in regs[register][index]
+    """
+
+    def __init__(self, term, bits):
+        self.__term = term
+        self.__bits = bits
+
+    @property
+    def term(self):
+        return self.__term
+
+    def instantiate(self, semantic_info):
+        """
+        returns the constraint term for the symbols of semantic_info
+        gadgets with the same register versions get the same term
+        """
+        return self.__instantiate(self.__term, semantic_info)
+
+    def __instantiate(self, term, semantic_info):
+        if not isinstance(term, tuple):
+            return term
+        if term[0] == '$reg':
+            return semantic_info.regs[term[1]][term[2]]
+        elif term[0] == '$val':
+            return create_number_expression(term[1], int(semantic_info.regs[term[2]][-1].split('_')[-1]))
+        elif term[0] == '$read':
+            if semantic_info.mems:
+                memory = semantic_info.mems[term[1]]
+            else:
+                memory = 'memory%d_%d_%d' % (0, self.__bits, 8)
+                semantic_info.mems.append(memory)
+            register = semantic_info.regs[term[2]][term[3]]
+            size = int(register.split('_')[-1])
+            return create_read_memory_expression(memory, register, size)
+        return (term[0],) + tuple([self.__instantiate(arg, semantic_info) for arg in term[1:]])
 
 
 class ConstraintError(RopperError):
@@ -197,19 +225,19 @@ def create_register_expression(register_accessor, size, high=False):
     register_size = int(register_accessor.split('_')[2])
     if size < register_size:
         if high:
-            return 'Extract(%d, 8, %s)' % (size+8-1, register_accessor)
+            return ('extract', size+8-1, 8, register_accessor)
         else:
-            return 'Extract(%d, 0, %s)' % (size-1, register_accessor)
+            return ('extract', size-1, 0, register_accessor)
     else:
-        return '%s' % register_accessor
+        return register_accessor
 
 def create_number_expression(number, size):
-    return "BitVecVal(%d, %d)" % (number, size)
+    return ('val', number, size)
 
 def create_read_memory_expression(memory, addr, size):
-    to_return = '%s[%s]' % (memory, addr)
+    to_return = ('select', memory, addr)
     for i in range(1, int(size/8)):
-        value = '%s[%s]' % (memory, '%s + %d' % (addr, i))
-        to_return = 'Concat(%s, %s)' % (value, to_return)
+        value = ('select', memory, ('+', addr, i))
+        to_return = ('concat', value, to_return)
 
     return to_return
@@ -59,6 +59,13 @@ class ELF_ARM64(unittest.TestCase):
         Gadget.IMAGE_BASES[self.file.checksum] = self.file.imageBase
         self.assertEqual(gadget.imageBase, 0x00400000)
 
+    def test_gadgets_multiprocessing(self):
+        ropper = Ropper()
+        gadgets = ropper.searchGadgets(self.file)
+        forked = ropper.searchGadgets(self.file, multiprocessing=True)
+
+        self.assertEqual([(g.address, g._gadget) for g in gadgets], [(g.address, g._gadget) for g in forked])
+
 
 if __name__ == '__main__':
     unittest.main()
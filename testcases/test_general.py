@@ -30,12 +30,30 @@ from ropper.loaders.loader import *
 from ropper.rop import Ropper
 from ropper.arch import *
 from ropper.common.error import *
-from ropper.service import RopperService
+from ropper.service import RopperService, parseSize
+from ropper.cache import saveTable, loadTable, PageCache, CacheLock, CacheIndex, SemanticCache
+from ropper.gadget import Gadget, GadgetTable, GadgetType
+from ropper.semantic import SemanticInformation, Analyser, ExpressionBuilder, Slicer
+from ropper.search import Searcher
+from ropper.z3helper import create_read_memory_expression, create_register_expression, ConstraintTemplate, ConstraintCompiler
 
 from filebytes.binary import BinaryError
 
+try:
+    import archinfo
+except ImportError:
+    pass
+
+try:
+    import z3
+    import pyvex
+except ImportError:
+    pass
+
 from sys import version_info
 import unittest
+import tempfile
+import shutil
 import os
 import ropper
 
@@ -104,6 +122,455 @@ class GeneralTests(unittest.TestCase):
                 self.rs.searchOpcode('ff4r')
 
 
+    def test_iter_gadgets(self):
+        gadgets = self.rs.files[0].gadgets
+        streamed = [gadget for found in self.rs.iterGadgetsFor(FILE) for gadget in found]
+
+        self.assertEqual(sorted(set([g._gadget for g in streamed])), sorted(set([g._gadget for g in gadgets])))
+        self.assertEqual(len(streamed), len(gadgets))
+
+        binary = self.rs.files[0].loader
+        found = list(Ropper().iterGadgets(binary, ordered=True))
+        addresses = [g.address for gadgets in found for g in gadgets]
+        self.assertEqual(addresses, sorted(addresses))
+        self.assertEqual(sorted(addresses), sorted([g.address for g in Ropper().searchGadgets(binary)]))
+
+    def test_gadgets_of_several_binaries(self):
+        binaries = [Loader.open('test-binaries/ls-x86'), Loader.open('test-binaries/ls-arm64')]
+        ropper = Ropper()
+        found = list(ropper.searchGadgetsInBinaries(binaries, multiprocessing=True))
+
+        self.assertEqual(sorted([binaries.index(binary) for binary, gadgets in found]), [0, 1])
+        for binary, gadgets in found:
+            single = ropper.searchGadgets(binary)
+            self.assertEqual([(g.address, g._gadget) for g in gadgets], [(g.address, g._gadget) for g in single])
+
+
+    def test_cache(self):
+        binary = self.rs.files[0].loader
+        ropper = Ropper()
+        table = ropper.searchGadgets(binary, table=True)
+        view = table.filterQuality(1)
+        view[0].info = SemanticInformation({'rax': 1}, set(['rax']), {}, [], [(('==', 'rax_1_64', ('val', 0, 64)), 'rax', (0,))], 8)
+        loose = GadgetTable.fromGadgets(binary.checksum, binary.arch, list(view)[:50])
+
+        fd, cache_file = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            for gadgets in (view, loose):
+                saveTable(cache_file, gadgets, 'TEXT')
+                loaded, order = loadTable(cache_file, ropper.createDecoder)
+                self.assertEqual(order, 'TEXT')
+                self.assertEqual(loaded.fileName, binary.checksum)
+                self.assertEqual([(g.address, g.lines, bytes(g.bytes)) for g in loaded], [(g.address, g.lines, bytes(g.bytes)) for g in gadgets])
+                self.assertEqual(loaded[0].info.regs, {'rax': 1})
+                self.assertEqual(loaded[0].info.expressions, [(('==', 'rax_1_64', ('val', 0, 64)), 'rax', (0,))])
+                self.assertEqual(len(loaded.deleteDuplicates()), len(gadgets.deleteDuplicates()))
+                self.assertFalse(loaded.narrowable)
+
+            saveTable(cache_file, table, 'TEXT')
+            loaded, order = loadTable(cache_file, ropper.createDecoder)
+            self.assertTrue(loaded.narrowable)
+            self.assertEqual([g.address for g in loaded.narrow(2, 0, len(binary.arch.endings[GadgetType.ROP]))], [g.address for g in table.narrow(2, 0, len(binary.arch.endings[GadgetType.ROP]))])
+
+            with open(cache_file, 'rb') as f:
+                data = bytearray(f.read())
+            data[len(data) // 2] ^= 0xff
+            with open(cache_file, 'wb') as f:
+                f.write(data)
+            with self.assertRaises(CacheError):
+                loadTable(cache_file, ropper.createDecoder)
+
+            with open(cache_file, 'wb') as f:
+                f.write(b'x' * 100)
+            with self.assertRaises(CacheError):
+                loadTable(cache_file, ropper.createDecoder)
+
+            self.assertEqual([name for name in os.listdir(os.path.dirname(cache_file)) if name.startswith('.' + os.path.basename(cache_file))], [])
+            with CacheLock(cache_file) as lock:
+                self.assertTrue(lock.locked)
+            self.assertFalse(lock.locked)
+        finally:
+            os.remove(cache_file)
+            if os.path.exists(cache_file + '.lock'):
+                os.remove(cache_file + '.lock')
+
+
+    def test_page_cache(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with open('test-binaries/ls-x86', 'rb') as f:
+                data = bytearray(f.read())
+            data[0x8800:0x8804] = b'\x58\xc3\x5b\xc3'
+            patched = os.path.join(folder, 'ls-x86')
+            with open(patched, 'wb') as f:
+                f.write(data)
+
+            ropper = Ropper()
+            ropper.pageCache = PageCache(os.path.join(folder, 'pages'))
+            ropper.searchGadgets(Loader.open('test-binaries/ls-x86'))
+            self.assertEqual(ropper.pageCache.hits, 0)
+            misses = ropper.pageCache.misses
+
+            gadgets = ropper.searchGadgets(Loader.open(patched))
+            self.assertEqual(ropper.pageCache.misses - misses, 1)
+            self.assertEqual([(g.address, g._gadget) for g in gadgets], [(g.address, g._gadget) for g in Ropper().searchGadgets(Loader.open(patched))])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_constraint_template(self):
+        # eax += [ebx]; ecx == 1
+        template = ConstraintTemplate(('and', ('==', ('$reg', 'eax', -1), ('+', ('$reg', 'eax', 0), ('$read', -1, 'ebx', 0))),
+            ('==', ('$reg', 'ecx', -1), ('$val', 1, 'ecx'))), 32)
+        regs = {'eax' : ['eax_0_32', 'eax_1_32'], 'ebx' : ['ebx_0_32'], 'ecx' : ['ecx_0_32', 'ecx_1_32']}
+        info = SemanticInformation(regs, set(), {}, [], [], 0)
+        term = template.instantiate(info)
+        self.assertEqual(info.mems, ['memory0_32_8'])
+        self.assertEqual(term, ('and', ('==', 'eax_1_32', ('+', 'eax_0_32', create_read_memory_expression('memory0_32_8', 'ebx_0_32', 32))),
+            ('==', 'ecx_1_32', ('val', 1, 32))))
+        # gadgets with the same register versions get the same term
+        self.assertEqual(template.instantiate(SemanticInformation(dict(regs), set(), {}, ['memory0_32_8'], [], 4)), term)
+
+    def test_semantic_cache(self):
+        folder = tempfile.mkdtemp()
+        try:
+            def gadget(address, lines, code):
+                g = Gadget('binary', '.text', x86)
+                for offset, mnemonic, args in lines:
+                    g.append(address + offset, mnemonic, args)
+                g._setBuffer(code, 0, len(code))
+                return g
+
+            cache = SemanticCache(os.path.join(folder, 'semantic'))
+            pop = [gadget(address, [(0, 'pop', 'eax'), (1, 'ret', '')], b'\x58\xc3') for address in (0x1000, 0x8000)]
+            call = [gadget(address, [(0, 'call', hex(address + 5)), (5, 'ret', '')], b'\xe8\x00\x00\x00\x00\xc3') for address in (0x1000, 0x8000)]
+            self.assertEqual(cache.key(pop[0]), cache.key(pop[1]))
+            self.assertNotEqual(cache.key(call[0]), cache.key(call[1]))
+            self.assertFalse(cache.key(pop[0]) in cache)
+
+            read = create_read_memory_expression('memory0_32_8', 'esp_0_32', 32)
+            self.assertEqual(read[:2], ('concat', ('select', 'memory0_32_8', ('+', 'esp_0_32', 3))))
+            self.assertEqual(create_register_expression('eax_1_32', 8), ('extract', 7, 0, 'eax_1_32'))
+            expressions = [(('==', 'eax_1_32', read), 'eax', ('t0_32',))]
+            cache[cache.key(pop[0])] = SemanticInformation({'eax': ['eax_1_32']}, set(), {'eax': ['eax_1_32']}, ['memory0_32_8'], expressions, 8)
+            cache[cache.key(call[0])] = None
+            cache.flush()
+
+            cache = SemanticCache(os.path.join(folder, 'semantic'))
+            info = cache[cache.key(pop[1])]
+            self.assertEqual(info.expressions, expressions)
+            self.assertEqual(info.spOffset, 8)
+            self.assertIsNone(cache[cache.key(call[0])])
+            with self.assertRaises(KeyError):
+                cache[cache.key(call[1])]
+
+            # changed checked constraints are appended, an incomplete record at the end is overwritten
+            info.checkedConstraints['eax==0'] = True
+            with open(os.path.join(folder, 'semantic'), 'ab') as f:
+                f.write(b'\x00' * 10)
+            cache.flush()
+            cache = SemanticCache(os.path.join(folder, 'semantic'))
+            self.assertEqual(cache[cache.key(pop[0])].checkedConstraints, {'eax==0': True})
+
+            # a cache whose file was removed by trim writes a new file
+            self.assertTrue(CacheIndex(folder).trim(0) > 0)
+            self.assertFalse(os.path.exists(os.path.join(folder, 'semantic')))
+            cache[cache.key(call[1])] = None
+            cache.flush()
+            cache = SemanticCache(os.path.join(folder, 'semantic'))
+            self.assertIsNone(cache[cache.key(call[1])])
+            self.assertFalse(cache.key(pop[0]) in cache)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_cache_index(self):
+        folder = tempfile.mkdtemp()
+        try:
+            self.assertEqual([parseSize(size, 7) for size in ('1024', '2k', '3M', '1G', '5 mb', None, '', '1.5G', 'big')],
+                [1024, 2048, 3 * 1024 ** 2, 1024 ** 3, 5 * 1024 ** 2, 7, 7, 7, 7])
+            index = CacheIndex(folder, 250)
+            for name in ('a', 'b', 'c'):
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(b'x' * 100)
+                index.add(name, 2.0)
+            index.hit('a', 0.5)
+
+            stats = index.stats()
+            self.assertEqual((stats['entries'], stats['size'], stats['bytes_per_entry']), (3, 300, 100))
+            self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate'], stats['time_saved']), (1, 3, 0.25, 1.5))
+
+            # b is the least recently used file, c is kept
+            self.assertEqual(index.trim(keep='c'), 100)
+            self.assertEqual(sorted([name for name in os.listdir(folder) if name in ('a', 'b', 'c')]), ['a', 'c'])
+            self.assertEqual(index.trim(10, keep='c'), 100)
+            self.assertEqual(index.stats()['entries'], 1)
+
+            # an index without a limit removes nothing by default, an explicit 0 removes everything
+            index.budget = 0
+            self.assertEqual(index.trim(), 0)
+            self.assertEqual(index.trim(0), 100)
+            self.assertEqual(index.stats()['entries'], 0)
+
+            # the lock files of removed cache files are removed unless they are held
+            for name in ('d', 'e', 'f'):
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(b'x' * 100)
+                index.add(name)
+                with CacheLock(os.path.join(folder, name)):
+                    pass
+            os.remove(os.path.join(folder, 'f'))
+            held = CacheLock(os.path.join(folder, 'e'))
+            held.acquire()
+            self.assertEqual(index.trim(0), 200)
+            self.assertEqual(sorted([name for name in os.listdir(folder) if name.endswith('.lock')]), ['e.lock', 'index.lock'])
+            # a removed lock file is created again by the next process
+            held.remove()
+            self.assertFalse(os.path.exists(os.path.join(folder, 'e.lock')))
+            lock = CacheLock(os.path.join(folder, 'e'))
+            self.assertTrue(lock.acquire(False))
+            self.assertFalse(CacheLock(os.path.join(folder, 'e')).acquire(False))
+            lock.release()
+            index.trim(0)
+            self.assertEqual(sorted([name for name in os.listdir(folder) if name.endswith('.lock')]), ['index.lock'])
+
+            # the semantic cache counts as one file
+            with open(os.path.join(folder, SemanticCache.FILE_NAME), 'wb') as f:
+                f.write(b'x' * 50)
+            stats = index.stats()
+            self.assertEqual((stats['semantic_size'], stats['total_size']), (50, 50))
+            self.assertEqual(index.trim(10), 50)
+            self.assertEqual(index.stats()['total_size'], 0)
+        finally:
+            shutil.rmtree(folder)
+
+
+def _gadget(arch, code, address=0x1000):
+    gadget = Gadget('binary', '.text', arch)
+    gadget.append(address, 'gadget')
+    gadget._setBuffer(code, 0, len(code))
+    return gadget
+
+
+class SemanticTests(unittest.TestCase):
+
+    @unittest.skipUnless('archinfo' in globals(), 'archinfo is not installed')
+    def test_prefilter(self):
+        may = Searcher().mayFulfil
+        pop_rdi = _gadget(x86_64, b'\x5f\xc3')
+        self.assertTrue(may(pop_rdi, ['rdi==0']))
+        self.assertTrue(may(pop_rdi, ['edi==0']))
+        self.assertFalse(may(pop_rdi, ['rax==0']))
+        self.assertFalse(may(pop_rdi, ['rdi==rsi']))
+
+        mov = _gadget(x86_64, b'\x89\xf7\xc3') # mov edi, esi; ret
+        self.assertTrue(may(mov, ['rdi==rsi']))
+        self.assertFalse(may(mov, ['rdi==rdx']))
+        self.assertFalse(may(mov, ['rsi==0']))
+
+        xchg = _gadget(x86_64, b'\x48\x97\xc3') # xchg rdi, rax; ret
+        self.assertTrue(may(xchg, ['rax==rdi']))
+        self.assertTrue(may(xchg, ['rdi==rax']))
+        leave = _gadget(x86_64, b'\xc9\xc3')
+        self.assertTrue(may(leave, ['rsp==rbp']))
+        self.assertTrue(may(leave, ['rbp==0']))
+        # xor eax, eax writes rflags too, which must not keep gadgets for other registers
+        xor = _gadget(x86_64, b'\x31\xc0\xc3')
+        self.assertTrue(may(xor, ['rax==0']))
+        self.assertFalse(may(xor, ['rbx==0']))
+
+        pop_thumb = _gadget(ARMTHUMB, b'\x10\xbd') # pop {r4, pc}
+        self.assertTrue(may(pop_thumb, ['r4==0']))
+        self.assertFalse(may(pop_thumb, ['r5==0']))
+        # capstone calls r9 sb and w0 is a part of x0
+        self.assertTrue(may(_gadget(ARM, b'\x00\x82\xbd\xe8'), ['r9==0'])) # pop {sb, pc}
+        self.assertTrue(may(_gadget(ARM64, b'\xe0\x03\x01\x2a\xc0\x03\x5f\xd6'), ['x0==x1'])) # mov w0, w1; ret
+
+    def test_analyse_batches(self):
+        import ropper.service as service
+
+        class StubAnalyser(object):
+            # fails for gadgets which end with ret imm16, raises after limit analyses if limit is set
+            # with unsendable the information of a single ret cannot be marshalled
+            calls = 0
+            limit = None
+            unsendable = False
+            working = True
+
+            def analyse(self, gadget):
+                if StubAnalyser.limit is not None and StubAnalyser.calls >= StubAnalyser.limit:
+                    raise RuntimeError('interrupted')
+                StubAnalyser.calls += 1
+                code = bytes(gadget.bytes)
+                if code[-3:-2] == b'\xc2':
+                    return None
+                return SemanticInformation({}, [], {}, [], [], len(code), irsb=object() if StubAnalyser.unsendable and len(code) == 1 else None)
+
+        class Callbacks(object):
+            def __init__(self):
+                self.progress = []
+
+            def __analyseGadgetsProgress__(self, gadget, progress):
+                self.progress.append((gadget, progress))
+
+        folder = tempfile.mkdtemp()
+        cache_folder = RopperService.CACHE_FOLDER
+        batch_size = RopperService.ANALYSIS_BATCH_SIZE
+        analyser = service.Analyser
+        RopperService.CACHE_FOLDER = folder
+        RopperService.ANALYSIS_BATCH_SIZE = 100
+        service.Analyser = StubAnalyser
+        try:
+            def analyse(multiprocessing, limit=None):
+                callbacks = Callbacks()
+                rs = RopperService({'multiprocessing' : multiprocessing}, callbacks)
+                rs.addFile('test-binaries/ls-x86')
+                rs.loadGadgetsFor()
+                fc = rs.getFileFor('test-binaries/ls-x86')
+                StubAnalyser.calls = 0
+                StubAnalyser.limit = limit
+                rs.analyseGadgets(fc)
+                return fc.gadgets, callbacks.progress
+
+            def check(gadgets, progress):
+                self.assertEqual(len([g for g, p in progress if g is not None]), len(gadgets))
+                self.assertEqual(progress[-1], (None, 1.0))
+                self.assertEqual([p for g, p in progress], sorted([p for g, p in progress]))
+                for g in gadgets:
+                    self.assertTrue(g.analysed)
+                    if bytes(g.bytes)[-3:-2] == b'\xc2':
+                        self.assertIsNone(g.info)
+                    else:
+                        self.assertEqual(g.info.spOffset, len(g.bytes))
+
+            # an interrupted analysis keeps the finished batches
+            with self.assertRaises(RuntimeError):
+                analyse(False, 2 * RopperService.ANALYSIS_BATCH_SIZE + 10)
+            gadgets, progress = analyse(False)
+            check(gadgets, progress)
+            cache = SemanticCache(os.path.join(folder, 'semantic'))
+            unique = len(set([cache.key(g) for g in gadgets]))
+            self.assertTrue(unique > 3 * RopperService.ANALYSIS_BATCH_SIZE)
+            self.assertTrue(any([g.info is None for g in gadgets]))
+            self.assertEqual(StubAnalyser.calls, unique - 2 * RopperService.ANALYSIS_BATCH_SIZE)
+
+            # the second analysis uses the cache only
+            gadgets, progress = analyse(False)
+            check(gadgets, progress)
+            self.assertEqual(StubAnalyser.calls, 0)
+
+            # the worker processes of the pool analyse the batches, information which cannot be sent back is analysed again
+            os.remove(os.path.join(folder, 'semantic'))
+            StubAnalyser.unsendable = True
+            gadgets, progress = analyse(True)
+            check(gadgets, progress)
+            self.assertEqual(StubAnalyser.calls, len(set([cache.key(g) for g in gadgets if len(g.bytes) == 1])))
+            self.assertTrue(StubAnalyser.calls > 0)
+            StubAnalyser.unsendable = False
+            gadgets, progress = analyse(True)
+            check(gadgets, progress)
+        finally:
+            service.Analyser = analyser
+            RopperService.CACHE_FOLDER = cache_folder
+            RopperService.ANALYSIS_BATCH_SIZE = batch_size
+            shutil.rmtree(folder)
+
+    @unittest.skipUnless('z3' in globals(), 'z3 is not installed')
+    def test_expression_builder(self):
+        builder = ExpressionBuilder()
+        self.assertEqual(builder.symbol('rax_1_64').size(), 64)
+        self.assertTrue(builder.symbol('rax_1_64') is builder.symbol('rax_1_64'))
+        memory = builder.symbol('memory0_32_8')
+        self.assertTrue(z3.is_array(memory))
+        self.assertEqual((memory.domain().size(), memory.range().size()), (32, 8))
+
+        read = builder.build(create_read_memory_expression('memory0_32_8', 'esp_0_32', 32))
+        self.assertEqual(read.size(), 32)
+        stored = ('store', ('store', 'memory0_32_8', 'esp_0_32', ('val', 0x11, 8)), ('+', 'esp_0_32', 1), ('val', 0x22, 8))
+        read = builder.build(create_read_memory_expression(stored, 'esp_0_32', 16))
+        self.assertEqual(read.size(), 16)
+        self.assertEqual(z3.simplify(read).as_long(), 0x2211)
+
+        extract = builder.build(('zext', 24, ('extract', 15, 8, ('val', 0x1234, 32))))
+        self.assertEqual(extract.size(), 32)
+        self.assertEqual(z3.simplify(extract).as_long(), 0x12)
+        self.assertEqual(z3.simplify(builder.build(('sext', 24, ('val', 0x80, 8)))).as_long(), 0xffffff80)
+        self.assertEqual(builder.build(create_register_expression('eax_0_32', 8, True)).size(), 8)
+
+        self.assertTrue(z3.is_true(z3.simplify(builder.build(('and',)))))
+        single = builder.build(('and', ('==', 'eax_0_32', 1)))
+        self.assertTrue(z3.is_eq(single))
+        self.assertTrue(z3.is_and(builder.build(('and', ('==', 'eax_0_32', 1), ('==', 'ebx_0_32', 2)))))
+
+        # the expression implies the constraint, so the built formula is unsatisfiable
+        solver = z3.Solver()
+        solver.add(builder.build(('==', 'eax_1_32', ('+', 'eax_0_32', 1)), ('==', 'eax_1_32', ('+', 'eax_0_32', ('val', 1, 32)))))
+        self.assertEqual(solver.check(), z3.unsat)
+        solver = z3.Solver()
+        solver.add(builder.build(('==', 'eax_1_32', ('+', 'eax_0_32', 1)), ('==', 'eax_1_32', ('val', 1, 32))))
+        self.assertEqual(solver.check(), z3.sat)
+
+    @unittest.skipUnless('z3' in globals() and 'pyvex' in globals() and 'archinfo' in globals(), 'z3, pyvex or archinfo is not installed')
+    def test_shared_solvers(self):
+        gadgets = [g for g in Ropper().searchGadgets(Loader.open(FILE)) if len(g) <= 3]
+        analyser = Analyser()
+
+        def analyse(to_analyse):
+            for gadget in to_analyse:
+                gadget.info = analyser.analyse(gadget)
+
+        for constraints in (['rdi==rsi'], ['rax==0']):
+            key = ' '.join(list(set(constraints)))
+            statistics = {}
+            found = list(x86_64.searcher.semanticSearch(gadgets, constraints, 3, [], analyse, statistics))
+            if constraints == ['rax==0']:
+                self.assertTrue(found)
+            self.assertEqual(statistics['considered'], len(gadgets))
+            self.assertEqual(statistics['considered'], statistics['pruned'] + statistics['cached'] + statistics['solved'])
+            self.assertEqual(statistics['solved'], statistics['sat'] + statistics['unsat'])
+            self.assertEqual(statistics['unsat'], len(found))
+            self.assertEqual(statistics['cached'], 0)
+
+            # every answer of the shared solvers is the answer of a fresh solver
+            solved = [g for g in gadgets if g.info and key in g.info.checkedConstraints]
+            self.assertEqual(len(solved), statistics['solved'])
+            registers = [register for register, source in ConstraintCompiler(None).getSymbols(constraints)]
+            for gadget in solved:
+                constraint = ConstraintCompiler(gadget.arch, gadget.info).compile(';'.join(constraints))
+                expressions = Slicer().slice(gadget.info.expressions, registers).expressions
+                solver = z3.Solver()
+                solver.add(ExpressionBuilder().build(('and',) + tuple(expressions), constraint))
+                self.assertEqual(solver.check() == z3.unsat, gadget.info.checkedConstraints[key])
+            self.assertEqual(set([id(g) for g in found]), set([id(g) for g in solved if g.info.checkedConstraints[key]]))
+
+            # the second search answers from checkedConstraints
+            again = {}
+            self.assertEqual(list(x86_64.searcher.semanticSearch(gadgets, constraints, 3, [], analyse, again)), found)
+            self.assertEqual((again['cached'], again['solved']), (statistics['solved'], 0))
+
+        folder = tempfile.mkdtemp()
+        cache_folder = RopperService.CACHE_FOLDER
+        RopperService.CACHE_FOLDER = folder
+        try:
+            rs = RopperService({'inst_count' : 3})
+            rs.addFile(FILE)
+            rs.loadGadgetsFor()
+            self.assertTrue(list(rs.semanticSearch(['rax==0'])))
+            statistics = rs.semanticStatistics()
+            self.assertEqual(statistics['solved'], statistics['sat'] + statistics['unsat'])
+            self.assertTrue(statistics['considered'] >= statistics['pruned'] + statistics['cached'] + statistics['solved'])
+        finally:
+            RopperService.CACHE_FOLDER = cache_folder
+            shutil.rmtree(folder)
+
+    def test_prefilter_unsupported(self):
+        # capstone cannot tell the register accesses of these architectures, so all gadgets are kept
+        for name, register in (('test-binaries/ls-mipsel', 'a0'), ('test-binaries/ls-ppc', 'r3')):
+            gadgets = Ropper().searchGadgets(Loader.open(name))
+            may = Searcher().mayFulfil
+            self.assertTrue(len(gadgets) > 0)
+            self.assertTrue(all([may(gadget, [register + '==0']) for gadget in gadgets]))
+
+
 class RegressionTests(unittest.TestCase):
     def test_segfault_pe_001(self):
         with self.assertRaises(BinaryError):
@@ -28,7 +28,7 @@
 from ropper.loaders.loader import *
 from ropper.rop import Ropper
 from ropper.arch import *
-from ropper.gadget import Gadget
+from ropper.gadget import Gadget, GadgetTable, GadgetType, GadgetOrder, sortGadgets, badBytesMask, SuffixIndex
 
 
 import unittest
@@ -42,6 +42,22 @@ class ELF_x86(unittest.TestCase):
         self.assertEqual(self.file.arch, x86)
         self.assertEqual(self.file.type, Type.ELF)
 
+    def test_ending_scanner(self):
+        scanner = x86.endingScanner(GadgetType.ALL)
+        code = b'\x58\xc3\x90\xc2\x04\x00\xff\xe0\xc3'
+        found = [(index, scanner.endings[ending_index][0]) for index, ending_index, bound in scanner.scan(code)]
+        self.assertEqual(found, [(1, b'\xc3'), (3, b'\xc2[\x00-\xff]{2}'), (6, b'\xff[\xe0\xe1\xe2\xe3\xe4\xe6\xe7]'), (8, b'\xc3')])
+
+        bounds = [bound for index, ending_index, bound in scanner.scan(code)]
+        self.assertEqual(bounds, [0, 0, 0, 2])
+
+        match, prefixes, size = scanner.matcher(1)
+        self.assertEqual(prefixes, frozenset([b'\xc2']))
+        self.assertEqual(size, 3)
+        self.assertTrue(match(code, 3, 6))
+        self.assertEqual(prefix_bytes(b'[\x10-\x12]\xff'), frozenset([b'\x10', b'\x11', b'\x12']))
+        self.assertEqual(prefix_bytes(b'\x41?\xc3'), None)
+
 
     def test_gadgets(self):
         ropper = Ropper()
@@ -49,6 +65,8 @@ class ELF_x86(unittest.TestCase):
 
         gadget = gadgets[0]
         self.assertGreater(len(gadgets), 1700)
+        hits, misses = ropper.decodeStatistics
+        self.assertGreater(hits, misses)
         self.assertEqual(gadget.lines[0][0] + self.file.imageBase, gadget.address)
         self.assertEqual(gadget.imageBase, 0x8048000)
         self.file.imageBase = 0x0
@@ -61,6 +79,105 @@ class ELF_x86(unittest.TestCase):
         self.assertEqual(gadget.imageBase, 0x8048000)
 
 
+    def test_gadget_lines(self):
+        gadget = Gadget(self.file.checksum, '.text', x86)
+        gadget.append(0x10, 'pop', 'eax')
+        gadget.append(0x11, 'ret')
+        gadget._setBuffer(b'\x90\x58\xc3', 1, 2)
+
+        self.assertEqual(gadget.lines, [(0x10, 'pop eax', 'pop', 'eax'), (0x11, 'ret', 'ret', '')])
+        self.assertEqual(gadget._gadget, 'pop eax; ret; ')
+        self.assertEqual(gadget.bytes, bytearray(b'\x58\xc3'))
+        self.assertEqual(len(gadget), 2)
+        self.assertFalse(hasattr(gadget, '__dict__'))
+
+        copy = eval(repr(gadget))
+        self.assertEqual(copy.lines, gadget.lines)
+        self.assertEqual(copy.bytes, gadget.bytes)
+
+    def test_gadget_table(self):
+        ropper = Ropper()
+        gadgets = ropper.searchGadgets(self.file)
+        table = ropper.searchGadgets(self.file, table=True)
+
+        self.assertTrue(isinstance(table, GadgetTable))
+        self.assertEqual(len(table), len(gadgets))
+        self.assertEqual(sorted([(g.address, g._gadget) for g in table]), sorted([(g.address, g._gadget) for g in gadgets]))
+        self.assertTrue(table[0] is table[0])
+
+        filtered = table.filterBadBytes(b'\x0a\x0d')
+        self.assertEqual(sorted(filtered.addresses), sorted([g.address for g in gadgets if not g.addressesContainsBytes(b'\x0a\x0d')]))
+
+        unique = table.deleteDuplicates()
+        self.assertEqual(len(unique), len(set([bytes(g.bytes) for g in gadgets])))
+        self.assertEqual(len(unique), len(set(gadgets)))
+        duplicates = table.duplicates()
+        self.assertEqual(len(duplicates) + sum([len(addresses) for addresses in duplicates.values()]), len(table))
+        gadget = [g for g in duplicates if duplicates[g]][0]
+        self.assertTrue(all([gadget == g for g in table if g.address in duplicates[gadget]]))
+
+        short = table.filterQuality(1)
+        self.assertEqual(len(short), len([g for g in gadgets if len(g) <= 2]))
+
+        texts = [g._gadget for g in table.sort()]
+        self.assertEqual(texts, sorted(texts))
+
+        lazy = ropper.searchGadgets(self.file, lazy=True)
+        self.assertTrue(lazy.lazy)
+        self.assertEqual(sorted(lazy.filterBadBytes(b'\x0a\x0d').addresses), sorted(filtered.addresses))
+        self.assertEqual(sorted([bytes(g.bytes) for g in lazy.deleteDuplicates()]), sorted([bytes(g.bytes) for g in unique]))
+
+    def test_badbytes_mask(self):
+        addresses = [0x08048000, 0x0804800a, 0x0a00000008048000, 0x0d7f00001234]
+        self.assertEqual(list(badBytesMask(addresses, b'\x0a\x0d', 8)), [True, False, False, False])
+        self.assertEqual(list(badBytesMask(addresses, b'\x0a\x0d', 4)), [True, False, True, True])
+        self.assertEqual(list(badBytesMask(addresses, b'\x00', 4)), [False, True, False, False])
+        self.assertEqual(list(badBytesMask(addresses, b'', 4)), [True] * 4)
+
+        ropper = Ropper()
+        gadgets = ropper.searchGadgets(self.file)
+        mask = badBytesMask([g.address for g in gadgets], b'\x0a\x0d\x04', x86.addressLength)
+        self.assertEqual([bool(m) for m in mask], [not g.addressesContainsBytes(b'\x0a\x0d\x04') for g in gadgets])
+
+    def test_suffix_index(self):
+        ropper = Ropper()
+        gadgets = list(ropper.searchGadgets(self.file))[:300]
+        found = gadgets[::7]
+        index = SuffixIndex(found)
+        self.assertEqual(len(index), len(set([bytes(g.bytes) for g in found])))
+        for gadget in gadgets:
+            data = bytes(gadget.bytes)
+            self.assertEqual(index.endsWithKnown(gadget), any([data.endswith(bytes(fg.bytes)) for fg in found]))
+            self.assertEqual(index.isSuffixOfKnown(gadget), any([bytes(fg.bytes).endswith(data) for fg in found]))
+            self.assertEqual(gadget in index, any([bytes(fg.bytes) == data for fg in found]))
+        self.assertFalse(SuffixIndex().endsWithKnown(b'\xc3'))
+        self.assertTrue(SuffixIndex([b'\xc3']).isSuffixOfKnown(b''))
+
+    def test_narrow(self):
+        ropper = Ropper()
+        table = ropper.searchGadgets(self.file, 6, GadgetType.ALL, table=True, order=GadgetOrder.NONE)
+        self.assertTrue(table.narrowable)
+        self.assertFalse(table.filterQuality(1).narrowable)
+
+        for count, gtype, first in ((6, GadgetType.ALL, 0), (4, GadgetType.ROP, 0), (3, GadgetType.JOP, len(x86.endings[GadgetType.ROP]))):
+            narrowed = table.narrow(count, first, len(x86.endings[gtype]))
+            found = ropper.searchGadgets(self.file, count, gtype, table=True, order=GadgetOrder.NONE)
+            self.assertEqual([(g.address, g._gadget) for g in narrowed], [(g.address, g._gadget) for g in found])
+            self.assertTrue(narrowed.narrowable)
+
+    def test_gadget_order(self):
+        ropper = Ropper()
+        gadgets = ropper.searchGadgets(self.file)
+        self.assertEqual([g.sortKey() for g in gadgets], sorted([g._gadget for g in gadgets]))
+
+        by_address = ropper.searchGadgets(self.file, order=GadgetOrder.ADDRESS)
+        self.assertEqual([g.address for g in by_address], sorted([g.address for g in gadgets]))
+        table = ropper.searchGadgets(self.file, table=True, order=GadgetOrder.ADDRESS)
+        self.assertEqual(list(table.addresses), [g.address for g in by_address])
+
+        unsorted = ropper.searchGadgets(self.file, multiprocessing=True, order=GadgetOrder.NONE)
+        self.assertEqual([(g.address, g._gadget) for g in sortGadgets(unsorted, GadgetOrder.ADDRESS)], [(g.address, g._gadget) for g in by_address])
+
     def test_jmpreg(self):
         ropper = Ropper()
         regs=['esp']
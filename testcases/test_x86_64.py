@@ -31,6 +31,7 @@ from ropper.rop import Ropper
 from ropper.arch import *
 from ropper.common.error import *
 from ropper.gadget import Gadget
+from ropper.service import cfgFilterGadgets
 
 
 import unittest
@@ -138,6 +139,27 @@ class PE_x86_84(unittest.TestCase):
 
 
 
+    def test_cfg(self):
+        binary = Loader.open('test-binaries/win10-ntdll.dll')
+        table = Ropper().searchGadgets(binary, table=True)
+        gadgets = list(table)
+        targets, unaligned = binary.cfgTargets
+        self.assertTrue(binary.cfgTargets is binary.cfgTargets)
+
+        filtered = cfgFilterGadgets(binary, gadgets)
+        self.assertEqual(len(filtered), 522)
+        self.assertTrue(all([(g.address - binary.imageBase) & ~0xf in targets for g in filtered]))
+        self.assertEqual(sorted(cfgFilterGadgets(binary, table).addresses), sorted([g.address for g in filtered]))
+
+        binary.imageBase = 0x10000000
+        Gadget.IMAGE_BASES[binary.checksum] = binary.imageBase
+        self.assertEqual(len(cfgFilterGadgets(binary, table)), 522)
+        binary.imageBase = None
+        Gadget.IMAGE_BASES[binary.checksum] = binary.imageBase
+
+        self.assertEqual(cfgFilterGadgets(self.file, gadgets), gadgets)
+
+
 class MACHO_x86_84(unittest.TestCase):
 
     def setUp(self):